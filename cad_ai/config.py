@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 APP_TITLE = "KOMPAS-3D AI Demo (LLM -> JSON)"
@@ -6,3 +7,95 @@ APP_MINSIZE = (720, 640)
 
 LLM_MODEL_PATH = str(Path("models") / "qwen2.5-1.5b-instruct-q4_k_m.gguf")
 LLM_ENABLED = True
+
+# per-user cache (prefix KV snapshots etc.)
+LLM_CACHE_DIR = str(
+    Path(os.environ.get("LOCALAPPDATA") or Path.home() / ".cache") / "cad_ai"
+)
+LLM_PREFIX_CACHE = True
+
+# constrain sampling to the JSON DSL grammar (cad_ai/llm/grammar.py)
+LLM_GRAMMAR = True
+
+# stream tokens through an incremental parser: steps show up as they arrive,
+# generation stops when the root object closes
+LLM_STREAM = True
+
+# load the model + prompt prefix on a background thread at startup;
+# mlock keeps the weights from being paged out (needs enough free RAM)
+LLM_WARMUP = True
+LLM_MLOCK = False
+
+# SQLite cache of validated results in LLM_CACHE_DIR (LRU, max rows)
+LLM_RESULT_CACHE = True
+LLM_RESULT_CACHE_MAX = 2000
+# answer requests that differ from a past one only in numbers by substitution
+LLM_SKELETON_CACHE = True
+
+# route fully recognized requests (куб, пластина, уголок, ступенчатый блок)
+# straight to TEMPLATES without the LLM (cad_ai/templates/text_rules.py);
+# opt-in: a misread request would be built without the model ever seeing it
+LLM_FAST_PATH = False
+
+# few-shot examples retrieved per request from cad_ai/llm/data/examples.jsonl
+# (0 = the fixed built-in examples); budget is in prompt tokens
+LLM_RETRIEVAL_K = 3
+LLM_RETRIEVAL_BUDGET = 700
+
+# "json" or "compact": the model writes a terse line script (cad_ai/llm/compact.py)
+# that is expanded locally to the same JSON, far fewer decode tokens
+LLM_OUTPUT_FORMAT = "json"
+
+# context size; None = smallest bucket that fits prompt + request + output
+LLM_N_CTX = None
+LLM_MAX_TOKENS = 900
+
+# speculative decoding: None (off), "prompt" (n-gram lookup in the prompt) or
+# a draft GGUF of the same family, e.g. str(Path("models") /
+# "qwen2.5-0.5b-instruct-q4_k_m.gguf"); keeps n_ctx x vocab logits in RAM
+LLM_SPECULATIVE = None
+
+# self-repair: a rejected answer stays in context, the validation error is sent
+# back and the model retries (max attempts, total seconds per request)
+LLM_REPAIR_ATTEMPTS = 2
+LLM_REPAIR_SECONDS = 20.0
+
+# generation backend (cad_ai/llm/backends.py): None = llama-cpp in process on
+# LLM_MODEL_PATH, "http://127.0.0.1:8080" = local OpenAI-compatible server,
+# "stub" = deterministic answers without a model
+LLM_BACKEND = None
+
+# one JSON line of timings per LLM request (load, prefill, decode, parse,
+# validate ms, tokens/s); None = keep them in memory only
+LLM_METRICS_PATH = str(Path(LLM_CACHE_DIR) / "llm_metrics.jsonl")
+
+# CPU threads; None = the autotune profile for this machine + model
+# (python -m cad_ai.llm.autotune), else the number of physical cores.
+# LLM_AUTOTUNE runs the autotune on warm-up when there is no profile yet
+# (a minute or two, once)
+LLM_N_THREADS = None
+LLM_N_GPU_LAYERS = 0
+LLM_AUTOTUNE = False
+
+# plan-then-detail generation (cad_ai/llm/plan.py): a short planning call
+# lists the features, each is generated by its own small call and the steps
+# are merged. False = off, True = always, "auto" = requests naming several
+# features (отверстия, карман, бобышка, плоскость...). The feature calls run
+# concurrently on LLM_PLAN_WORKERS worker processes (None = one per 8 cores),
+# each with its own Llama on its own cores; only with the in-process
+# llama-cpp backend and at least two workers. Without that pool "auto" sends
+# one ordinary request: sequential feature calls would only be slower
+LLM_PLAN = False
+LLM_PLAN_WORKERS = None
+
+# opt-in: start generating in the background once the request text has not
+# changed for LLM_PREGENERATE_DELAY_MS; a click then takes the finished
+# result or waits for the run in flight (stale runs are cancelled)
+LLM_PREGENERATE = False
+LLM_PREGENERATE_DELAY_MS = 700
+
+# prompt variant (cad_ai/llm/prompt.py): None = the built-in prompt, else a
+# name registered in code or a file LLM_PROMPTS_DIR/<name>.json overriding
+# some of its fields; switch it to A/B two prompts (timing rows name it)
+LLM_PROMPT_VARIANT = None
+LLM_PROMPTS_DIR = "prompts"
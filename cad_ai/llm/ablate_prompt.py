@@ -0,0 +1,282 @@
+# cad_ai/llm/ablate_prompt.py
+"""
+Prompt ablation: which rule lines and few-shot examples are worth their tokens.
+
+    python -m cad_ai.llm.ablate_prompt [--backend stub|models/x.gguf|http://...]
+        [--format json] [--base 1] [--tol 0.0] [--out table.md]
+        [--export short-v2]
+
+The units of a prompt are its rule items (lines starting with "- " or
+defining something with " — "), the shortened form of items with a
+trailing "// comment", and each few-shot example. Every unit is first
+dropped on its own; the units whose removal keeps validity and structural
+match within --tol of the full prompt are then removed together greedily,
+biggest token saving first, each step re-checked on the corpus.
+
+Every variant runs the golden set (eval_models.py) with caches, rules and
+retrieval off, one backend shared by all. The table has prompt tokens
+(fixed chat prefix + tail), validity, structural match and latency
+p50/p95; "*" marks the Pareto front (no other variant is at least as good
+in tokens, validity and p50 and better in one). The winner is the
+smallest variant within --tol of the full prompt; --export saves it as a
+named prompt version in --prompts-dir (select it with LLM_PROMPT_VARIANT).
+
+With the stub backend answers do not depend on the prompt: only the token
+column means something, which is enough to check the tool itself.
+"""
+
+import argparse
+import csv
+import re
+import time
+from pathlib import Path
+
+from cad_ai.config import LLM_GRAMMAR, LLM_MODEL_PATH, LLM_PROMPTS_DIR
+
+from .backends import make_backend
+from .engine import LocalLLMEngine
+from .errors import LLMJSONError
+from .eval_models import GOLDEN_PATH, compare, load_golden
+from .metrics import percentile
+from .prompt import (
+    OUTPUT_FORMATS,
+    PromptBuilder,
+    get_prompt,
+    register_prompt,
+    save_prompt,
+)
+
+COLUMNS = [
+    ("name", "{}"),
+    ("changes", "{}"),
+    ("prompt_tokens", "{}"),
+    ("valid", "{:.0%}"),
+    ("structure", "{:.0%}"),
+    ("p50_s", "{:.2f}"),
+    ("p95_s", "{:.2f}"),
+    ("pareto", "{}"),
+]
+
+_ITEM = re.compile(r"^- |\s—\s")
+
+
+def prompt_units(base: PromptBuilder, fmt: str = "json") -> dict:
+    """{unit: description}; a unit is ("drop"|"short", line) or ("example", i)."""
+    units = {}
+    for i, line in enumerate(base.rules[fmt].split("\n")):
+        if not _ITEM.search(line):
+            continue
+        units[("drop", i)] = line.strip()
+        if _shorter(line) is not None:
+            units[("short", i)] = _shorter(line)
+    for i, ex in enumerate(base.examples):
+        units[("example", i)] = f"example {ex.get('name', i + 1)}"
+    return units
+
+
+def _shorter(line: str) -> str | None:
+    # a trailing comment is the part of a rule line that can go
+    head = line.split("//", 1)[0].rstrip()
+    return head if head != line.rstrip() else None
+
+
+def make_variant(base: PromptBuilder, fmt: str, name: str, units) -> PromptBuilder:
+    """base without the given units (rules of the other formats unchanged)."""
+    lines = []
+    for i, line in enumerate(base.rules[fmt].split("\n")):
+        if ("drop", i) in units:
+            continue
+        if ("short", i) in units:
+            line = _shorter(line)
+        lines.append(line)
+    examples = [ex for i, ex in enumerate(base.examples) if ("example", i) not in units]
+    return PromptBuilder(
+        name,
+        rules={**base.rules, fmt: "\n".join(lines)},
+        examples=examples,
+        system=base.system,
+        request_header=base.request_header,
+    )
+
+
+_MARKS = {"drop": "-line", "short": "~line", "example": "-ex"}
+
+
+def _describe(units) -> str:
+    return " ".join(f"{_MARKS[kind]}{i}" for kind, i in sorted(units)) or "full"
+
+
+def evaluate(builder: PromptBuilder, backend, spec: str, items, fmt, tol) -> dict:
+    """Runs the corpus with one variant; returns a table row."""
+    register_prompt(builder)
+    eng = LocalLLMEngine(
+        spec,
+        backend=backend,
+        grammar=LLM_GRAMMAR,
+        output_format=fmt,
+        prompt_variant=builder.name,
+    )
+    head, tail = builder.tokens(eng._get_backend(), fmt)
+    latencies, valid, struct = [], 0, 0
+    for item in items:
+        t0 = time.perf_counter()
+        try:
+            data = eng.generate_json(item["text"])
+        except (LLMJSONError, ValueError):
+            data = None
+        latencies.append(time.perf_counter() - t0)
+        if data is not None:
+            valid += 1
+            struct += compare(data, item["json"], tol)[0]
+    n = len(items)
+    return {
+        "name": builder.name,
+        "prompt_tokens": len(head) + len(tail),
+        "valid": valid / n,
+        "structure": struct / n,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+    }
+
+
+def _keeps_quality(row: dict, full: dict, tol: float) -> bool:
+    return (
+        row["valid"] >= full["valid"] - tol
+        and row["structure"] >= full["structure"] - tol
+    )
+
+
+def mark_pareto(rows: list[dict]):
+    """Sets row["pareto"] = "*" on rows no other row dominates."""
+    keys = (
+        lambda r: -r["prompt_tokens"],
+        lambda r: r["valid"],
+        lambda r: r["structure"],
+        lambda r: -r["p50_s"],
+    )
+    for r in rows:
+        dominated = any(
+            all(k(o) >= k(r) for k in keys) and any(k(o) > k(r) for k in keys)
+            for o in rows
+            if o is not r
+        )
+        r["pareto"] = "" if dominated else "*"
+
+
+def ablate(
+    base: PromptBuilder,
+    backend,
+    spec: str,
+    items: list[dict],
+    *,
+    fmt: str = "json",
+    tol: float = 0.0,
+    progress=None,
+) -> tuple[list[dict], PromptBuilder]:
+    """
+    Single-unit ablations, then the greedy combination; returns all rows
+    (Pareto-marked) and the winning variant.
+    """
+    rows, builders = [], {}
+
+    def run(name, units):
+        b = base if not units else make_variant(base, fmt, name, units)
+        row = evaluate(b, backend, spec, items, fmt, tol)
+        row["changes"] = _describe(units)
+        rows.append(row)
+        builders[name] = b
+        if progress is not None:
+            progress(row)
+        return row
+
+    full = run(base.name, set())
+    units = prompt_units(base, fmt)
+    single = {}
+    for n, unit in enumerate(units, start=1):
+        single[unit] = run(f"{base.name}-a{n}", {unit})
+
+    # greedy: the cheapest prompts first, every step checked on the corpus
+    keep = [u for u, r in single.items() if _keeps_quality(r, full, tol)]
+    keep.sort(key=lambda u: single[u]["prompt_tokens"])
+    chosen = set()
+    for n, unit in enumerate(keep, start=1):
+        if unit[0] == "short" and ("drop", unit[1]) in chosen:
+            continue
+        row = run(f"{base.name}-g{n}", chosen | {unit})
+        if _keeps_quality(row, full, tol):
+            chosen.add(unit)
+
+    mark_pareto(rows)
+    good = [r for r in rows if _keeps_quality(r, full, tol)]
+    best = min(good, key=lambda r: (r["prompt_tokens"], r["p50_s"]))
+    return rows, builders[best["name"]]
+
+
+def _cell(fmt: str, value) -> str:
+    return "-" if value is None else fmt.format(value)
+
+
+def write_table(rows: list[dict], path: str):
+    names = [c for c, _ in COLUMNS]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            w = csv.DictWriter(f, fieldnames=names)
+            w.writeheader()
+            w.writerows({k: r.get(k) for k in names} for r in rows)
+            return
+        f.write("| " + " | ".join(names) + " |\n")
+        f.write("|" + "---|" * len(names) + "\n")
+        for r in rows:
+            cells = [_cell(fmt, r.get(k)) for k, fmt in COLUMNS]
+            f.write("| " + " | ".join(cells) + " |\n")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--backend", default=LLM_MODEL_PATH, help="GGUF, URL or stub")
+    ap.add_argument(
+        "--threads", type=int, default=None, help="default: physical cores"
+    )
+    ap.add_argument("--format", default="json", choices=OUTPUT_FORMATS)
+    ap.add_argument("--base", default=None, help="prompt variant to ablate")
+    ap.add_argument("--golden", default=str(GOLDEN_PATH))
+    ap.add_argument("--tol", type=float, default=0.0, help="allowed quality loss")
+    ap.add_argument("--out", default=None, help="table file (.md or .csv)")
+    ap.add_argument("--prompts-dir", default=LLM_PROMPTS_DIR)
+    ap.add_argument("--export", default=None, help="save the winner under this name")
+    args = ap.parse_args(argv)
+
+    items = load_golden(Path(args.golden))
+    base = get_prompt(args.base, args.prompts_dir)
+    backend = make_backend(args.backend, n_threads=args.threads)
+
+    print(f"{len(items)} golden items, prompt '{base.name}', format {args.format}")
+    for (kind, i), text in prompt_units(base, args.format).items():
+        print(f"  {kind:>7} {i:>2}: {text[:70]}")
+    print(" ".join(f"{c:>13}" for c, _ in COLUMNS[2:-1]) + "  name / changes")
+
+    def show(r):
+        cells = " ".join(f"{_cell(fmt, r[k]):>13}" for k, fmt in COLUMNS[2:-1])
+        print(f"{cells}  {r['name']}: {r['changes']}")
+
+    rows, best = ablate(
+        base, backend, args.backend, items, fmt=args.format, tol=args.tol, progress=show
+    )
+    if args.out:
+        write_table(rows, args.out)
+
+    front = [r for r in rows if r["pareto"]]
+    print(f"Pareto front: {', '.join(r['name'] for r in front)}")
+    row = next(r for r in rows if r["name"] == best.name)
+    print(
+        f"Winner: {best.name} ({row['changes']}), {row['prompt_tokens']} tokens "
+        f"vs {rows[0]['prompt_tokens']}"
+    )
+    if args.export:
+        winner = PromptBuilder.from_dict({**best.to_dict(), "name": args.export}, best)
+        path = save_prompt(winner, args.prompts_dir)
+        print(f"Saved to {path}; set LLM_PROMPT_VARIANT = {args.export!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# cad_ai/llm/autotune.py
+"""
+Thread / batch autotuning of llama-cpp for this machine and model.
+
+    python -m cad_ai.llm.autotune [--model models/x.gguf] [--quick]
+
+Decode is memory bound and usually fastest at about the number of
+physical cores (SMT siblings share the same execution units and only add
+contention); prefill is compute bound and depends on n_threads_batch and
+n_batch. So the search is staged: n_threads by decode tokens/s first,
+then n_threads_batch x n_batch by prefill tokens/s with that n_threads.
+
+The winner is stored in cache_dir/llm_profile.json under a machine id and
+the model fingerprint. LocalLLMEngine reads it for the settings it was
+given as None (threads only when n_threads is None).
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import time
+from pathlib import Path
+
+from cad_ai.config import (
+    LLM_CACHE_DIR,
+    LLM_GRAMMAR,
+    LLM_MODEL_PATH,
+    LLM_OUTPUT_FORMAT,
+)
+
+from .errors import LLMJSONError
+from .fingerprint import model_fingerprint
+
+PROFILE_NAME = "llm_profile.json"
+BATCH_SIZES = (256, 512, 1024)
+TUNED_KEYS = ("n_threads", "n_threads_batch", "n_batch")
+_BENCH_TEXT = "пластина 120 на 80 толщиной 8, 4 отверстия 10, отступ 15"
+
+
+def cpu_topology() -> dict:
+    """{"physical": cores, "logical": hardware threads} of this machine."""
+    logical = os.cpu_count() or 1
+    physical = None
+    try:
+        import psutil
+
+        physical = psutil.cpu_count(logical=False)
+    except Exception:
+        pass
+    if not physical:
+        physical = _sysfs_physical_cores()
+    return {"physical": physical or logical, "logical": logical}
+
+
+def _sysfs_physical_cores() -> int | None:
+    # Linux without psutil: one entry per set of SMT siblings
+    root = Path("/sys/devices/system/cpu")
+    siblings = set()
+    for p in root.glob("cpu[0-9]*/topology/thread_siblings_list"):
+        try:
+            siblings.add(p.read_text().strip())
+        except OSError:
+            pass
+    return len(siblings) or None
+
+
+def machine_id() -> str:
+    topo = cpu_topology()
+    raw = "|".join(
+        [
+            platform.node(),
+            platform.machine(),
+            platform.processor(),
+            f"{topo['physical']}/{topo['logical']}",
+        ]
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def thread_candidates(topo: dict) -> list[int]:
+    p, n = topo["physical"], topo["logical"]
+    return sorted({max(1, p // 2), max(1, p - 1), p, n})
+
+
+def _profile_path(cache_dir: str) -> Path:
+    return Path(cache_dir) / PROFILE_NAME
+
+
+def _read(cache_dir: str) -> dict:
+    path = _profile_path(cache_dir)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def load_profile(cache_dir: str | None, fingerprint: str) -> dict | None:
+    """Tuned settings of this machine for the model, or None."""
+    if not cache_dir:
+        return None
+    return _read(cache_dir).get(machine_id(), {}).get(fingerprint)
+
+
+def save_profile(cache_dir: str, fingerprint: str, settings: dict):
+    profiles = _read(cache_dir)
+    profiles.setdefault(machine_id(), {})[fingerprint] = settings
+    path = _profile_path(cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(profiles, indent=2), encoding="utf-8")
+
+
+def _bench(eng) -> tuple[float, float]:
+    """(prefill, decode) tokens/s; backend and llm end with this frame."""
+    backend = eng._get_backend()
+    _, _, tokens = eng._prepare(_BENCH_TEXT)
+    llm = backend.llm
+    llm.reset()
+    t0 = time.perf_counter()
+    llm.eval(tokens)
+    prefill = len(tokens) / (time.perf_counter() - t0)
+    try:
+        eng.generate_json(_BENCH_TEXT)
+    except (LLMJSONError, ValueError):
+        pass  # an invalid answer is still decoded
+    return prefill, eng.last_timings.get("tokens_per_s", 0.0)
+
+
+def measure(model_path: str, settings: dict, engine_kwargs: dict) -> dict:
+    """Prefill tokens/s (whole prompt, cold KV) and decode tokens/s."""
+    from .engine import LocalLLMEngine
+
+    eng = LocalLLMEngine(model_path, prefix_cache=False, **settings, **engine_kwargs)
+    try:
+        prefill, decode = _bench(eng)
+    finally:
+        # the engine held the last reference: the Llama is freed before the
+        # next configuration loads
+        del eng
+        gc.collect()
+    return {**settings, "prefill_tps": round(prefill, 1), "decode_tps": decode}
+
+
+def autotune(
+    model_path: str,
+    cache_dir: str | None = None,
+    *,
+    quick: bool = False,
+    progress=None,
+    **engine_kwargs,
+) -> dict:
+    """
+    Runs the staged search, saves the winner to the profile (with cache_dir)
+    and returns it. progress(row) gets every measured configuration.
+    engine_kwargs (grammar, output_format, ...) make the bench prompt real.
+    """
+    topo = cpu_topology()
+    results = []
+
+    def run(settings):
+        row = measure(model_path, settings, engine_kwargs)
+        results.append(row)
+        if progress is not None:
+            progress(row)
+        return row
+
+    threads = thread_candidates(topo)
+    if quick:
+        threads = sorted({topo["physical"], topo["logical"]})
+    decode = [
+        run(dict(n_threads=t, n_threads_batch=t, n_batch=512)) for t in threads
+    ]
+    best_t = max(decode, key=lambda r: r["decode_tps"])["n_threads"]
+
+    batch_threads = sorted({best_t, topo["physical"], topo["logical"]})
+    for tb in batch_threads:
+        for nb in (512,) if quick else BATCH_SIZES:
+            key = (best_t, tb, nb)
+            if not any(tuple(r[k] for k in TUNED_KEYS) == key for r in results):
+                run(dict(n_threads=best_t, n_threads_batch=tb, n_batch=nb))
+
+    candidates = [r for r in results if r["n_threads"] == best_t]
+    best = dict(max(candidates, key=lambda r: r["prefill_tps"]))
+    best.update(
+        physical=topo["physical"],
+        logical=topo["logical"],
+        tuned_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    if cache_dir:
+        save_profile(cache_dir, model_fingerprint(model_path), best)
+    return best
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--model", default=LLM_MODEL_PATH)
+    ap.add_argument("--cache-dir", default=LLM_CACHE_DIR)
+    ap.add_argument("--quick", action="store_true", help="fewer configurations")
+    args = ap.parse_args(argv)
+
+    topo = cpu_topology()
+    print(f"CPU: {topo['physical']} physical cores, {topo['logical']} threads")
+    print(
+        f"{'n_threads':>9} {'threads_batch':>13} {'n_batch':>7} "
+        f"{'prefill tok/s':>13} {'decode tok/s':>12}"
+    )
+
+    def show(r):
+        print(
+            f"{r['n_threads']:>9} {r['n_threads_batch']:>13} {r['n_batch']:>7} "
+            f"{r['prefill_tps']:>13.1f} {r['decode_tps']:>12.1f}"
+        )
+
+    best = autotune(
+        args.model,
+        args.cache_dir,
+        quick=args.quick,
+        progress=show,
+        grammar=LLM_GRAMMAR,
+        output_format=LLM_OUTPUT_FORMAT,
+    )
+    print("Best:", {k: best[k] for k in TUNED_KEYS})
+    print(f"Saved to {_profile_path(args.cache_dir)}")
+
+
+if __name__ == "__main__":
+    main()
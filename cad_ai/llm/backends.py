@@ -0,0 +1,336 @@
+# cad_ai/llm/backends.py
+"""
+Text-generation backends behind LocalLLMEngine.
+
+A backend loads a model, tokenizes and completes a token prompt, whole or
+streamed. Prompt rendering, caching, validation and repair stay in the
+engine, so the same requests can run on:
+
+    LlamaCppBackend     llama-cpp-python in process (default; the only one
+                        with prefix-state snapshots)
+    OpenAIHTTPBackend   a local OpenAI-compatible server (llama.cpp server,
+                        vLLM, ...) that also has /tokenize
+    StubBackend         deterministic answers without a model, for tests and
+                        for measuring everything around the model
+
+make_backend("stub" | "http://127.0.0.1:8080" | "models/x.gguf") picks one.
+"""
+
+import hashlib
+import json
+import time
+import urllib.request
+from pathlib import Path
+from typing import Iterator, Protocol
+
+from .autotune import cpu_topology
+from .fingerprint import model_fingerprint
+from .grammar import compile_grammar
+
+
+class LLMBackend(Protocol):
+    name: str
+    n_ctx: int | None  # known after load()
+    metadata: dict  # GGUF metadata (chat template), may be empty
+
+    def load(self, n_ctx: int | None = None) -> None: ...
+
+    def fingerprint(self) -> str: ...
+
+    def tokenize(
+        self, text: str, *, add_bos: bool = False, special: bool = False
+    ) -> list[int]: ...
+
+    def complete(self, prompt: list[int], **kwargs) -> str: ...
+
+    def stream(self, prompt: list[int], **kwargs) -> Iterator[str]: ...
+
+
+class LlamaCppBackend:
+    """llama-cpp-python in process; .llm is the Llama once loaded."""
+
+    name = "llama-cpp"
+
+    def __init__(
+        self,
+        model_path: str,
+        *,
+        n_threads: int | None = None,
+        n_threads_batch: int | None = None,
+        n_batch: int | None = None,
+        n_gpu_layers: int = 0,
+        use_mlock: bool = False,
+        speculative: str | None = None,
+        draft_tokens: int = 10,
+    ):
+        self.model_path = model_path
+        self.n_threads = n_threads or cpu_topology()["physical"]
+        self.n_threads_batch = n_threads_batch
+        self.n_batch = n_batch
+        self.n_gpu_layers = n_gpu_layers
+        self.use_mlock = use_mlock
+        self.speculative = speculative
+        self.draft_tokens = draft_tokens
+        self.n_ctx = None
+        self.llm = None
+        self._vocab = None
+        self._fingerprint = None
+
+    def _llama_class(self):
+        try:
+            from llama_cpp import Llama
+        except Exception as e:
+            raise RuntimeError(
+                "llama-cpp-python is not installed. Run: pip install llama-cpp-python"
+            ) from e
+        p = Path(self.model_path)
+        if not p.exists():
+            raise RuntimeError(
+                f"GGUF model not found: {p}\n"
+                f"Put a GGUF model there or change LLM_MODEL_PATH."
+            )
+        return Llama
+
+    @property
+    def metadata(self) -> dict:
+        llm = self.llm or self._vocab_llm()
+        return getattr(llm, "metadata", None) or {}
+
+    def _vocab_llm(self):
+        # tokenizer only, no weights: lets n_ctx be sized before loading
+        if self._vocab is None:
+            Llama = self._llama_class()
+            self._vocab = Llama(
+                model_path=str(self.model_path), vocab_only=True, verbose=False
+            )
+        return self._vocab
+
+    def load(self, n_ctx: int | None = None):
+        if self.llm is not None:
+            return
+        from .speculative import make_draft_model
+
+        Llama = self._llama_class()
+        extra = {}
+        if self.n_threads_batch is not None:
+            extra["n_threads_batch"] = self.n_threads_batch
+        if self.n_batch is not None:
+            extra["n_batch"] = self.n_batch
+        if self.speculative:
+            # llama-cpp keeps logits for every position then (n_ctx x vocab)
+            extra["draft_model"] = make_draft_model(
+                self.speculative,
+                num_pred_tokens=self.draft_tokens,
+                n_threads=self.n_threads,
+            )
+        self.llm = Llama(
+            model_path=str(self.model_path),
+            n_ctx=n_ctx or 2048,
+            n_threads=self.n_threads,
+            n_gpu_layers=self.n_gpu_layers,
+            use_mlock=self.use_mlock,
+            verbose=False,
+            **extra,
+        )
+        self.n_ctx = self.llm.n_ctx()
+        self._vocab = None
+
+    def fingerprint(self) -> str:
+        # hashes 2 MiB of the file: once, not on every prompt build
+        if self._fingerprint is None:
+            self._fingerprint = model_fingerprint(self.model_path)
+        return self._fingerprint
+
+    def tokenize(self, text, *, add_bos=False, special=False) -> list[int]:
+        llm = self.llm or self._vocab_llm()
+        return llm.tokenize(text.encode("utf-8"), add_bos=add_bos, special=special)
+
+    def _kwargs(self, kwargs: dict) -> dict:
+        kwargs = dict(kwargs)
+        if kwargs.get("grammar"):
+            kwargs["grammar"] = compile_grammar(kwargs["grammar"])
+        return kwargs
+
+    def complete(self, prompt, **kwargs) -> str:
+        out = self.llm.create_completion(prompt=prompt, **self._kwargs(kwargs))
+        return out["choices"][0]["text"] or ""
+
+    def stream(self, prompt, **kwargs):
+        chunks = self.llm.create_completion(
+            prompt=prompt, stream=True, **self._kwargs(kwargs)
+        )
+        try:
+            for chunk in chunks:
+                yield chunk["choices"][0]["text"] or ""
+        finally:
+            # closing the generator stops llama-cpp decoding
+            chunks.close()
+
+
+class OpenAIHTTPBackend:
+    """
+    OpenAI-compatible completions server on localhost. Prompts are sent as
+    token ids from the server's own /tokenize, so the engine's budget and
+    repair logic work unchanged; grammar is passed as "grammar" (GBNF,
+    llama.cpp server).
+    """
+
+    name = "http"
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8080",
+        *,
+        model: str | None = None,
+        n_ctx: int | None = None,
+        timeout: float = 600.0,
+    ):
+        self.base_url = base_url.rstrip("/").removesuffix("/v1")
+        self.model = model
+        self.n_ctx = n_ctx
+        self.timeout = timeout
+        self.metadata = {}
+
+    def _request(self, path: str, payload: dict | None = None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            headers={"Content-Type": "application/json"},
+        )
+        return urllib.request.urlopen(req, timeout=self.timeout)
+
+    def _json(self, path: str, payload: dict | None = None) -> dict:
+        with self._request(path, payload) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def load(self, n_ctx: int | None = None):
+        try:
+            models = self._json("/v1/models").get("data") or []
+        except (OSError, ValueError) as e:
+            raise RuntimeError(
+                f"LLM server not reachable at {self.base_url}: {e}"
+            ) from e
+        if self.model is None and models:
+            self.model = models[0].get("id")
+        if self.n_ctx is None:
+            self.n_ctx = self._server_n_ctx(models) or n_ctx or 4096
+
+    def _server_n_ctx(self, models) -> int | None:
+        for m in models:
+            if m.get("max_model_len"):  # vLLM
+                return int(m["max_model_len"])
+        try:
+            props = self._json("/props")  # llama.cpp server
+            return int(props["default_generation_settings"]["n_ctx"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def fingerprint(self) -> str:
+        raw = f"{self.base_url}|{self.model}"
+        return "http-" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+    def tokenize(self, text, *, add_bos=False, special=False) -> list[int]:
+        out = self._json(
+            "/tokenize",
+            {
+                # llama.cpp server / vLLM spellings
+                "content": text,
+                "add_special": add_bos,
+                "parse_special": special,
+                "prompt": text,
+                "add_special_tokens": add_bos,
+            },
+        )
+        return [t if isinstance(t, int) else t["id"] for t in out["tokens"]]
+
+    def _payload(self, prompt, kwargs: dict, stream: bool) -> dict:
+        payload = {"prompt": prompt, "stream": stream}
+        if self.model:
+            payload["model"] = self.model
+        for k in ("max_tokens", "temperature", "stop", "grammar"):
+            if kwargs.get(k) is not None:
+                payload[k] = kwargs[k]
+        return payload
+
+    def complete(self, prompt, **kwargs) -> str:
+        out = self._json("/v1/completions", self._payload(prompt, kwargs, False))
+        return out["choices"][0].get("text") or ""
+
+    def stream(self, prompt, **kwargs):
+        # closing the generator drops the connection, the server stops
+        with self._request(
+            "/v1/completions", self._payload(prompt, kwargs, True)
+        ) as resp:
+            for line in resp:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)["choices"][0].get("text") or ""
+
+
+class StubBackend:
+    """
+    Deterministic backend without a model: answers with the TEMPLATES build
+    of the request when the rule parser recognizes it, else a 10 mm cube.
+    Tokens are characters; prefill_ms / decode_ms (per token) simulate the
+    speed of a model. max_tokens is ignored, answers are never truncated.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self, *, n_ctx: int = 32768, prefill_ms: float = 0.0, decode_ms: float = 0.0
+    ):
+        self.n_ctx = n_ctx
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.metadata = {}
+
+    def load(self, n_ctx: int | None = None):
+        pass
+
+    def fingerprint(self) -> str:
+        return "stub"
+
+    def tokenize(self, text, *, add_bos=False, special=False) -> list[int]:
+        return ([1] if add_bos else []) + [ord(c) for c in text]
+
+    def _answer(self, prompt) -> str:
+        from cad_ai.templates import TEMPLATES
+        from cad_ai.templates.ai_templates import tpl_cube
+        from cad_ai.templates.text_rules import match_template
+
+        from .chat import COMPACT_SYSTEM_PROMPT
+        from .compact import to_compact
+        from .prompt import REQUEST_HEADER
+
+        text = "".join(chr(t) for t in prompt if t > 1)
+        request = text.rpartition(REQUEST_HEADER)[2].split("<|", 1)[0].strip()
+        found = match_template(request)
+        data = TEMPLATES[found[0]]["build"](found[1]) if found else tpl_cube(10.0)
+        if COMPACT_SYSTEM_PROMPT in text:
+            return to_compact(data)
+        return json.dumps(data, ensure_ascii=False)
+
+    def complete(self, prompt, **kwargs) -> str:
+        return "".join(self.stream(prompt, **kwargs))
+
+    def stream(self, prompt, **kwargs):
+        answer = self._answer(prompt)
+        time.sleep(self.prefill_ms * len(prompt) / 1000.0)
+        for i in range(0, len(answer), 4):
+            time.sleep(self.decode_ms * 4 / 1000.0)
+            yield answer[i : i + 4]
+
+
+def make_backend(spec: str, **llama_kwargs) -> LLMBackend:
+    """'stub', 'http://host:port[/v1]' or a GGUF path (llama-cpp in process)."""
+    if spec == "stub":
+        return StubBackend()
+    if spec.startswith(("http://", "https://")):
+        return OpenAIHTTPBackend(spec)
+    return LlamaCppBackend(spec, **llama_kwargs)
@@ -0,0 +1,113 @@
+# cad_ai/llm/batch.py
+"""
+Bulk text -> JSON for spreadsheets of part descriptions.
+
+    python -m cad_ai.llm.batch parts.csv results.jsonl [--column description]
+                               [--workers N]
+
+Reads one description per CSV row, runs LocalLLMEngine.generate_json_batch
+(or an LLMWorkerPool with --workers) and writes one JSON line per row
+(in input order) plus throughput stats.
+"""
+
+import argparse
+import csv
+import json
+import time
+
+from cad_ai.config import LLM_CACHE_DIR, LLM_GRAMMAR, LLM_MODEL_PATH
+
+from .engine import LocalLLMEngine
+from .pool import LLMWorkerPool
+
+
+def read_descriptions(path: str, column: str | None = None) -> list[str]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        return []
+    col = 0
+    if column is not None:
+        if column not in rows[0]:
+            raise ValueError(
+                f"No column '{column}' in {path}; the header has: "
+                + ", ".join(rows[0])
+            )
+        col = rows[0].index(column)
+        rows = rows[1:]
+    return [r[col].strip() for r in rows if len(r) > col and r[col].strip()]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("csv_path")
+    ap.add_argument("out_path")
+    ap.add_argument("--column", default=None, help="header name (default: 1st col)")
+    ap.add_argument("--model", default=LLM_MODEL_PATH)
+    ap.add_argument(
+        "--threads", type=int, default=None, help="default: autotune profile"
+    )
+    ap.add_argument("--workers", type=int, default=0, help="worker processes")
+    args = ap.parse_args(argv)
+
+    texts = read_descriptions(args.csv_path, args.column)
+    if args.workers > 0:
+        results, st = _run_pool(texts, args)
+    else:
+        eng = LocalLLMEngine(
+            args.model,
+            n_threads=args.threads,
+            cache_dir=LLM_CACHE_DIR,
+            grammar=LLM_GRAMMAR,
+        )
+        results = eng.generate_json_batch(texts)
+        st = eng.last_batch_stats
+
+    with open(args.out_path, "w", encoding="utf-8") as f:
+        for text, res in zip(texts, results):
+            row = {"text": text}
+            if isinstance(res, dict):
+                row["json"] = res
+            else:
+                row["error"] = str(res)
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    if "tokens_per_s" in st:
+        print(
+            f"{st['ok']}/{st['items']} ok, {st['completion_tokens']} tokens "
+            f"in {st['seconds']:.1f}s -> {st['tokens_per_s']:.1f} tok/s"
+        )
+    else:
+        print(
+            f"{st['ok']}/{st['items']} ok in {st['seconds']:.1f}s "
+            f"-> {st['items_per_s']:.2f} items/s"
+        )
+
+
+def _run_pool(texts, args):
+    results = [None] * len(texts)
+    t0 = time.perf_counter()
+    with LLMWorkerPool(
+        args.model,
+        n_workers=args.workers,
+        cores_per_worker=args.threads,
+        cache_dir=LLM_CACHE_DIR,
+        grammar=LLM_GRAMMAR,
+    ) as pool:
+        # job ids are assigned in submission order
+        for job_id, res in pool.map_unordered(texts):
+            results[job_id] = res
+        for w in pool.utilization():
+            print(f"worker {w['worker']}: {w['jobs']} jobs, busy {w['busy']:.0%}")
+    elapsed = time.perf_counter() - t0
+    st = {
+        "items": len(results),
+        "ok": sum(1 for r in results if isinstance(r, dict)),
+        "seconds": elapsed,
+        "items_per_s": len(results) / elapsed if elapsed > 0 else 0.0,
+    }
+    return results, st
+
+
+if __name__ == "__main__":
+    main()
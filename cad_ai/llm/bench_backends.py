@@ -0,0 +1,117 @@
+# cad_ai/llm/bench_backends.py
+"""
+Latency harness: the same prompt set against any backend.
+
+    python -m cad_ai.llm.bench_backends [parts.csv] [--column description]
+        --backend models/qwen2.5-1.5b-instruct-q4_k_m.gguf
+        --backend http://127.0.0.1:8080 --backend stub [--out bench.jsonl]
+
+Per backend: load time, prefill (time to the first streamed token, prefix
+already warm), decode tokens/s after the first token and the share of
+answers that pass validation. Without a CSV the example library is used;
+without --backend the configured model.
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from cad_ai.config import LLM_CACHE_DIR, LLM_GRAMMAR, LLM_MODEL_PATH
+
+from .backends import make_backend
+from .batch import read_descriptions
+from .engine import LocalLLMEngine
+from .errors import LLMJSONError
+from .retrieval import load_library
+
+
+def _measure(eng, backend, text: str) -> dict:
+    _, prompt, tokens = eng._prepare(text)
+    raw, first = "", None
+    t0 = time.perf_counter()
+    for chunk in backend.stream(tokens, **eng._completion_kwargs()):
+        if first is None and chunk:
+            first = time.perf_counter()
+        raw += chunk
+    end = time.perf_counter()
+
+    try:
+        eng._finish(raw, prompt)
+        valid = True
+    except (LLMJSONError, ValueError):
+        valid = False
+    n = len(backend.tokenize(raw))
+    first = first or end
+    return {
+        "prefill_ms": (first - t0) * 1000.0,
+        "decode_tokens": max(n - 1, 0),
+        "decode_s": end - first,
+        "valid": valid,
+    }
+
+
+def run_backend(spec: str, texts: list[str], *, threads: int | None = None) -> dict:
+    backend = make_backend(spec, n_threads=threads)
+    eng = LocalLLMEngine(
+        spec,
+        n_threads=threads,
+        cache_dir=LLM_CACHE_DIR,
+        grammar=LLM_GRAMMAR,
+        backend=backend,
+    )
+    t0 = time.perf_counter()
+    eng._get_backend()
+    load_s = time.perf_counter() - t0
+    eng.warm_up()
+
+    runs = [_measure(eng, backend, t) for t in texts]
+    decode_s = sum(r["decode_s"] for r in runs)
+    prefill = sorted(r["prefill_ms"] for r in runs)
+    return {
+        "backend": spec,
+        "load_s": load_s,
+        "prefill_ms_p50": statistics.median(prefill),
+        "prefill_ms_p95": prefill[min(len(prefill) - 1, int(len(prefill) * 0.95))],
+        "decode_tokens_per_s": (
+            sum(r["decode_tokens"] for r in runs) / decode_s if decode_s > 0 else 0.0
+        ),
+        "valid_rate": sum(r["valid"] for r in runs) / len(runs),
+        "items": len(runs),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("csv_path", nargs="?")
+    ap.add_argument("--column", default=None, help="header name (default: 1st col)")
+    ap.add_argument("--backend", action="append", help="GGUF path, http URL, stub")
+    ap.add_argument(
+        "--threads", type=int, default=None, help="default: physical cores"
+    )
+    ap.add_argument("--out", default=None, help="append results as JSON lines")
+    args = ap.parse_args(argv)
+
+    if args.csv_path:
+        texts = read_descriptions(args.csv_path, args.column)
+    else:
+        texts = [ex["text"] for ex in load_library()]
+
+    print(
+        f"{'backend':<32} {'load s':>7} {'prefill p50':>11} {'p95 ms':>7} "
+        f"{'decode tok/s':>12} {'valid':>6}"
+    )
+    for spec in args.backend or [LLM_MODEL_PATH]:
+        r = run_backend(spec, texts, threads=args.threads)
+        print(
+            f"{spec[-32:]:<32} {r['load_s']:>7.2f} {r['prefill_ms_p50']:>11.1f} "
+            f"{r['prefill_ms_p95']:>7.1f} {r['decode_tokens_per_s']:>12.1f} "
+            f"{r['valid_rate']:>6.0%}"
+        )
+        if args.out:
+            with open(args.out, "a", encoding="utf-8") as f:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
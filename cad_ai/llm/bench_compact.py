@@ -0,0 +1,120 @@
+# cad_ai/llm/bench_compact.py
+"""
+JSON vs compact output: decode tokens and end-to-end latency.
+
+    python -m cad_ai.llm.bench_compact [parts.csv] [--column description]
+
+Without a CSV the texts of the example library are used. For every text
+both formats run on the same model (caches off, prefix warmed up first);
+the reference outputs of the library are also tokenized in both formats,
+which shows the decode saving independent of model quality.
+"""
+
+import argparse
+import gc
+import json
+import statistics
+import time
+
+from cad_ai.config import LLM_CACHE_DIR, LLM_GRAMMAR, LLM_MODEL_PATH
+
+from .backends import LlamaCppBackend
+from .batch import read_descriptions
+from .compact import to_compact
+from .engine import LocalLLMEngine
+from .errors import LLMJSONError
+from .prompt import OUTPUT_FORMATS
+from .retrieval import load_library
+
+
+def _count(backend, text: str) -> int:
+    return len(backend.tokenize(text))
+
+
+def _reference_tokens(backend) -> dict:
+    out = {fmt: 0 for fmt in OUTPUT_FORMATS}
+    for ex in load_library():
+        out["json"] += _count(backend, json.dumps(ex["json"], ensure_ascii=False))
+        out["compact"] += _count(backend, to_compact(ex["json"]))
+    return out
+
+
+def _run(fmt: str, texts: list[str], args):
+    eng = LocalLLMEngine(
+        args.model,
+        n_threads=args.threads,
+        cache_dir=LLM_CACHE_DIR,
+        grammar=LLM_GRAMMAR,
+        output_format=fmt,
+    )
+    eng.warm_up()
+    backend = eng._get_backend()
+
+    latencies, tokens, ok, truncated = [], [], 0, 0
+    for text in texts:
+        t0 = time.perf_counter()
+        try:
+            eng.generate_json(text)
+            ok += 1
+        except (LLMJSONError, ValueError):
+            pass
+        latencies.append(time.perf_counter() - t0)
+        n = _count(backend, eng.last_raw)
+        tokens.append(n)
+        truncated += n >= eng.max_tokens
+    row = {
+        "format": fmt,
+        "ok": ok,
+        "items": len(texts),
+        "tokens_mean": statistics.mean(tokens),
+        "tokens_max": max(tokens),
+        "truncated": truncated,
+        "latency_p50": statistics.median(latencies),
+        "latency_mean": statistics.mean(latencies),
+        "tokens_per_s": sum(tokens) / sum(latencies),
+    }
+    # the engine held the last reference: the Llama is freed before the next
+    # format loads its own
+    del eng, backend
+    gc.collect()
+    return row
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("csv_path", nargs="?")
+    ap.add_argument("--column", default=None, help="header name (default: 1st col)")
+    ap.add_argument("--model", default=LLM_MODEL_PATH)
+    ap.add_argument(
+        "--threads", type=int, default=None, help="default: autotune profile"
+    )
+    args = ap.parse_args(argv)
+
+    if args.csv_path:
+        texts = read_descriptions(args.csv_path, args.column)
+    else:
+        texts = [ex["text"] for ex in load_library()]
+
+    rows = [_run(fmt, texts, args) for fmt in OUTPUT_FORMATS]
+
+    # tokenizer only, no weights
+    ref = _reference_tokens(LlamaCppBackend(args.model))
+    print(
+        f"reference outputs: json {ref['json']} tokens, "
+        f"compact {ref['compact']} tokens "
+        f"({ref['compact'] / max(ref['json'], 1):.0%})"
+    )
+    print(
+        f"{'format':<8} {'ok':>7} {'tok/req':>8} {'tok max':>8} {'trunc':>6} "
+        f"{'p50 s':>7} {'mean s':>7} {'tok/s':>7}"
+    )
+    for r in rows:
+        print(
+            f"{r['format']:<8} {r['ok']:>3}/{r['items']:<3} {r['tokens_mean']:>8.1f} "
+            f"{r['tokens_max']:>8} {r['truncated']:>6} {r['latency_p50']:>7.2f} "
+            f"{r['latency_mean']:>7.2f} {r['tokens_per_s']:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# cad_ai/llm/bench_speculative.py
+"""
+Decode speed with and without speculative decoding.
+
+    python -m cad_ai.llm.bench_speculative [parts.csv] [--column description]
+                                           [--draft models/small.gguf]
+
+Runs the same fixed request set (the example library without a CSV) with
+speculation off, with prompt lookup and, given --draft, with a draft GGUF.
+Caches are off and the prefix is warmed up first, so the numbers are
+decode speed. Greedy speculation must not change the output: the "same"
+column counts outputs identical to the run without speculation.
+"""
+
+import argparse
+import statistics
+import time
+
+from cad_ai.config import LLM_CACHE_DIR, LLM_GRAMMAR, LLM_MODEL_PATH
+
+from .batch import read_descriptions
+from .engine import LocalLLMEngine
+from .errors import LLMJSONError
+from .retrieval import load_library
+from .speculative import PROMPT_LOOKUP
+
+
+def _run(spec, texts: list[str], args) -> tuple[dict, list[str]]:
+    eng = LocalLLMEngine(
+        args.model,
+        n_threads=args.threads,
+        cache_dir=LLM_CACHE_DIR,
+        grammar=LLM_GRAMMAR,
+        speculative=spec,
+        draft_tokens=args.draft_tokens,
+    )
+    eng.warm_up()
+    backend = eng._get_backend()
+
+    outputs, latencies, tokens, ok = [], [], 0, 0
+    for text in texts:
+        t0 = time.perf_counter()
+        try:
+            eng.generate_json(text)
+            ok += 1
+        except (LLMJSONError, ValueError):
+            pass
+        latencies.append(time.perf_counter() - t0)
+        outputs.append(eng.last_raw)
+        tokens += len(backend.tokenize(eng.last_raw))
+    row = {
+        "mode": spec or "off",
+        "ok": ok,
+        "items": len(texts),
+        "tokens": tokens,
+        "latency_p50": statistics.median(latencies),
+        "tokens_per_s": tokens / sum(latencies),
+    }
+    return row, outputs
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("csv_path", nargs="?")
+    ap.add_argument("--column", default=None, help="header name (default: 1st col)")
+    ap.add_argument("--model", default=LLM_MODEL_PATH)
+    ap.add_argument(
+        "--threads", type=int, default=None, help="default: autotune profile"
+    )
+    ap.add_argument("--draft", default=None, help="draft GGUF (same vocabulary)")
+    ap.add_argument("--draft-tokens", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    if args.csv_path:
+        texts = read_descriptions(args.csv_path, args.column)
+    else:
+        texts = [ex["text"] for ex in load_library()]
+
+    modes = [None, PROMPT_LOOKUP] + ([args.draft] if args.draft else [])
+    base = None
+    print(
+        f"{'mode':<24} {'ok':>7} {'tokens':>7} {'p50 s':>7} {'tok/s':>7} "
+        f"{'speedup':>8} {'same':>5}"
+    )
+    for spec in modes:
+        row, outputs = _run(spec, texts, args)
+        if base is None:
+            base = row, outputs
+        same = sum(a == b for a, b in zip(outputs, base[1]))
+        speedup = row["tokens_per_s"] / max(base[0]["tokens_per_s"], 1e-9)
+        print(
+            f"{row['mode'][-24:]:<24} {row['ok']:>3}/{row['items']:<3} "
+            f"{row['tokens']:>7} {row['latency_p50']:>7.2f} "
+            f"{row['tokens_per_s']:>7.1f} {speedup:>7.2f}x {same:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# cad_ai/llm/budget.py
+"""
+Token-budget accounting: how many tokens the fixed prompt takes and which
+context size is enough for it plus the request and the output.
+
+A smaller n_ctx means a smaller KV cache: less RAM and faster attention.
+The count of the fixed prompt is needed before the model is loaded (n_ctx
+is a load-time parameter), so it is measured with the backend's tokenizer
+alone (a vocab-only Llama) once per model + prompt version and kept in
+cache_dir.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+CTX_BUCKETS = (512, 1024, 1536, 2048, 3072, 4096, 6144, 8192, 16384, 32768)
+
+
+def pick_n_ctx(needed: int, buckets=CTX_BUCKETS) -> int:
+    """Smallest bucket >= needed (the largest one if nothing fits)."""
+    for b in buckets:
+        if b >= needed:
+            return b
+    return buckets[-1]
+
+
+class TokenCounts:
+    """Persistent {key: token count} map (cache_dir/token_counts.json)."""
+
+    def __init__(self, cache_dir: str | None = None):
+        self.path = Path(cache_dir) / "token_counts.json" if cache_dir else None
+        self._lock = threading.Lock()
+        self._counts = {}
+        if self.path is not None and self.path.exists():
+            try:
+                self._counts = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception:
+                self._counts = {}
+
+    def get(self, key: str) -> int | None:
+        with self._lock:
+            return self._counts.get(key)
+
+    def put(self, key: str, count: int):
+        with self._lock:
+            self._counts[key] = count
+            if self.path is None:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # whole file or nothing, even with pool workers writing too
+                tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(self._counts), encoding="utf-8")
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
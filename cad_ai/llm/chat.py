@@ -0,0 +1,76 @@
+SYSTEM_PROMPT = "You output ONLY JSON. No extra text."
+COMPACT_SYSTEM_PROMPT = "You output ONLY the CAD script. No extra text."
+PLAN_SYSTEM_PROMPT = "You output ONLY the feature list. No extra text."
+
+# fallback when the GGUF has no chat template (Qwen2.5 uses ChatML anyway)
+_CHATML_TURN = "<|im_start|>{role}\n{content}<|im_end|>\n"
+_CHATML_ASSISTANT = "<|im_start|>assistant\n"
+CHAT_STOP = ["<|im_end|>"]
+
+_SENTINEL = "@@CAD_AI_USER_TEXT@@"
+
+
+def render_messages(llm, messages: list[dict]) -> str:
+    """
+    Renders messages + the assistant generation prompt with the model's own
+    chat template, the same way create_chat_completion would.
+    """
+    metadata = getattr(llm, "metadata", None) or {}
+    template = metadata.get("tokenizer.chat_template")
+    if template:
+        try:
+            from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+            # BOS is added by tokenize(add_bos=True), not by the template
+            formatter = Jinja2ChatFormatter(
+                template=template, eos_token="", bos_token=""
+            )
+            return formatter(messages=messages).prompt
+        except Exception:
+            pass
+    turns = [_CHATML_TURN.format(**m) for m in messages]
+    return "".join(turns) + _CHATML_ASSISTANT
+
+
+def render_chat(llm, system: str, user: str) -> str:
+    """Renders a system+user turn, see render_messages."""
+    return render_messages(
+        llm,
+        [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+    )
+
+
+def split_chat(llm, system: str, user_prefix: str) -> tuple[str, str]:
+    """
+    Returns (head, tail) so that head + user_text + tail is the rendered chat
+    for the user message user_prefix + user_text.
+    """
+    rendered = render_chat(llm, system, user_prefix + _SENTINEL)
+    i = rendered.find(_SENTINEL)
+    if i == -1:
+        raise RuntimeError("Chat template dropped the user message.")
+    return rendered[:i], rendered[i + len(_SENTINEL) :]
+
+
+def reply_turn(llm, system: str, user: str, reply: str) -> str:
+    """
+    Text that follows the assistant's answer when the user replies with
+    `reply`: closes the answer, adds the user turn, opens a new assistant
+    turn. The answer itself is already in the context as generated tokens.
+    """
+    rendered = render_messages(
+        llm,
+        [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+            {"role": "assistant", "content": _SENTINEL},
+            {"role": "user", "content": reply},
+        ],
+    )
+    i = rendered.find(_SENTINEL)
+    if i == -1:
+        raise RuntimeError("Chat template dropped the assistant message.")
+    return rendered[i + len(_SENTINEL) :]
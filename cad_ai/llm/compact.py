@@ -0,0 +1,192 @@
+# cad_ai/llm/compact.py
+"""
+Compact line-based output format, expanded locally to the JSON DSL.
+
+One statement per line (";" also separates statements):
+
+    N <name>                  part name
+    S [XOY|XOZ|YOZ]           sketch
+    P <plane or name>         sketch_on_plane
+    L x1 y1 x2 y2             line
+    R x1 y1 x2 y2             rectangle = 4 lines, same order as the templates
+    C cx cy r                 circle
+    E h [direction]           extrude
+    X T|depth [direction]     cut through all / to depth
+    W XOY|XOZ|YOZ offset name workplane_offset
+
+"S XOY; R 0 0 120 80; C 15 15 5; E 8 both" decodes to a fraction of the
+tokens of the same JSON. expand_compact() output goes through the usual
+validate_generated_json; to_compact() renders few-shot examples.
+"""
+
+from .schema import DIRECTIONS, PLANES
+
+_STMT_SEP = ";"
+
+
+def _num(tok: str, lineno: int):
+    try:
+        return int(tok) if tok.lstrip("-").isdigit() else float(tok)
+    except ValueError:
+        raise ValueError(f"Line {lineno}: '{tok}' is not a number.") from None
+
+
+def _fmt(v) -> str:
+    v = float(v)
+    return str(int(v)) if v == int(v) else repr(v)
+
+
+def _direction(args, lineno: int) -> dict:
+    if not args:
+        return {}
+    d = args[0].lower()
+    if d not in DIRECTIONS:
+        raise ValueError(f"Line {lineno}: bad direction '{args[0]}'.")
+    return {"direction": d}
+
+
+def _rect_lines(x1, y1, x2, y2) -> list[dict]:
+    corners = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+    return [
+        {"type": "line", "start": corners[i], "end": corners[(i + 1) % 4]}
+        for i in range(4)
+    ]
+
+
+def _statements(text: str):
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        for stmt in line.split(_STMT_SEP):
+            stmt = stmt.strip()
+            if stmt:
+                yield lineno, stmt
+
+
+def expand_compact(text: str) -> dict:
+    """Compact script -> JSON DSL dict. Raises ValueError with the line number."""
+    data = {}
+    steps = []
+    sketch = None
+
+    for lineno, stmt in _statements(text):
+        op, _, rest = stmt.partition(" ")
+        op = op.upper()
+        args = rest.split()
+
+        if op == "N":
+            data["name"] = rest.strip()
+            continue
+
+        if op in ("L", "R", "C"):
+            if sketch is None:
+                raise ValueError(f"Line {lineno}: '{op}' outside of a sketch.")
+            want = 3 if op == "C" else 4
+            if len(args) != want:
+                raise ValueError(f"Line {lineno}: '{op}' needs {want} numbers.")
+            v = [_num(a, lineno) for a in args]
+            if op == "L":
+                sketch.append({"type": "line", "start": v[:2], "end": v[2:]})
+            elif op == "R":
+                sketch.extend(_rect_lines(*v))
+            else:
+                sketch.append({"type": "circle", "center": v[:2], "radius": v[2]})
+            continue
+
+        sketch = None
+        if op == "S":
+            step = {"action": "sketch"}
+            if args:
+                plane = args[0].upper()
+                if plane not in PLANES:
+                    raise ValueError(f"Line {lineno}: bad plane '{args[0]}'.")
+                step["plane"] = plane
+            step["entities"] = sketch = []
+        elif op == "P":
+            if not rest.strip():
+                raise ValueError(f"Line {lineno}: 'P' needs a plane.")
+            step = {"action": "sketch_on_plane", "plane": rest.strip()}
+            step["entities"] = sketch = []
+        elif op == "E":
+            if not args:
+                raise ValueError(f"Line {lineno}: 'E' needs a height.")
+            step = {"action": "extrude", "height": _num(args[0], lineno)}
+            step.update(_direction(args[1:], lineno))
+        elif op == "X":
+            step = {"action": "cut"}
+            if args and args[0].upper() == "T":
+                step["through_all"] = True
+                args = args[1:]
+            elif args and args[0].lower() not in DIRECTIONS:
+                step["through_all"] = False
+                step["depth"] = _num(args[0], lineno)
+                args = args[1:]
+            step.update(_direction(args, lineno))
+        elif op == "W":
+            if len(args) < 3 or args[0].upper() not in PLANES:
+                raise ValueError(f"Line {lineno}: 'W' needs plane, offset, name.")
+            step = {
+                "action": "workplane_offset",
+                "base_plane": args[0].upper(),
+                "offset": _num(args[1], lineno),
+                "name": " ".join(args[2:]),
+            }
+        else:
+            raise ValueError(f"Line {lineno}: unknown statement '{op}'.")
+        steps.append(step)
+
+    if not steps:
+        raise ValueError("Compact script has no steps.")
+    data["steps"] = steps
+    return data
+
+
+def _entity_lines(entities: list) -> list[str]:
+    out = []
+    i = 0
+    while i < len(entities):
+        quad = entities[i : i + 4]
+        if len(quad) == 4 and all(e.get("type") == "line" for e in quad):
+            (x1, y1), (x2, y2) = quad[0]["start"], quad[1]["end"]
+            if quad == _rect_lines(x1, y1, x2, y2):
+                out.append(f"R {_fmt(x1)} {_fmt(y1)} {_fmt(x2)} {_fmt(y2)}")
+                i += 4
+                continue
+        e = entities[i]
+        if e.get("type") == "circle":
+            (cx, cy), r = e["center"], e["radius"]
+            out.append(f"C {_fmt(cx)} {_fmt(cy)} {_fmt(r)}")
+        else:
+            pts = list(e["start"]) + list(e["end"])
+            out.append("L " + " ".join(_fmt(v) for v in pts))
+        i += 1
+    return out
+
+
+def to_compact(data: dict) -> str:
+    """JSON DSL dict -> compact script (inverse of expand_compact)."""
+    lines = []
+    if data.get("name"):
+        lines.append(f"N {data['name']}")
+    for st in data["steps"]:
+        act = st["action"]
+        direction = f" {st['direction']}" if st.get("direction") else ""
+        if act == "sketch":
+            lines.append(f"S {st['plane']}" if st.get("plane") else "S")
+            lines.extend(_entity_lines(st["entities"]))
+        elif act == "sketch_on_plane":
+            lines.append(f"P {st.get('plane') or 'XOY'}")
+            lines.extend(_entity_lines(st["entities"]))
+        elif act == "extrude":
+            lines.append(f"E {_fmt(st['height'])}{direction}")
+        elif act == "cut":
+            if st.get("through_all"):
+                lines.append(f"X T{direction}")
+            elif "depth" in st:
+                lines.append(f"X {_fmt(st['depth'])}{direction}")
+            else:
+                lines.append(f"X{direction}")
+        elif act == "workplane_offset":
+            offset = _fmt(st["offset"])
+            lines.append(f"W {st['base_plane']} {offset} {st['name']}")
+        else:
+            raise ValueError(f"Unknown action '{act}'.")
+    return "\n".join(lines)
@@ -1,78 +1,942 @@
+import asyncio
+import contextlib
+import functools
+import hashlib
 import json
+import threading
+import time
 from pathlib import Path
 
-from .errors import LLMJSONError
-from .prompt import make_llm_prompt
-from .validate import extract_json_object, validate_generated_json
+from cad_ai.templates.text_rules import RuleRouter
+
+from .chat import CHAT_STOP, render_chat, reply_turn
+from .autotune import TUNED_KEYS, cpu_topology, load_profile
+from .backends import LlamaCppBackend, LLMBackend
+from .budget import TokenCounts, pick_n_ctx
+from .compact import expand_compact
+from .errors import LLMCancelled, LLMJSONError
+from .fingerprint import model_fingerprint
+from .grammar import grammar_text, patch_grammar_text
+from .metrics import MetricsLog
+from .patch import apply_patch, parse_patch
+from .prefix_cache import PrefixCache
+from .prompt import (
+    OUTPUT_FORMATS,
+    get_prompt,
+    make_edit_message,
+    make_repair_message,
+)
+from .result_cache import ResultCache
+from .retrieval import select_examples
+from .schema import SCHEMA_VERSION
+from .skeleton import SkeletonCache
+from .stream import IncrementalStepParser, StreamAbort
+from .validate import (
+    extract_json_object,
+    normalize_generated_json,
+    normalize_step,
+    validate_generated_json,
+)
 
 
 class LocalLLMEngine:
     """
-    Thin wrapper around llama-cpp-python.
+    Thin wrapper around a text-generation backend (backends.py), by default
+    llama-cpp-python in process on model_path.
     Keeps last_raw/last_extracted/last_prompt for UI debug windows.
+
+    The fixed prompt prefix (rules + few-shot examples) is evaluated once and
+    its llama state is restored before every request, so only the user text
+    is prefilled. With cache_dir set the snapshot survives app restarts.
+    (In-process llama-cpp only; an HTTP server keeps its own prompt cache.)
+
+    With grammar=True sampling is constrained to the DSL (see grammar.py).
+
+    Calls are serialized by an internal lock, so warm_up() can run on a
+    background thread while requests simply wait for it.
+
+    With result_cache=True (needs cache_dir) validated results are kept in
+    an SQLite cache keyed by normalized text + model/prompt/sampling hash.
+    With skeleton_cache=True requests that differ from a past one only in
+    numbers are answered by substitution (see skeleton.py), re-validated.
+    skeleton_writer=False keeps what it learns in memory and never writes
+    the file (pool workers: the parent is its only writer).
+    With fast_path=True requests the rule parser fully recognizes are built
+    from TEMPLATES directly (see templates/text_rules.py).
+    last_source tells where the last result came from:
+    rules|cache|skeleton|llm.
+
+    With retrieval_k > 0 the fixed few-shot block is replaced by the k
+    library examples most similar to the request (see retrieval.py) that
+    fit retrieval_budget tokens; only the rules are the cached prefix then.
+
+    output_format="compact" makes the model write the terse line format of
+    compact.py, expanded locally to the same JSON (far fewer decode tokens).
+
+    With n_ctx=None the context is the smallest bucket (budget.py) that fits
+    the fixed prompt + request_budget (+ retrieval_budget) + max_tokens.
+    A request that would still overflow loses retrieved examples first, then
+    output budget; last_budget holds the token counts of the last request.
+
+    speculative="prompt" (n-gram lookup in the prompt) or a path to a small
+    draft GGUF turns on speculative decoding, see speculative.py.
+
+    With repair_attempts > 0 a rejected answer is not thrown away: it stays
+    in the KV cache, a short error message is appended as the next user
+    turn and the model answers again, until it passes, the attempts are
+    used up or repair_seconds have passed. repair_stats() reports how often
+    that worked.
+
+    The generate_* calls take cancel=threading.Event(): once it is set,
+    decoding stops between tokens (the backend stream is closed) and
+    LLMCancelled is raised. generate_json_async wraps that for asyncio:
+    cancelling the task sets the event and frees the cores.
+
+    Every request leaves a timing row in last_timings (load, prepare,
+    prefill = time to the first token after the prompt is ready, ttft from
+    the call, decode tokens and tokens/s, parse and validation ms, see
+    metrics.py). Rows are appended to metrics_path (JSON lines) when given;
+    metrics_summary() has p50/p95 over the recent ones.
+
+    prompt_variant names the PromptBuilder (prompt.py) to use, a registered
+    one or prompts_dir/<name>.json; None is the built-in prompt. Its token
+    IDs are built once, and every cache is keyed by its prefix hash, so
+    variants can be switched for A/B runs without stale entries. Timing
+    rows carry the variant name.
     """
 
     def __init__(
         self,
         model_path: str,
         *,
-        n_ctx: int = 2048,
-        n_threads: int = 8,
+        n_ctx: int | None = None,
+        n_threads: int | None = None,
+        n_threads_batch: int | None = None,
+        n_batch: int | None = None,
         n_gpu_layers: int = 0,
+        cache_dir: str | None = None,
+        prefix_cache: bool = True,
+        grammar: bool = False,
+        use_mlock: bool = False,
+        result_cache: bool = False,
+        result_cache_max: int = 2000,
+        skeleton_cache: bool = False,
+        skeleton_writer: bool = True,
+        fast_path: bool = False,
+        retrieval_k: int = 0,
+        retrieval_budget: int = 700,
+        output_format: str = "json",
+        max_tokens: int = 900,
+        request_budget: int = 256,
+        speculative: str | None = None,
+        draft_tokens: int = 10,
+        repair_attempts: int = 0,
+        repair_seconds: float = 20.0,
+        backend: LLMBackend | None = None,
+        metrics_path: str | None = None,
+        prompt_variant: str | None = None,
+        prompts_dir: str | None = None,
     ):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{output_format}'.")
         self.model_path = model_path
         self.n_ctx = n_ctx
+        self.max_tokens = max_tokens
+        self.request_budget = request_budget
+        self.speculative = speculative
+        self.draft_tokens = draft_tokens
+        self.repair_attempts = repair_attempts
+        self.repair_seconds = repair_seconds
         self.n_threads = n_threads
+        self.n_threads_batch = n_threads_batch
+        self.n_batch = n_batch
         self.n_gpu_layers = n_gpu_layers
+        self.cache_dir = cache_dir
+        self.prefix_cache = prefix_cache
+        self.grammar = grammar
+        self.use_mlock = use_mlock
+        self.result_cache = result_cache
+        self.result_cache_max = result_cache_max
+        self.skeleton_cache = skeleton_cache
+        self.skeleton_writer = skeleton_writer
+        self.rules = RuleRouter() if fast_path else None
+        self.retrieval_k = retrieval_k
+        self.retrieval_budget = retrieval_budget
+        self.output_format = output_format
+        self.prompt = get_prompt(prompt_variant, prompts_dir)
 
-        self._llm = None
+        self.tuned = False
+        self._lock = threading.RLock()
+        self._backend = backend
+        self._loaded = False
+        self._prefix = None
+        self._results = None
+        self._skeletons = None
+        self._prefix_tokens = None
 
         self.last_raw = ""
         self.last_extracted = ""
         self.last_prompt = ""
+        self.last_prefix_source = ""
+        self.last_cache_hit = False
+        self.last_source = ""
+        self.last_batch_stats = {}
+        self.last_budget = {}
+        self.last_repairs = 0
+        self.repair_counts = {"failed": 0, "attempts": 0, "repaired": 0}
+        self.last_timings = {}
+        self.last_plan = {}
+        self.edit_base = None
+        self.load_ms = None
+        self.metrics = MetricsLog(metrics_path)
+        self._t_request = time.perf_counter()
+        self._plan_part = False
 
-    def _get_llm(self):
-        try:
-            from llama_cpp import Llama
-        except Exception as e:
-            raise RuntimeError(
-                "llama-cpp-python is not installed. Run: pip install llama-cpp-python"
-            ) from e
-
-        if self._llm is None:
-            p = Path(self.model_path)
-            if not p.exists():
-                raise RuntimeError(
-                    f"GGUF model not found: {p}\n"
-                    f"Put a GGUF model there or change LLM_MODEL_PATH."
-                )
-            self._llm = Llama(
-                model_path=str(p),
-                n_ctx=self.n_ctx,
+    def _backend_obj(self) -> LLMBackend:
+        if self._backend is None:
+            self._apply_profile()
+            self._backend = LlamaCppBackend(
+                self.model_path,
                 n_threads=self.n_threads,
+                n_threads_batch=self.n_threads_batch,
+                n_batch=self.n_batch,
                 n_gpu_layers=self.n_gpu_layers,
-                verbose=False,
+                use_mlock=self.use_mlock,
+                speculative=self.speculative,
+                draft_tokens=self.draft_tokens,
+            )
+        return self._backend
+
+    def _apply_profile(self):
+        """Settings left at None come from the autotune profile, if any."""
+        tuned = None
+        if self.cache_dir and Path(self.model_path).exists():
+            tuned = load_profile(self.cache_dir, model_fingerprint(self.model_path))
+        self.tuned = tuned is not None
+        keys = TUNED_KEYS if self.n_threads is None else ("n_batch",)
+        for key in keys:
+            if getattr(self, key) is None and tuned:
+                setattr(self, key, tuned.get(key))
+        if self.n_threads is None:
+            self.n_threads = cpu_topology()["physical"]
+
+    def _get_backend(self) -> LLMBackend:
+        """The backend, loaded; n_ctx is sized first when it is None."""
+        backend = self._backend_obj()
+        if not self._loaded:
+            t0 = time.perf_counter()
+            if self.n_ctx is None and backend.n_ctx is None:
+                self.n_ctx = pick_n_ctx(self._needed_ctx())
+            backend.load(self.n_ctx)
+            self.n_ctx = backend.n_ctx
+            self._loaded = True
+            self.load_ms = _ms(time.perf_counter() - t0)
+            self.last_timings["load_ms"] = self.load_ms
+        return backend
+
+    def _get_prefix_cache(self) -> PrefixCache:
+        if self._prefix is None:
+            import llama_cpp
+
+            key = "-".join(
+                [
+                    self._backend_obj().fingerprint(),
+                    f"p{self._prompt_hash()}",
+                    f"r{int(self.retrieval_k > 0)}",
+                    self.output_format,
+                    f"ctx{self.n_ctx}",
+                    f"d{int(bool(self.speculative))}",
+                    getattr(llama_cpp, "__version__", "0"),
+                ]
+            )
+            self._prefix = PrefixCache(key, self.cache_dir)
+        return self._prefix
+
+    def _get_result_cache(self) -> ResultCache | None:
+        if not (self.result_cache and self.cache_dir):
+            return None
+        if self._results is None:
+            self._results = ResultCache(
+                str(Path(self.cache_dir) / "results.sqlite"),
+                self._result_key(),
+                max_entries=self.result_cache_max,
             )
-        return self._llm
+        return self._results
 
-    def generate_json(self, user_text: str) -> dict:
-        llm = self._get_llm()
-        prompt = make_llm_prompt(user_text)
+    def _result_key(self) -> str:
+        """What a stored result depends on: model, prompt, schema, sampling."""
+        kw = self._completion_kwargs()
+        kw["max_tokens"] = self.max_tokens
+        return "|".join(
+            [
+                self._backend_obj().fingerprint(),
+                f"p{self._prompt_hash()}",
+                f"s{SCHEMA_VERSION}",
+                f"t{kw['temperature']}",
+                f"m{kw['max_tokens']}",
+                f"g{int(self.grammar)}",
+                f"r{self.retrieval_k}",
+                self.output_format,
+            ]
+        )
+
+    def _get_skeleton_cache(self) -> SkeletonCache | None:
+        if not self.skeleton_cache:
+            return None
+        if self._skeletons is None:
+            path = None
+            if self.cache_dir:
+                # one file per result key: learned mappings are model output too
+                key = hashlib.sha256(self._result_key().encode()).hexdigest()[:12]
+                path = str(Path(self.cache_dir) / f"skeletons-{key}.json")
+            self._skeletons = SkeletonCache(path, writable=self.skeleton_writer)
+        return self._skeletons
+
+    def _lookup(self, user_text: str) -> dict | None:
+        """Result without the model: rules, exact cache hit or skeleton."""
+        self.last_source = "llm"
+        self.last_cache_hit = False
+        self.last_budget = {}
+        data = self.rules.route(user_text) if self.rules is not None else None
+        if data is not None:
+            self.last_source = "rules"
+            self.last_raw = self.last_extracted = json.dumps(data, ensure_ascii=False)
+            self.last_prompt = ""
+            return data
+
+        cache = self._get_result_cache()
+        data = cache.get(user_text) if cache is not None else None
+        self.last_cache_hit = data is not None
+        if data is not None:
+            self.last_source = "cache"
+        else:
+            skeletons = self._get_skeleton_cache()
+            data = skeletons.synthesize(user_text) if skeletons is not None else None
+            if data is not None:
+                try:
+                    validate_generated_json(data)
+                    self.last_source = "skeleton"
+                except ValueError:
+                    data = None
+
+        if data is not None:
+            self.last_raw = self.last_extracted = json.dumps(data, ensure_ascii=False)
+            self.last_prompt = self.prompt.prompt(
+                user_text, self._examples(user_text), self.output_format
+            )
+        return data
 
-        out = llm.create_chat_completion(
-            messages=[
-                {"role": "system", "content": "You output ONLY JSON. No extra text."},
-                {"role": "user", "content": prompt},
-            ],
+    def _remember(self, user_text: str, data: dict):
+        """Stores a validated model result for later lookups."""
+        cache = self._get_result_cache()
+        if cache is not None:
+            cache.put(user_text, data)
+        skeletons = self._get_skeleton_cache()
+        if skeletons is not None:
+            skeletons.learn(user_text, data)
+
+    def last_report(self) -> dict:
+        """Copies of the last_* fields and the stats of the last run."""
+        with self._lock:
+            return {
+                "raw": self.last_raw,
+                "extracted": self.last_extracted,
+                "prompt": self.last_prompt,
+                "budget": dict(self.last_budget),
+                "timings": dict(self.last_timings),
+                "plan": dict(self.last_plan),
+                "repairs": self.last_repairs,
+                "source": self.last_source,
+                "stats": self.cache_stats(),
+                "summary": self.metrics_summary(),
+            }
+
+    def cache_stats(self) -> str:
+        parts = []
+        if self.rules is not None:
+            parts.append("rules " + self.rules.stats())
+        if self._results is not None:
+            parts.append("results " + self._results.stats())
+        if self._skeletons is not None:
+            parts.append("skeletons " + self._skeletons.stats())
+        if self.repair_attempts > 0:
+            parts.append("repair " + self.repair_stats())
+        return ", ".join(parts)
+
+    def repair_stats(self) -> str:
+        c = self.repair_counts
+        rate = c["repaired"] / c["failed"] if c["failed"] else 0.0
+        return (
+            f"repaired={c['repaired']}/{c['failed']} ({rate:.0%}), "
+            f"attempts={c['attempts']}"
+        )
+
+    def _examples(self, user_text: str, backend=None) -> list[dict] | None:
+        """Retrieved few-shot examples, or None for the fixed prompt."""
+        if self.retrieval_k <= 0:
+            return None
+
+        def count(text: str) -> int:
+            return len(backend.tokenize(text))
+
+        return select_examples(
+            user_text,
+            k=self.retrieval_k,
+            token_budget=self.retrieval_budget,
+            count_tokens=count if backend is not None else None,
+        )
+
+    def _prompt_hash(self) -> str:
+        return self.prompt.prefix_hash(self.output_format, self.retrieval_k > 0)
+
+    def _system(self) -> str:
+        return self.prompt.system_prompt(self.output_format)
+
+    def _fixed_tokens(self, backend) -> tuple[list[int], list[int]]:
+        """(head, tail) tokens of the rendered chat around the suffix."""
+        return self.prompt.tokens(backend, self.output_format, self.retrieval_k > 0)
+
+    def _fixed_token_count(self) -> int:
+        """Tokens of the fixed prompt, counted once per model + prompt version."""
+        backend = self._backend_obj()
+        key = "|".join(
+            [
+                backend.fingerprint(),
+                f"p{self._prompt_hash()}",
+                f"r{int(self.retrieval_k > 0)}",
+                self.output_format,
+            ]
+        )
+        counts = TokenCounts(self.cache_dir)
+        n = counts.get(key)
+        if n is None:
+            # works before load(): llama-cpp uses a vocab-only model for it
+            head, tail = self._fixed_tokens(backend)
+            n = len(head) + len(tail)
+            counts.put(key, n)
+        return n
+
+    def _needed_ctx(self) -> int:
+        request = self.request_budget
+        if self.retrieval_k > 0:
+            request += self.retrieval_budget
+        return self._fixed_token_count() + request + self.max_tokens
+
+    def _prompt_tokens(self, backend, user_text: str, examples=None) -> list[int]:
+        """Tokens of the rendered chat: cached prefix + tokenized suffix."""
+        self._prefix_tokens, tail = self._fixed_tokens(backend)
+        suffix = self.prompt.suffix(user_text, examples, self.output_format)
+        return self._prefix_tokens + backend.tokenize(suffix) + tail
+
+    def _prepare(self, user_text: str):
+        backend = self._get_backend()
+        t0 = time.perf_counter()
+        examples = self._examples(user_text, backend)
+        tokens = self._prompt_tokens(backend, user_text, examples)
+        trimmed = 0
+        while examples and len(tokens) + self.max_tokens > self.n_ctx:
+            examples = examples[:-1]
+            trimmed += 1
+            tokens = self._prompt_tokens(backend, user_text, examples)
+        prompt = self.prompt.prompt(user_text, examples, self.output_format)
+
+        free = self.n_ctx - len(tokens)
+        if free <= 0:
+            raise ValueError(
+                f"Prompt has {len(tokens)} tokens, it does not fit n_ctx={self.n_ctx}."
+            )
+        self.last_budget = {
+            "n_ctx": self.n_ctx,
+            "prefix_tokens": len(self._prefix_tokens),
+            "request_tokens": len(tokens) - len(self._prefix_tokens),
+            "prompt_tokens": len(tokens),
+            "max_tokens": min(self.max_tokens, free),
+            "trimmed_examples": trimmed,
+        }
+        warnings = []
+        if trimmed:
+            warnings.append(
+                f"{trimmed} retrieved example(s) dropped to fit n_ctx={self.n_ctx}"
+            )
+        if free < self.max_tokens:
+            warnings.append(
+                f"output budget cut to {free} tokens to fit n_ctx={self.n_ctx}"
+            )
+        if warnings:
+            self.last_budget["warnings"] = warnings
+
+        llm = getattr(backend, "llm", None)
+        if self.prefix_cache and llm is not None:
+            # llama-cpp only re-evaluates tokens after the common prefix
+            self.last_prefix_source = self._get_prefix_cache().prepare(
+                llm, self._prefix_tokens
+            )
+            self.last_timings["prefix"] = self.last_prefix_source
+        self.last_timings["prepare_ms"] = _ms(time.perf_counter() - t0)
+        return backend, prompt, tokens
+
+    def _completion_kwargs(self) -> dict:
+        return dict(
             temperature=0.0,
-            max_tokens=900,
+            max_tokens=self.last_budget.get("max_tokens", self.max_tokens),
+            stop=CHAT_STOP,
+            grammar=grammar_text(self.output_format) if self.grammar else None,
         )
 
-        raw = out["choices"][0]["message"]["content"] or ""
-        extracted = extract_json_object(raw.strip())
+    def warm_up(self, progress=None):
+        """
+        Loads the model, evaluates the prompt prefix and runs a throwaway
+        generation so weights and prefix cache are hot before the first
+        request. progress(stage) is called with "load", "prefix", "generate",
+        "ready".
+        """
+
+        def report(stage):
+            if progress is not None:
+                progress(stage)
+
+        with self._lock:
+            self.last_timings = {}
+            report("load")
+            backend = self._get_backend()
+            report("prefix")
+            _, _, tokens = self._prepare("куб 10")
+            report("generate")
+            kwargs = self._completion_kwargs()
+            kwargs["max_tokens"] = 8
+            kwargs["grammar"] = None
+            backend.complete(tokens, **kwargs)
+            report("ready")
+
+    def generate_json(self, user_text: str, *, cancel=None) -> dict:
+        with self._lock, self._timed_request(user_text):
+            _check_cancel(cancel)
+            data = self._lookup(user_text)
+            if data is None:
+                data = self._generate(user_text, cancel)
+            self.edit_base = (user_text, data)
+            return data
 
+    async def generate_json_async(
+        self,
+        user_text: str,
+        *,
+        on_step=None,
+        stream: bool = True,
+        plan: bool = False,
+        pool=None,
+        edit: bool = False,
+        edit_base: tuple | None = None,
+    ) -> tuple[dict, dict]:
+        """
+        generate_json (generate_json_stream with stream=True,
+        generate_json_planned with plan=True, edit_json with edit=True:
+        user_text is the edit and edit_base its base then) on a worker
+        thread; returns (data, last_report()). The report is taken under
+        the same lock as the run, so a concurrent request cannot mix its
+        fields in; a failed run's LLMJSONError carries it as .report.
+        Cancelling the awaiting task stops decoding at the next token; the
+        coroutine returns only after the worker has let go of the model.
+        """
+        cancel = threading.Event()
+        if edit:
+            call = functools.partial(
+                self.edit_json, user_text, base=edit_base, cancel=cancel
+            )
+        elif plan:
+            call = functools.partial(
+                self.generate_json_planned, user_text, pool=pool, cancel=cancel
+            )
+        elif stream:
+            call = functools.partial(
+                self.generate_json_stream, user_text, on_step=on_step, cancel=cancel
+            )
+        else:
+            call = functools.partial(self.generate_json, user_text, cancel=cancel)
+
+        def run():
+            with self._lock:
+                self.last_plan = {}
+                try:
+                    data = call()
+                except LLMJSONError as e:
+                    e.report = self.last_report()
+                    raise
+                return data, self.last_report()
+
+        fut = asyncio.get_running_loop().run_in_executor(None, run)
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            cancel.set()
+            try:
+                await fut
+            except Exception:
+                pass
+            raise
+
+    def edit_json(self, instruction: str, *, base=None, cancel=None) -> dict:
+        """
+        Edits base = (request text, validated JSON), by default the last
+        result (edit_base): the conversation that produced it
+        stays in context with the validated JSON as the model's answer, the
+        edit is the next user turn and the model replies with a JSON Patch
+        (patch.py) that is applied and re-validated locally. Only the patch
+        is decoded; llama-cpp reuses the cached prompt prefix.
+        """
+        with self._lock, self._timed_request(instruction):
+            _check_cancel(cancel)
+            base = base or self.edit_base
+            if base is None:
+                raise ValueError("Nothing to edit: generate a model first.")
+            text, base = base
+            self.last_source = "edit"
+            backend, prompt, tokens = self._prepare(text)
+            answer = json.dumps(base, ensure_ascii=False, separators=(",", ":"))
+            turn = reply_turn(
+                backend, self._system(), prompt, make_edit_message(instruction)
+            )
+            tokens = (
+                tokens
+                + backend.tokenize(answer)
+                + backend.tokenize(turn, special=True)
+            )
+            kwargs = self._completion_kwargs()
+            kwargs["grammar"] = patch_grammar_text() if self.grammar else None
+            kwargs["max_tokens"] = min(kwargs["max_tokens"], self.n_ctx - len(tokens))
+            if kwargs["max_tokens"] <= 0:
+                raise ValueError(
+                    f"Edit prompt has {len(tokens)} tokens, "
+                    f"it does not fit n_ctx={self.n_ctx}."
+                )
+            self.last_budget["prompt_tokens"] = len(tokens)
+
+            raw = self._complete(backend, tokens, kwargs, cancel)
+            data = self._apply_edit(base, raw, prompt + "\n" + answer)
+            self.edit_base = (text, data)
+            return data
+
+    def _apply_edit(self, base: dict, raw: str, prompt: str) -> dict:
+        t = self.last_timings
+        n = len(self._backend.tokenize(raw))
+        self.last_budget["output_tokens"] = n
+        t["decode_tokens"] = t.get("decode_tokens", 0) + n
+
+        t0 = time.perf_counter()
+        try:
+            data = normalize_generated_json(apply_patch(base, parse_patch(raw)))
+        except Exception as e:
+            self.last_raw, self.last_extracted, self.last_prompt = raw, "", prompt
+            raise LLMJSONError(str(e), raw=raw, prompt=prompt)
+        finally:
+            t["validate_ms"] = _ms(time.perf_counter() - t0)
+        self.last_raw = raw
+        self.last_extracted = json.dumps(data, ensure_ascii=False)
+        self.last_prompt = prompt
+        return data
+
+    def generate_json_planned(self, user_text: str, *, pool=None, cancel=None):
+        """Plan-then-detail generation, see plan.py; last_plan has the plan."""
+        from .plan import generate_planned
+
+        with self._lock:
+            t0 = time.perf_counter()
+            self._plan_part = True
+            error = None
+            try:
+                return generate_planned(self, user_text, pool=pool, cancel=cancel)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                # the detail calls logged rows of their own (marked plan_part);
+                # this row covers the whole request
+                self._plan_part = False
+                self._t_request = t0
+                self.last_timings = {
+                    k: v for k, v in self.last_plan.items() if k.endswith("_ms")
+                }
+                self._record(user_text, error)
+
+    def complete_chat(
+        self, system: str, user: str, *, grammar=None, max_tokens=256, cancel=None
+    ) -> str:
+        """
+        One free-form chat completion (greedy) outside the DSL prompt, e.g.
+        the planning call of plan.py. grammar is GBNF text or None.
+        """
+        with self._lock:
+            backend = self._get_backend()
+            text = render_chat(backend, system, user)
+            tokens = backend.tokenize(text, add_bos=True, special=True)
+            max_tokens = min(max_tokens, self.n_ctx - len(tokens))
+            if max_tokens <= 0:
+                raise ValueError(
+                    f"Prompt has {len(tokens)} tokens, "
+                    f"it does not fit n_ctx={self.n_ctx}."
+                )
+            kwargs = dict(
+                temperature=0.0, max_tokens=max_tokens, stop=CHAT_STOP, grammar=grammar
+            )
+            return self._complete(backend, tokens, kwargs, cancel)
+
+    def _generate(self, user_text: str, cancel=None) -> dict:
+        backend, prompt, tokens = self._prepare(user_text)
+        raw = self._complete(backend, tokens, self._completion_kwargs(), cancel)
+        try:
+            data = self._finish(raw, prompt)
+        except (LLMJSONError, ValueError) as e:
+            data = self._repair(backend, prompt, tokens, raw, e, cancel)
+        self._remember(user_text, data)
+        return data
+
+    def _complete(self, backend, tokens, kwargs: dict, cancel=None) -> str:
+        """The whole answer, streamed to time it and to check cancel per token."""
+        _check_cancel(cancel)
+        chunks = self._timed(backend.stream(tokens, **kwargs))
+        parts = []
+        try:
+            for chunk in chunks:
+                _check_cancel(cancel)
+                parts.append(chunk)
+        finally:
+            # closing the generator stops decoding
+            chunks.close()
+        return "".join(parts)
+
+    def _timed(self, chunks):
+        """Passes chunks through; records prefill/ttft and adds up decode ms."""
+        t = self.last_timings
+        t0 = time.perf_counter()
+        first = None
+        try:
+            for chunk in chunks:
+                if first is None:
+                    first = time.perf_counter()
+                    t.setdefault("prefill_ms", _ms(first - t0))
+                    t.setdefault("ttft_ms", _ms(first - self._t_request))
+                yield chunk
+        finally:
+            if first is not None:
+                decode = _ms(time.perf_counter() - first)
+                t["decode_ms"] = t.get("decode_ms", 0.0) + decode
+            chunks.close()
+
+    @contextlib.contextmanager
+    def _timed_request(self, user_text: str):
+        """Starts last_timings for one request and logs the row at the end."""
+        self._t_request = time.perf_counter()
+        self.last_timings = {}
+        self.last_repairs = 0
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._record(user_text, error)
+
+    def _record(self, user_text: str, error):
+        t = self.last_timings
+        row = {
+            "ts": round(time.time(), 3),
+            "request": user_text[:200],
+            "source": self.last_source,
+            "ok": error is None,
+            "error": type(error).__name__ if error is not None else None,
+            "load_ms": 0.0,
+            "prompt_tokens": self.last_budget.get("prompt_tokens", 0),
+            "repairs": self.last_repairs,
+            "prompt": self.prompt.name,
+        }
+        if self._plan_part:
+            row["plan_part"] = True
+        row.update(t)
+        if t.get("decode_ms"):
+            row["tokens_per_s"] = round(
+                t.get("decode_tokens", 0) / (t["decode_ms"] / 1000.0), 1
+            )
+        row["total_ms"] = _ms(time.perf_counter() - self._t_request)
+        self.last_timings = row
+        self.metrics.append(dict(row))
+
+    def metrics_summary(self) -> str:
+        return self.metrics.summary()
+
+    def _answer_tokens(self, backend, tokens, raw: str) -> list[int] | None:
+        """Tokens of the last answer as they sit in the context after `tokens`."""
+        llm = getattr(backend, "llm", None)
+        if llm is None:
+            # a server re-tokenizes; its own prompt cache reuses the prefix
+            return backend.tokenize(raw)
+        if list(llm.input_ids[: len(tokens)]) != list(tokens):
+            return None  # the context no longer holds this conversation
+        answer = list(llm.input_ids[len(tokens) : llm.n_tokens])
+        # the last sampled token is never evaluated: add what is missing
+        done = llm.detokenize(answer).decode("utf-8", errors="ignore")
+        if raw.startswith(done) and len(raw) > len(done):
+            answer += backend.tokenize(raw[len(done) :])
+        return answer
+
+    def _repair(
+        self, backend, prompt: str, tokens: list[int], raw: str, error, cancel=None
+    ):
+        """
+        Asks for a corrected answer in the same context; only the error
+        message and the new answer are evaluated. Re-raises the last error
+        when repair is off, out of attempts, time or context.
+        """
+        self.last_repairs = 0
+        if self.repair_attempts <= 0:
+            raise error
+        self.repair_counts["failed"] += 1
+        deadline = time.perf_counter() + self.repair_seconds
+        fmt = self.output_format
+        system = self._system()
+
+        for _ in range(self.repair_attempts):
+            answer = self._answer_tokens(backend, tokens, raw)
+            if answer is None or time.perf_counter() >= deadline:
+                break
+            # a SchemaError lists every problem: all get fixed in one round
+            message = make_repair_message(str(error)[:600], fmt)
+            turn = reply_turn(backend, system, prompt, message)
+            tokens = tokens + answer + backend.tokenize(turn, special=True)
+            kwargs = self._completion_kwargs()
+            kwargs["max_tokens"] = min(kwargs["max_tokens"], self.n_ctx - len(tokens))
+            if kwargs["max_tokens"] <= 0:
+                break
+
+            self.last_repairs += 1
+            self.repair_counts["attempts"] += 1
+            raw = self._complete(backend, tokens, kwargs, cancel)
+            try:
+                data = self._finish(raw, prompt)
+            except (LLMJSONError, ValueError) as e:
+                error = e
+                continue
+            self.repair_counts["repaired"] += 1
+            return data
+        raise error
+
+    def generate_json_batch(self, texts) -> list:
+        """
+        Runs many requests over the shared prompt prefix (evaluated once).
+        Returns a list in input order: dict on success, LLMJSONError otherwise.
+        Aggregate numbers go to last_batch_stats.
+
+        llama-cpp-python has no public multi-sequence decode, so items are
+        decoded one after another; each one only prefills its own user text.
+        For parallel decoding use the worker pool.
+        """
+        results = []
+        prompt_tokens = completion_tokens = 0
+        t0 = time.perf_counter()
+
+        with self._lock:
+            for text in texts:
+                try:
+                    with self._timed_request(text):
+                        data = self._lookup(text)
+                        if data is not None:
+                            results.append(data)
+                            continue
+                        try:
+                            results.append(self._generate(text))
+                        finally:
+                            b = self.last_budget
+                            prompt_tokens += b.get("request_tokens", 0)
+                            completion_tokens += b.get("output_tokens", 0)
+                except LLMJSONError as e:
+                    results.append(e)
+                except ValueError as e:
+                    # extract_json_object: no JSON object at all
+                    results.append(LLMJSONError(str(e)))
+
+        elapsed = time.perf_counter() - t0
+        self.last_batch_stats = {
+            "items": len(results),
+            "ok": sum(1 for r in results if isinstance(r, dict)),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "seconds": elapsed,
+            "tokens_per_s": completion_tokens / elapsed if elapsed > 0 else 0.0,
+        }
+        return results
+
+    def generate_json_stream(
+        self, user_text: str, on_step=None, *, cancel=None
+    ) -> dict:
+        """
+        Same contract as generate_json, but tokens are parsed as they arrive:
+        on_step(index, step) gets every completed step, generation stops once
+        the root object closes and aborts at the first invalid step.
+        """
+
+        def emit(i, step):
+            normalize_step(step)
+            if on_step is not None:
+                on_step(i, step)
+
+        with self._lock, self._timed_request(user_text):
+            _check_cancel(cancel)
+            data = self._lookup(user_text)
+            if data is None and self.output_format == "compact":
+                # the compact script is short, no incremental parser for it
+                data = self._generate(user_text, cancel)
+            if data is not None:
+                for i, step in enumerate(data["steps"]):
+                    emit(i, step)
+                self.edit_base = (user_text, data)
+                return data
+
+            backend, prompt, tokens = self._prepare(user_text)
+            parser = IncrementalStepParser(on_step=emit)
+            chunks = self._timed(backend.stream(tokens, **self._completion_kwargs()))
+            error = None
+            try:
+                for chunk in chunks:
+                    _check_cancel(cancel)
+                    if parser.feed(chunk):
+                        break
+            except StreamAbort as e:
+                raw = parser.text
+                self.last_raw, self.last_extracted, self.last_prompt = raw, "", prompt
+                error = LLMJSONError(str(e), raw=raw, prompt=prompt)
+            finally:
+                # closing the generator stops decoding
+                chunks.close()
+
+            try:
+                if error is not None:
+                    raise error
+                data = self._finish(parser.text, prompt)
+            except (LLMJSONError, ValueError) as e:
+                data = self._repair(backend, prompt, tokens, parser.text, e, cancel)
+                # the streamed steps were rejected, show the repaired ones
+                for i, step in enumerate(data["steps"]):
+                    emit(i, step)
+            self._remember(user_text, data)
+            self.edit_base = (user_text, data)
+            return data
+
+    def _finish(self, raw: str, prompt: str) -> dict:
+        t = self.last_timings
+        if self.last_budget and self._loaded:
+            out = self._backend.tokenize(raw)
+            self.last_budget["output_tokens"] = len(out)
+            t["decode_tokens"] = t.get("decode_tokens", 0) + len(out)
+
+        t0 = time.perf_counter()
         try:
-            data = json.loads(extracted)
+            data, extracted = self._parse(raw, prompt)
+        finally:
+            t1 = time.perf_counter()
+            t["parse_ms"] = t.get("parse_ms", 0.0) + _ms(t1 - t0)
+
+        try:
+            normalize_generated_json(data)
         except Exception as e:
             self.last_raw, self.last_extracted, self.last_prompt = (
                 raw,
@@ -80,17 +944,23 @@ class LocalLLMEngine:
                 prompt,
             )
             raise LLMJSONError(str(e), raw=raw, extracted=extracted, prompt=prompt)
+        finally:
+            t["validate_ms"] = t.get("validate_ms", 0.0) + _ms(time.perf_counter() - t1)
+
+        self.last_raw, self.last_extracted, self.last_prompt = raw, extracted, prompt
+        return data
 
-        # normalize (same behavior as your file)
-        for st in data.get("steps", []):
-            act = (st.get("action") or "").lower().strip()
-            if act == "sketch_on_plane" and not (
-                st.get("plane") or st.get("plane_name") or st.get("on_plane")
-            ):
-                st["plane"] = "XOY"
+    def _parse(self, raw: str, prompt: str) -> tuple[dict, str]:
+        if self.output_format == "compact":
+            extracted = raw.strip()
+        else:
+            extracted = extract_json_object(raw.strip())
 
         try:
-            validate_generated_json(data)
+            if self.output_format == "compact":
+                data = expand_compact(extracted)
+            else:
+                data = json.loads(extracted)
         except Exception as e:
             self.last_raw, self.last_extracted, self.last_prompt = (
                 raw,
@@ -98,6 +968,13 @@ class LocalLLMEngine:
                 prompt,
             )
             raise LLMJSONError(str(e), raw=raw, extracted=extracted, prompt=prompt)
+        return data, extracted
 
-        self.last_raw, self.last_extracted, self.last_prompt = raw, extracted, prompt
-        return data
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000.0, 2)
+
+
+def _check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise LLMCancelled("Generation cancelled.")
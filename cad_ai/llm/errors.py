@@ -8,3 +8,25 @@ class LLMJSONError(Exception):
         self.raw = raw or ""
         self.extracted = extracted or ""
         self.prompt = prompt or ""
+        # engine.last_report() of the failed run, set by generate_json_async
+        self.report = {}
+
+
+class LLMCancelled(Exception):
+    """Raised when a generation is cancelled before it finished."""
+
+
+class SchemaError(ValueError):
+    """
+    The JSON breaks the DSL schema. errors holds every problem found as
+    (JSON pointer, message), e.g. ("/steps/2/height", "is required").
+    """
+
+    shown = 10
+
+    def __init__(self, errors: list[tuple[str, str]]):
+        self.errors = list(errors)
+        text = "; ".join(f"{p or '/'}: {m}" for p, m in self.errors[: self.shown])
+        if len(self.errors) > self.shown:
+            text += f"; ... {len(self.errors) - self.shown} more"
+        super().__init__(text)
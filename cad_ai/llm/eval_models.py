@@ -0,0 +1,219 @@
+# cad_ai/llm/eval_models.py
+"""
+Golden-set evaluation of every GGUF in a directory, for picking a model.
+
+    python -m cad_ai.llm.eval_models [--models-dir models] [--out table.md]
+                                     [--min-match 0.9] [--threads N]
+
+Runs the versioned corpus data/golden_v<GOLDEN_VERSION>.jsonl (Russian
+descriptions + expected JSON) against each model in its own process, with
+caches and the rule fast path off, and reports per model: load time,
+latency p50/p95, peak RSS, the share of answers that pass
+validate_generated_json, structural match (same steps, actions and entity
+types as expected) and value match (structure plus all numbers within
+--tol). The smallest model whose structural match reaches --min-match is
+named at the end. --out writes the table as Markdown (.csv: CSV).
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from cad_ai.config import (
+    LLM_GRAMMAR,
+    LLM_OUTPUT_FORMAT,
+    LLM_RETRIEVAL_BUDGET,
+    LLM_RETRIEVAL_K,
+)
+
+from .metrics import percentile
+
+GOLDEN_VERSION = 1
+GOLDEN_PATH = Path(__file__).with_name("data") / f"golden_v{GOLDEN_VERSION}.jsonl"
+
+COLUMNS = [
+    ("model", "{}"),
+    ("size_mb", "{:.0f}"),
+    ("load_s", "{:.2f}"),
+    ("p50_s", "{:.2f}"),
+    ("p95_s", "{:.2f}"),
+    ("peak_rss_mb", "{:.0f}"),
+    ("valid", "{:.0%}"),
+    ("structure", "{:.0%}"),
+    ("values", "{:.0%}"),
+]
+
+
+def load_golden(path: Path = GOLDEN_PATH) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def structure(data: dict) -> list[tuple]:
+    """Per step: the action and the sorted entity types of its sketch."""
+    out = []
+    for st in data.get("steps", []):
+        types = sorted(e.get("type", "") for e in st.get("entities") or [])
+        out.append((st.get("action"), tuple(types)))
+    return out
+
+
+def _numbers(obj) -> list[float]:
+    if isinstance(obj, bool):
+        return []
+    if isinstance(obj, (int, float)):
+        return [float(obj)]
+    if isinstance(obj, dict):
+        return [x for k in sorted(obj) for x in _numbers(obj[k])]
+    if isinstance(obj, list):
+        return [x for v in obj for x in _numbers(v)]
+    return []
+
+
+def compare(got: dict, expected: dict, tol: float = 0.01) -> tuple[bool, bool]:
+    """(structure matches, structure and every number within tol match)."""
+    if structure(got) != structure(expected):
+        return False, False
+    a, b = _numbers(got.get("steps")), _numbers(expected.get("steps"))
+    values = len(a) == len(b) and all(abs(x - y) <= tol for x, y in zip(a, b))
+    return True, values
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident memory of this process, MB (None if unknown)."""
+    try:
+        import psutil
+
+        peak = getattr(psutil.Process().memory_info(), "peak_wset", None)
+        if peak:  # Windows
+            return peak / 2**20
+    except Exception:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def evaluate_model(model_path: str, items: list[dict], *, threads=None, tol=0.01):
+    """Runs the corpus on one model in this process; returns one table row."""
+    from .engine import LocalLLMEngine
+    from .errors import LLMJSONError
+
+    eng = LocalLLMEngine(
+        model_path,
+        n_threads=threads,
+        grammar=LLM_GRAMMAR,
+        retrieval_k=LLM_RETRIEVAL_K,
+        retrieval_budget=LLM_RETRIEVAL_BUDGET,
+        output_format=LLM_OUTPUT_FORMAT,
+    )
+    t0 = time.perf_counter()
+    eng._get_backend()
+    load_s = time.perf_counter() - t0
+    eng.warm_up()
+
+    latencies, valid, struct, values = [], 0, 0, 0
+    for item in items:
+        t0 = time.perf_counter()
+        try:
+            data = eng.generate_json(item["text"])
+        except (LLMJSONError, ValueError):
+            data = None
+        latencies.append(time.perf_counter() - t0)
+        if data is None:
+            continue
+        valid += 1
+        s, v = compare(data, item["json"], tol)
+        struct += s
+        values += v
+
+    n = len(items)
+    return {
+        "model": Path(model_path).name,
+        "size_mb": Path(model_path).stat().st_size / 2**20,
+        "load_s": load_s,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "peak_rss_mb": peak_rss_mb(),
+        "valid": valid / n,
+        "structure": struct / n,
+        "values": values / n,
+    }
+
+
+def _cell(fmt: str, value) -> str:
+    return "-" if value is None else fmt.format(value)
+
+
+def write_table(rows: list[dict], path: str):
+    names = [c for c, _ in COLUMNS]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            w = csv.DictWriter(f, fieldnames=names)
+            w.writeheader()
+            w.writerows({k: r.get(k) for k in names} for r in rows)
+            return
+        f.write(f"Golden set v{GOLDEN_VERSION}\n\n")
+        f.write("| " + " | ".join(names) + " |\n")
+        f.write("|" + "---|" * len(names) + "\n")
+        for r in rows:
+            cells = [_cell(fmt, r.get(k)) for k, fmt in COLUMNS]
+            f.write("| " + " | ".join(cells) + " |\n")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--models-dir", default="models")
+    ap.add_argument("--golden", default=str(GOLDEN_PATH))
+    ap.add_argument(
+        "--threads", type=int, default=None, help="default: physical cores"
+    )
+    ap.add_argument("--tol", type=float, default=0.01, help="mm, for values")
+    ap.add_argument("--min-match", type=float, default=0.9)
+    ap.add_argument("--out", default=None, help="table file (.md or .csv)")
+    args = ap.parse_args(argv)
+
+    items = load_golden(Path(args.golden))
+    models = sorted(Path(args.models_dir).glob("*.gguf"))
+    if not models:
+        raise SystemExit(f"No GGUF models in {args.models_dir}")
+
+    print(f"{len(items)} golden items, {len(models)} model(s)")
+    print(" ".join(f"{c:>12}" for c, _ in COLUMNS))
+    rows = []
+    for model in models:
+        # own process per model: peak RSS is per model, memory is returned
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+            row = ex.submit(
+                evaluate_model,
+                str(model),
+                items,
+                threads=args.threads,
+                tol=args.tol,
+            ).result()
+        rows.append(row)
+        print(" ".join(f"{_cell(fmt, row[k])[-12:]:>12}" for k, fmt in COLUMNS))
+
+    if args.out:
+        write_table(rows, args.out)
+
+    passing = [r for r in rows if r["structure"] >= args.min_match]
+    if passing:
+        best = min(passing, key=lambda r: r["size_mb"])
+        print(f"Smallest model with structure >= {args.min_match:.0%}: {best['model']}")
+    else:
+        print(f"No model reaches structure >= {args.min_match:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import hashlib
+from pathlib import Path
+
+_CHUNK = 1 << 20
+
+
+def model_fingerprint(model_path: str) -> str:
+    """
+    Cheap identity of a GGUF file: size + mtime + first/last MiB.
+    Hashing the whole multi-GB file on every start would cost more than it saves.
+    """
+    p = Path(model_path)
+    st = p.stat()
+    h = hashlib.sha256()
+    h.update(f"{p.name}:{st.st_size}:{st.st_mtime_ns}".encode())
+    with p.open("rb") as f:
+        h.update(f.read(_CHUNK))
+        if st.st_size > _CHUNK:
+            f.seek(max(_CHUNK, st.st_size - _CHUNK))
+            h.update(f.read(_CHUNK))
+    return h.hexdigest()[:16]
@@ -0,0 +1,169 @@
+# cad_ai/llm/grammar.py
+"""
+GBNF grammar for the JSON DSL, generated from schema.py.
+llama-cpp can then only sample valid DSL, and decoding stops as soon as
+the root object closes. compact_grammar_text() does the same for the
+compact line format.
+"""
+
+from functools import lru_cache
+
+from .schema import ACTIONS, DIRECTIONS, ENTITIES, PLANES, SCHEMA_VERSION
+
+_KIND_RULES = {
+    "number": "number",
+    "point": "point",
+    "plane": "plane",
+    "plane_ref": "plane-ref",
+    "direction": "direction",
+    "bool": "boolean",
+    "string": "string",
+    "entities": "entities",
+}
+
+_BASE_RULES = r"""
+point ::= "[" ws number ws "," ws number ws "]"
+number ::= "-"? [0-9]+ ("." [0-9]+)?
+boolean ::= "true" | "false"
+string ::= "\"" [^"\\\x00-\x1f]* "\""
+plane-ref ::= plane | string
+""".strip()
+
+# whitespace between JSON tokens, bounded: a model that keeps sampling
+# spaces or newlines cannot spend max_tokens on them
+_WS_RULE = r"ws ::= [ \t\n]{0,20}"
+# the line formats have no free whitespace; their free text is bounded the
+# same way
+_TEXT_MAX = 200
+
+_grammars = {}
+
+
+def _lit(s: str) -> str:
+    # GBNF literal for the JSON string "s"
+    return '"\\"' + s + '\\""'
+
+
+def _enum(values) -> str:
+    return " | ".join(_lit(v) for v in values)
+
+
+def _key(name: str) -> str:
+    return f'ws "," ws {_lit(name)} ws ":" ws'
+
+
+def _object(head: str, fields) -> str:
+    parts = ['"{" ws', head]
+    for f in fields:
+        item = f"{_key(f.name)} {_KIND_RULES[f.kind]}"
+        parts.append(item if f.required else f"({item})?")
+    parts.append('ws "}"')
+    return " ".join(parts)
+
+
+@lru_cache(maxsize=None)
+def dsl_grammar_text(schema_version: str = SCHEMA_VERSION) -> str:
+    if schema_version != SCHEMA_VERSION:
+        raise ValueError(f"Unknown schema version '{schema_version}'.")
+
+    root_head = f'{_lit("name")} ws ":" ws string {_key("steps")}'
+    lines = [
+        f'root ::= "{{" ws {root_head} "[" ws step (ws "," ws step)* ws "]" ws "}}"',
+        "step ::= " + " | ".join(f"step-{a.replace('_', '-')}" for a in ACTIONS),
+    ]
+    for action, fields in ACTIONS.items():
+        head = f'{_lit("action")} ws ":" ws {_lit(action)}'
+        lines.append(f"step-{action.replace('_', '-')} ::= {_object(head, fields)}")
+
+    lines.append('entities ::= "[" ws entity (ws "," ws entity)* ws "]"')
+    lines.append("entity ::= " + " | ".join(f"entity-{t}" for t in ENTITIES))
+    for etype, fields in ENTITIES.items():
+        head = f'{_lit("type")} ws ":" ws {_lit(etype)}'
+        lines.append(f"entity-{etype} ::= {_object(head, fields)}")
+
+    lines.append("plane ::= " + _enum(PLANES))
+    lines.append("direction ::= " + _enum(DIRECTIONS))
+    lines.append(_BASE_RULES)
+    lines.append(_WS_RULE)
+    return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=None)
+def compact_grammar_text(schema_version: str = SCHEMA_VERSION) -> str:
+    """Grammar of the compact line format (compact.py); EOS ends the script."""
+    if schema_version != SCHEMA_VERSION:
+        raise ValueError(f"Unknown schema version '{schema_version}'.")
+    lines = [
+        'root ::= ("N " text "\\n")? step ("\\n" step)* "\\n"?',
+        "step ::= sketch | extrude | cut | workplane",
+        'sketch ::= ("S" (" " plane)? | "P " (plane | name)) ("\\n" entity)+',
+        'entity ::= ("L " num " " num " " num " " num)'
+        ' | ("R " num " " num " " num " " num) | ("C " num " " num " " num)',
+        'extrude ::= "E " num (" " direction)?',
+        'cut ::= "X" (" T" | " " num)? (" " direction)?',
+        'workplane ::= "W " plane " " num " " name',
+        "plane ::= " + " | ".join(f'"{p}"' for p in PLANES),
+        "direction ::= " + " | ".join(f'"{d}"' for d in DIRECTIONS),
+        'num ::= "-"? [0-9]+ ("." [0-9]+)?',
+        f"name ::= [^ \\n;]{{1,{_TEXT_MAX}}}",
+        f"text ::= [^\\n;]{{1,{_TEXT_MAX}}}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+_GRAMMAR_TEXTS = {"json": dsl_grammar_text, "compact": compact_grammar_text}
+
+
+def grammar_text(fmt: str = "json", schema_version: str = SCHEMA_VERSION) -> str:
+    """GBNF text for an output format (see prompt.OUTPUT_FORMATS)."""
+    return _GRAMMAR_TEXTS[fmt](schema_version)
+
+
+def plan_grammar_text(kinds) -> str:
+    """Feature list of plan.py: `<kind>: <description>` lines."""
+    return "\n".join(
+        [
+            "root ::= line+",
+            f'line ::= kind ": " [^\\n]{{1,{_TEXT_MAX}}} "\\n"',
+            "kind ::= " + " | ".join(f'"{k}"' for k in kinds),
+        ]
+    )
+
+
+def patch_grammar_text() -> str:
+    """JSON Patch array of patch.py; values are any JSON."""
+    op = (
+        '"{" ws "\\"op\\"" ws ":" ws opname ws "," ws "\\"path\\"" ws ":" ws string'
+        ' (ws "," ws ("\\"value\\"" ws ":" ws value | "\\"from\\"" ws ":" ws string))?'
+        ' ws "}"'
+    )
+    lines = [
+        'root ::= "[" ws op (ws "," ws op)* ws "]"',
+        "op ::= " + op,
+        "opname ::= " + _enum(("add", "remove", "replace", "move", "copy", "test")),
+        "value ::= object | array | string | number | boolean | \"null\"",
+        'object ::= "{" ws (member (ws "," ws member)*)? ws "}"',
+        'member ::= string ws ":" ws value',
+        'array ::= "[" ws (value (ws "," ws value)*)? ws "]"',
+        'number ::= "-"? [0-9]+ ("." [0-9]+)?',
+        'boolean ::= "true" | "false"',
+        'string ::= "\\"" [^"\\\\\\x00-\\x1f]* "\\""',
+        _WS_RULE,
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def compile_grammar(text: str):
+    """Compiled llama_cpp.LlamaGrammar, built once per grammar text."""
+    g = _grammars.get(text)
+    if g is None:
+        from llama_cpp import LlamaGrammar
+
+        g = LlamaGrammar.from_string(text, verbose=False)
+        _grammars[text] = g
+    return g
+
+
+def get_dsl_grammar(schema_version: str = SCHEMA_VERSION, fmt: str = "json"):
+    """Compiled grammar of an output format, built once per schema version."""
+    return compile_grammar(grammar_text(fmt, schema_version))
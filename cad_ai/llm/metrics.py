@@ -0,0 +1,64 @@
+# cad_ai/llm/metrics.py
+"""
+Per-request timing rows of LocalLLMEngine.
+
+Every generate_* call produces one row (see LocalLLMEngine.last_timings):
+where the result came from, load / prepare / prefill / decode / parse /
+validate milliseconds, token counts and decode speed. MetricsLog appends
+the rows to a JSONL file and keeps the recent ones for a p50/p95 summary.
+"""
+
+import json
+import math
+import threading
+from collections import deque
+from pathlib import Path
+
+SUMMARY_KEYS = ("total_ms", "ttft_ms", "prefill_ms", "tokens_per_s")
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence, q in [0, 100]."""
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, math.ceil(q / 100.0 * len(s)) - 1))]
+
+
+class MetricsLog:
+    """Appends rows to path (JSON lines, if given); remembers the last `window`."""
+
+    def __init__(self, path: str | None = None, *, window: int = 200):
+        self.path = Path(path) if path else None
+        self.rows = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def append(self, row: dict):
+        with self._lock:
+            self.rows.append(row)
+            if self.path is None:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+
+    def summary(self, keys=SUMMARY_KEYS) -> str:
+        """
+        'n=12 (llm 5), total_ms p50=.. p95=.., ...' over the kept rows; the
+        calls inside a planned request (plan_part) are covered by its row.
+        """
+        with self._lock:
+            rows = [r for r in self.rows if not r.get("plan_part")]
+        if not rows:
+            return ""
+        llm = sum(1 for r in rows if r.get("source") == "llm")
+        parts = [f"n={len(rows)} (llm {llm})"]
+        for key in keys:
+            values = [r[key] for r in rows if r.get(key) is not None]
+            if values:
+                parts.append(
+                    f"{key} p50={percentile(values, 50):.1f} "
+                    f"p95={percentile(values, 95):.1f}"
+                )
+        return ", ".join(parts)
@@ -0,0 +1,128 @@
+# cad_ai/llm/patch.py
+"""
+JSON Patch (RFC 6902) subset for edits of a generated model.
+
+The model answers an edit ("отверстия 12 вместо 10", "добавь карман
+сверху") with a few operations instead of the whole JSON:
+
+    [{"op": "replace", "path": "/steps/3/entities/0/radius", "value": 6}]
+
+add / replace / remove / move / copy / test are supported; "-" as the last
+array index appends (add). apply_patch never changes its input.
+"""
+
+import copy
+import json
+
+from .validate import extract_json_object
+
+OPS = ("add", "remove", "replace", "move", "copy", "test")
+
+
+def parse_patch(text: str) -> list[dict]:
+    """Operations from the model's answer (a JSON array, or one object)."""
+    s = (text or "").strip()
+    start = s.find("[")
+    if start != -1 and start < (s.find("{") if "{" in s else len(s)):
+        end = s.rfind("]")
+        if end == -1:
+            raise ValueError("Unterminated JSON Patch array.")
+        ops = json.loads(s[start : end + 1])
+    else:
+        ops = [json.loads(extract_json_object(s))]
+    if not isinstance(ops, list) or not all(isinstance(o, dict) for o in ops):
+        raise ValueError("JSON Patch must be an array of operation objects.")
+    return ops
+
+
+def _tokens(path: str) -> list[str]:
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise ValueError(f"Bad JSON pointer '{path}'.")
+    return [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+
+
+def _index(container: list, token: str, *, append=False) -> int:
+    if append and token == "-":
+        return len(container)
+    if not token.isdigit():
+        raise ValueError(f"Bad array index '{token}'.")
+    i = int(token)
+    if i > len(container) or (i == len(container) and not append):
+        raise ValueError(f"Array index {i} out of range.")
+    return i
+
+
+def _parent(doc, path: str):
+    tokens = _tokens(path)
+    if not tokens:
+        raise ValueError("Operations on the whole document are not supported.")
+    node = doc
+    for t in tokens[:-1]:
+        node = _child(node, t)
+    return node, tokens[-1]
+
+
+def _child(node, token: str):
+    if isinstance(node, list):
+        return node[_index(node, token)]
+    if isinstance(node, dict) and token in node:
+        return node[token]
+    raise ValueError(f"Path element '{token}' not found.")
+
+
+def _get(doc, path: str):
+    node = doc
+    for t in _tokens(path):
+        node = _child(node, t)
+    return node
+
+
+def _add(doc, path: str, value):
+    node, key = _parent(doc, path)
+    if isinstance(node, list):
+        node.insert(_index(node, key, append=True), value)
+    elif isinstance(node, dict):
+        node[key] = value
+    else:
+        raise ValueError(f"Cannot add into '{path}'.")
+
+
+def _remove(doc, path: str):
+    node, key = _parent(doc, path)
+    if isinstance(node, list):
+        return node.pop(_index(node, key))
+    if isinstance(node, dict) and key in node:
+        return node.pop(key)
+    raise ValueError(f"Path '{path}' not found.")
+
+
+def apply_patch(data: dict, ops: list[dict]) -> dict:
+    """The patched copy of data; ValueError names the failing operation."""
+    doc = copy.deepcopy(data)
+    for n, op in enumerate(ops):
+        kind, path = op.get("op"), op.get("path")
+        try:
+            if kind not in OPS or not isinstance(path, str):
+                raise ValueError(f"Unsupported operation {op!r}.")
+            if kind in ("add", "replace", "test") and "value" not in op:
+                raise ValueError("'value' is missing.")
+            if kind == "add":
+                _add(doc, path, copy.deepcopy(op["value"]))
+            elif kind == "remove":
+                _remove(doc, path)
+            elif kind == "replace":
+                _remove(doc, path)
+                _add(doc, path, copy.deepcopy(op["value"]))
+            elif kind in ("move", "copy"):
+                src = op.get("from")
+                if not isinstance(src, str):
+                    raise ValueError("'from' is missing.")
+                value = _remove(doc, src) if kind == "move" else _get(doc, src)
+                _add(doc, path, copy.deepcopy(value))
+            elif _get(doc, path) != op["value"]:
+                raise ValueError("test failed.")
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Patch operation {n} ({kind} {path}): {e}") from e
+    return doc
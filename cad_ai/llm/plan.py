@@ -0,0 +1,181 @@
+# cad_ai/llm/plan.py
+"""
+Plan-then-detail generation for parts with many features.
+
+A short planning call lists the features of the part, one per line:
+
+    base: пластина 120 на 80 толщиной 8
+    holes: 4 отверстия диаметром 10 по углам, отступ от края 15
+    pocket: карман 40 на 20 глубиной 3 по центру верхней грани
+
+The base body and every other feature then become small ordinary requests
+(same prompt, caches and validation as any request; features get the base
+as context and are told to leave it out). With a worker pool the detail
+calls run concurrently, else one after another on the engine. The steps
+are concatenated in plan order, offset plane names made unique, and the
+merged model is validated once more as a whole.
+"""
+
+import copy
+import json
+import re
+import time
+from concurrent.futures import FIRST_EXCEPTION, wait
+
+from .chat import PLAN_SYSTEM_PROMPT
+from .errors import LLMCancelled, LLMJSONError
+from .grammar import plan_grammar_text
+from .prompt import make_feature_request, make_plan_prompt
+from .validate import validate_generated_json
+
+FEATURE_KINDS = ("base", "pocket", "holes", "boss", "plane", "cut", "other")
+MAX_FEATURES = 8
+PLAN_MAX_TOKENS = 256
+
+_LINE = re.compile(r"^\s*([a-z]+)\s*:\s*(.+?)\s*$")
+_FEATURE_WORDS = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"отверст",
+        r"карман",
+        r"паз|вырез",
+        r"бобышк|выступ",
+        r"плоскост",
+        r"ступен",
+    )
+]
+_PLANE_KEYS = ("plane", "plane_name", "on_plane")
+
+
+def needs_plan(text: str, min_features: int = 3) -> bool:
+    """Whether the request names enough distinct features (+ body) to split."""
+    found = sum(1 for rx in _FEATURE_WORDS if rx.search(text or ""))
+    return found + 1 >= min_features
+
+
+def parse_plan(text: str) -> list[tuple[str, str]]:
+    """[(kind, description)], the base body first (the first line if none)."""
+    out = []
+    for line in (text or "").splitlines():
+        m = _LINE.match(line)
+        if m and m.group(1) in FEATURE_KINDS:
+            out.append((m.group(1), m.group(2)))
+    bases = [f for f in out if f[0] == "base"]
+    if bases:
+        out = bases[:1] + [f for f in out if f[0] != "base"]
+    return out
+
+
+def _strip_base(steps: list, base: list) -> list:
+    # the model may still rebuild the body first: drop an exact copy of it
+    n = 0
+    while n < min(len(steps), len(base)) and steps[n] == base[n]:
+        n += 1
+    return steps[n:]
+
+
+def _rename_planes(steps: list, names: set, index: int) -> list:
+    steps = copy.deepcopy(steps)
+    renames = {}
+    for st in steps:
+        if st.get("action") == "workplane_offset":
+            name = st.get("name")
+            if name in names:
+                renames[name] = st["name"] = f"{name}_{index}"
+            names.add(st.get("name"))
+            continue
+        for key in _PLANE_KEYS:
+            if st.get(key) in renames:
+                st[key] = renames[st[key]]
+    return steps
+
+
+def merge_features(parts: list[dict]) -> dict:
+    """One model from the base result followed by the feature results."""
+    base = parts[0]
+    steps = copy.deepcopy(base["steps"])
+    names = {st.get("name") for st in steps if st.get("action") == "workplane_offset"}
+    for i, part in enumerate(parts[1:], start=1):
+        own = _strip_base(part["steps"], base["steps"])
+        steps.extend(_rename_planes(own, names, i))
+    return {"name": base.get("name") or "Part", "steps": steps}
+
+
+def _run_details(engine, requests: list[str], pool, cancel) -> list[dict]:
+    if pool is None:
+        return [engine.generate_json(r, cancel=cancel) for r in requests]
+    futures = [pool.submit(r)[1] for r in requests]
+    pending = futures
+    try:
+        while pending:
+            if cancel is not None and cancel.is_set():
+                raise LLMCancelled("Generation cancelled.")
+            _, pending = wait(pending, timeout=0.1, return_when=FIRST_EXCEPTION)
+            for fut in futures:
+                if fut.done() and fut.exception() is not None:
+                    raise fut.exception()
+    except BaseException:
+        # the other feature calls are useless now: free their workers
+        for fut in futures:
+            if not fut.done():
+                pool.cancel(fut.job_id)
+        raise
+    parts = [fut.result() for fut in futures]
+    for text, data in zip(requests, parts):
+        # workers only read the skeleton file: the parent learns for them
+        engine._remember(text, data)
+    return parts
+
+
+def generate_planned(
+    engine, user_text: str, *, pool=None, cancel=None, max_features=MAX_FEATURES
+) -> dict:
+    """
+    Plans with engine.complete_chat, details with pool.submit (concurrent)
+    or engine.generate_json. Falls back to one ordinary request when the
+    plan has fewer than two features. engine.last_plan gets the features
+    and the plan / detail milliseconds.
+    """
+    t0 = time.perf_counter()
+    prompt = make_plan_prompt(user_text)
+    grammar = plan_grammar_text(FEATURE_KINDS) if engine.grammar else None
+    raw_plan = engine.complete_chat(
+        PLAN_SYSTEM_PROMPT,
+        prompt,
+        grammar=grammar,
+        max_tokens=PLAN_MAX_TOKENS,
+        cancel=cancel,
+    )
+    features = parse_plan(raw_plan)[:max_features]
+    t1 = time.perf_counter()
+    engine.last_plan = {
+        "features": [{"kind": k, "text": t} for k, t in features],
+        "plan_ms": round((t1 - t0) * 1000.0, 2),
+        "parallel": pool is not None,
+    }
+    if len(features) < 2:
+        engine.last_plan["fallback"] = True
+        return engine.generate_json(user_text, cancel=cancel)
+
+    base = features[0][1]
+    requests = [base] + [make_feature_request(base, t) for _, t in features[1:]]
+    parts = _run_details(engine, requests, pool, cancel)
+    engine.last_plan["detail_ms"] = round((time.perf_counter() - t1) * 1000.0, 2)
+
+    data = merge_features(parts)
+    raw = raw_plan.strip() + "\n\n" + "\n".join(
+        json.dumps(p, ensure_ascii=False) for p in parts
+    )
+    extracted = json.dumps(data, ensure_ascii=False)
+    engine.last_raw, engine.last_extracted, engine.last_prompt = (
+        raw,
+        extracted,
+        prompt,
+    )
+    engine.last_source = "plan"
+    try:
+        validate_generated_json(data)
+    except ValueError as e:
+        raise LLMJSONError(str(e), raw=raw, extracted=extracted, prompt=prompt)
+    engine.edit_base = (user_text, data)
+    return data
@@ -0,0 +1,307 @@
+# cad_ai/llm/pool.py
+"""
+Pool of LLM worker processes for many-core machines.
+
+Every worker owns its own Llama instance (the GGUF is mmap'd, so the
+weights live once in the page cache) and is pinned to its own slice of
+CPU cores. Jobs go through one queue; results come back out of order,
+tagged with the request id. A worker announces each job it takes, so when
+its process dies (OOM, a crash inside llama.cpp) the job it was running
+fails with WorkerDied instead of never finishing; once no worker is left
+every pending job fails. cancel(job_id) drops a queued job and stops a
+running one at the next token.
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, as_completed
+
+from .errors import LLMJSONError
+
+# seconds between liveness checks of the worker processes
+_POLL = 0.5
+
+
+class WorkerDied(RuntimeError):
+    """The worker process running a job exited before answering."""
+
+
+def available_cores() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(
+    n_workers: int, cores: list[int] | None = None, per_worker: int | None = None
+) -> list[list[int]]:
+    """
+    Splits the available cores into n_workers contiguous slices: equal-ish
+    over all cores, or per_worker cores each (fewer if they do not fit).
+    """
+    if cores is None:
+        cores = available_cores()
+    n_workers = max(1, min(n_workers, len(cores)))
+    if per_worker is not None:
+        size = max(1, min(per_worker, len(cores) // n_workers))
+        return [cores[i * size : (i + 1) * size] for i in range(n_workers)]
+    size, extra = divmod(len(cores), n_workers)
+    out, start = [], 0
+    for i in range(n_workers):
+        end = start + size + (1 if i < extra else 0)
+        out.append(cores[start:end])
+        start = end
+    return out
+
+
+def _pin_to_cores(cores: list[int]):
+    try:
+        import psutil
+
+        psutil.Process().cpu_affinity(cores)
+        return
+    except Exception:
+        pass
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+
+
+class _JobCancel:
+    """cancel= of one job: set once the parent writes its id to `cancelled`."""
+
+    def __init__(self, cancelled, job_id: int):
+        self.cancelled = cancelled
+        self.job_id = job_id
+
+    def is_set(self) -> bool:
+        return self.cancelled.value == self.job_id
+
+
+def _worker_main(
+    worker_id, cores, model_path, engine_kwargs, jobs, results, cancelled
+):
+    # imported here so the parent does not need llama-cpp for spawning
+    from .engine import LocalLLMEngine
+
+    _pin_to_cores(cores)
+    # the skeleton file has one writer, the parent: workers would overwrite
+    # each other's updates
+    eng = LocalLLMEngine(
+        model_path, n_threads=len(cores), skeleton_writer=False, **engine_kwargs
+    )
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, text = job
+        results.put((job_id, worker_id, 0.0, ("start",)))
+        t0 = time.perf_counter()
+        try:
+            data = eng.generate_json(text, cancel=_JobCancel(cancelled, job_id))
+            payload = ("ok", data)
+        except LLMJSONError as e:
+            payload = ("llm_error", str(e), e.raw, e.extracted, e.prompt)
+        except Exception as e:
+            payload = ("error", f"{type(e).__name__}: {e}")
+        busy = time.perf_counter() - t0
+        results.put((job_id, worker_id, busy, payload))
+
+
+class LLMWorkerPool:
+    """
+    Same generate_json contract as LocalLLMEngine, backed by worker processes.
+
+    submit(text) -> (job_id, Future); map_unordered(texts) yields (job_id, result)
+    in completion order, result being a dict or an exception. Without
+    cores_per_worker the cores are split evenly over the workers (one worker
+    per 8 cores when n_workers is not given either).
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        *,
+        n_workers: int | None = None,
+        cores_per_worker: int | None = None,
+        **engine_kwargs,
+    ):
+        if "n_threads" in engine_kwargs:
+            raise TypeError("n_threads is set per worker from its cores.")
+        if "skeleton_writer" in engine_kwargs:
+            raise TypeError("Pool workers never write the skeleton file.")
+        if n_workers is None:
+            n_workers = max(1, len(available_cores()) // (cores_per_worker or 8))
+        self.core_sets = partition_cores(n_workers, per_worker=cores_per_worker)
+
+        ctx = mp.get_context("spawn")
+        self._jobs = ctx.Queue()
+        self._results = ctx.Queue()
+        # per worker: id of its job to stop (a job id never matches twice)
+        self._cancel = [ctx.Value("q", -1, lock=False) for _ in self.core_sets]
+        self._procs = [
+            ctx.Process(
+                target=_worker_main,
+                args=(
+                    i,
+                    cores,
+                    model_path,
+                    engine_kwargs,
+                    self._jobs,
+                    self._results,
+                    self._cancel[i],
+                ),
+                daemon=True,
+            )
+            for i, cores in enumerate(self.core_sets)
+        ]
+        for p in self._procs:
+            p.start()
+
+        self._lock = threading.Lock()
+        self._futures: dict[int, Future] = {}
+        self._next_id = 0
+        self._started = time.perf_counter()
+        self._busy = [0.0] * len(self._procs)
+        self._done = [0] * len(self._procs)
+        self._running: dict[int, int] = {}  # worker id -> job id
+        self._dead: set[int] = set()
+        self._cancelled: set[int] = set()
+        self._closing = False
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        while True:
+            try:
+                item = self._results.get(timeout=_POLL)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if item is None:
+                break
+            job_id, worker_id, busy, payload = item
+            kind = payload[0]
+            with self._lock:
+                if kind == "start" and worker_id not in self._dead:
+                    self._running[worker_id] = job_id
+                    if job_id in self._cancelled:
+                        self._cancel[worker_id].value = job_id
+                    continue
+                self._cancelled.discard(job_id)
+                if kind == "start":
+                    # announced before dying, read after the death was seen
+                    kind, payload = "error", ("died", f"LLM worker {worker_id} died.")
+                self._running.pop(worker_id, None)
+                self._busy[worker_id] += busy
+                self._done[worker_id] += 1
+                fut = self._futures.pop(job_id, None)
+            if fut is None or fut.cancelled():
+                continue
+            if kind == "ok":
+                fut.set_result(payload[1])
+            elif kind == "llm_error":
+                _, msg, raw, extracted, prompt = payload
+                fut.set_exception(
+                    LLMJSONError(msg, raw=raw, extracted=extracted, prompt=prompt)
+                )
+            elif payload[0] == "died":
+                fut.set_exception(WorkerDied(payload[1]))
+            else:
+                fut.set_exception(RuntimeError(payload[1]))
+            self._check_workers()
+
+    def _check_workers(self):
+        """Fails the jobs of dead workers (all pending jobs once none is left)."""
+        if self._closing:
+            return
+        failed = []
+        with self._lock:
+            for i, p in enumerate(self._procs):
+                if i in self._dead or p.is_alive():
+                    continue
+                self._dead.add(i)
+                job_id = self._running.pop(i, None)
+                fut = self._futures.pop(job_id, None) if job_id is not None else None
+                if fut is not None:
+                    failed.append((fut, f"LLM worker {i} died (exit {p.exitcode})."))
+            if len(self._dead) == len(self._procs):
+                failed += [
+                    (fut, "All LLM workers died.") for fut in self._futures.values()
+                ]
+                self._futures.clear()
+        for fut, msg in failed:
+            if not fut.cancelled():
+                fut.set_exception(WorkerDied(msg))
+
+    def submit(self, text: str) -> tuple[int, Future]:
+        fut = Future()
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._futures[job_id] = fut
+        fut.job_id = job_id
+        self._jobs.put((job_id, text))
+        self._check_workers()
+        return job_id, fut
+
+    def cancel(self, job_id: int):
+        """
+        Cancels the job's future. A running job stops at the next token; a
+        queued one as soon as a worker announces it.
+        """
+        with self._lock:
+            fut = self._futures.pop(job_id, None)
+            if fut is None:
+                return
+            self._cancelled.add(job_id)
+            for worker_id, running in self._running.items():
+                if running == job_id:
+                    self._cancel[worker_id].value = job_id
+        fut.cancel()
+
+    def generate_json(self, user_text: str) -> dict:
+        _, fut = self.submit(user_text)
+        return fut.result()
+
+    def map_unordered(self, texts):
+        """Submits all texts; yields (job_id, dict | exception) as they finish."""
+        futures = [self.submit(t)[1] for t in texts]
+        for fut in as_completed(futures):
+            exc = fut.exception()
+            yield fut.job_id, exc if exc is not None else fut.result()
+
+    def utilization(self) -> list[dict]:
+        """Per worker: cores, finished jobs and busy share of wall time."""
+        elapsed = max(time.perf_counter() - self._started, 1e-9)
+        with self._lock:
+            return [
+                {
+                    "worker": i,
+                    "cores": self.core_sets[i],
+                    "jobs": self._done[i],
+                    "busy": self._busy[i] / elapsed,
+                }
+                for i in range(len(self._procs))
+            ]
+
+    def close(self):
+        self._closing = True
+        for _ in self._procs:
+            self._jobs.put(None)
+        for p in self._procs:
+            p.join(timeout=10)
+        self._results.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
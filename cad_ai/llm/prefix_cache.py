@@ -0,0 +1,160 @@
+import ctypes
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+
+# file layout: MAGIC, uint32 header length, JSON header, raw state bytes.
+# No pickle: the cache dir is user-writable and only data is read back.
+MAGIC = b"CADPFX1\n"
+_HEADER_LEN = struct.Struct("<I")
+
+
+def _llama_state_api():
+    import llama_cpp
+
+    # llama_state_* replaced llama_*_state_data in newer llama.cpp builds
+    get_size = getattr(llama_cpp, "llama_state_get_size", None)
+    if get_size is not None:
+        return (
+            get_size,
+            lambda ctx, buf, n: llama_cpp.llama_state_get_data(ctx, buf, n),
+            lambda ctx, buf, n: llama_cpp.llama_state_set_data(ctx, buf, n),
+        )
+    return (
+        llama_cpp.llama_get_state_size,
+        lambda ctx, buf, n: llama_cpp.llama_copy_state_data(ctx, buf),
+        lambda ctx, buf, n: llama_cpp.llama_set_state_data(ctx, buf),
+    )
+
+
+class PrefixSnapshot:
+    """Evaluated prompt prefix: its tokens plus the raw llama context state (KV)."""
+
+    def __init__(self, tokens: list[int], state: bytes):
+        self.tokens = list(tokens)
+        self.state = state
+
+    @classmethod
+    def capture(cls, llm) -> "PrefixSnapshot":
+        get_size, get_data, _ = _llama_state_api()
+        size = int(get_size(llm.ctx))
+        buf = (ctypes.c_uint8 * size)()
+        n = int(get_data(llm.ctx, buf, size))
+        return cls(llm.input_ids[: llm.n_tokens].tolist(), bytes(buf[:n]))
+
+    def restore(self, llm):
+        _, _, set_data = _llama_state_api()
+        n = len(self.state)
+        buf = (ctypes.c_uint8 * n).from_buffer_copy(self.state)
+        if int(set_data(llm.ctx, buf, n)) != n:
+            raise RuntimeError("Failed to restore llama state.")
+        llm.input_ids[: len(self.tokens)] = self.tokens
+        llm.n_tokens = len(self.tokens)
+
+    def is_live(self, llm) -> bool:
+        """True if the context already starts with this prefix (nothing to restore)."""
+        k = len(self.tokens)
+        return llm.n_tokens >= k and llm.input_ids[:k].tolist() == self.tokens
+
+    def to_bytes(self, key: str) -> bytes:
+        header = json.dumps(
+            {"key": key, "tokens": self.tokens, "state_len": len(self.state)}
+        ).encode("utf-8")
+        return MAGIC + _HEADER_LEN.pack(len(header)) + header + self.state
+
+    @classmethod
+    def from_bytes(cls, data: bytes, key: str) -> "PrefixSnapshot | None":
+        """The snapshot stored by to_bytes(key); None if foreign or damaged."""
+        start = len(MAGIC) + _HEADER_LEN.size
+        if not data.startswith(MAGIC) or len(data) < start:
+            return None
+        (n,) = _HEADER_LEN.unpack_from(data, len(MAGIC))
+        try:
+            header = json.loads(data[start : start + n].decode("utf-8"))
+        except ValueError:
+            return None
+        if not isinstance(header, dict):
+            return None
+        state = data[start + n :]
+        tokens = header.get("tokens")
+        if (
+            header.get("key") != key
+            or header.get("state_len") != len(state)
+            or not isinstance(tokens, list)
+            or not all(type(t) is int for t in tokens)
+        ):
+            return None
+        return cls(tokens, state)
+
+
+class PrefixCache:
+    """
+    Evaluates the fixed prompt prefix once and keeps its KV state in memory.
+    With cache_dir set, the snapshot is also stored on disk so a restarted app
+    skips the prefix prefill. `key` must identify model file + prompt version.
+    """
+
+    def __init__(self, key: str, cache_dir: str | None = None):
+        self.key = key
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.snapshot: PrefixSnapshot | None = None
+
+    def _file(self, tokens: list[int]) -> Path | None:
+        if self.cache_dir is None:
+            return None
+        tok_hash = hashlib.sha256(repr(tokens).encode()).hexdigest()[:12]
+        return self.cache_dir / f"prefix-{self.key}-{tok_hash}.kv"
+
+    def _load(self, path: Path | None, tokens: list[int]) -> PrefixSnapshot | None:
+        if path is None or not path.exists():
+            return None
+        try:
+            snap = PrefixSnapshot.from_bytes(path.read_bytes(), self.key)
+        except OSError:
+            return None
+        if snap is None or snap.tokens != tokens:
+            return None
+        return snap
+
+    def _save(self, path: Path | None, snap: PrefixSnapshot):
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # per process: pool workers may save the same snapshot at once
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(snap.to_bytes(self.key))
+            os.replace(tmp, path)
+        except OSError:
+            pass  # disk cache is best-effort
+
+    def prepare(self, llm, tokens: list[int]) -> str:
+        """
+        Makes sure the context holds the evaluated prefix `tokens`.
+        Returns where it came from: "live" | "memory" | "disk" | "eval".
+        """
+        snap = self.snapshot
+        if snap is not None and snap.tokens == tokens:
+            if snap.is_live(llm):
+                return "live"
+            snap.restore(llm)
+            return "memory"
+
+        path = self._file(tokens)
+        snap = self._load(path, tokens)
+        if snap is not None:
+            try:
+                snap.restore(llm)
+                self.snapshot = snap
+                return "disk"
+            except Exception:
+                # stale file from another llama.cpp build
+                path.unlink(missing_ok=True)
+
+        llm.reset()
+        llm.eval(tokens)
+        self.snapshot = PrefixSnapshot.capture(llm)
+        self._save(path, self.snapshot)
+        return "eval"
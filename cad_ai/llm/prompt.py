@@ -1,5 +1,26 @@
 # cad_ai/llm/prompt.py
+"""
+Prompt texts of the generation call.
+
+A PromptBuilder is one prompt version: rules, few-shot examples and system
+prompts. Its fixed prefix is rendered once when it is built; tokens()
+renders the chat template around it once per model and keeps the token
+IDs, so a request only tokenizes its own text. prefix_hash() identifies
+the fixed part in cache keys (prefix snapshots, result cache, token
+counts): a changed variant never reuses another variant's entries.
+
+Variants are registered by name (register_prompt) or read from
+<prompts_dir>/<name>.json, so an experiment is a file, not a code edit:
+
+    {"name": "short-rules", "base": "1", "rules": {"json": "..."}}
+
+Fields left out are taken from the base variant (the built-in "1").
+"""
+
+import hashlib
 import json
+import threading
+from pathlib import Path
 
 from cad_ai.templates.ai_templates import (
     tpl_cube,
@@ -8,28 +29,36 @@ from cad_ai.templates.ai_templates import (
     tpl_stepped_block,
 )
 
+from .chat import COMPACT_SYSTEM_PROMPT, SYSTEM_PROMPT, split_chat
+from .compact import to_compact
+
+
+# name of the built-in prompt; cache keys use PromptBuilder.prefix_hash(),
+# so editing the texts below needs no version bump
+PROMPT_VERSION = "1"
+
 
 def _compact_json(obj: dict) -> str:
     # компактно, но читаемо
     return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
 
-def make_llm_prompt(user_text: str) -> str:
-    # few-shot examples (stable “golden” outputs)
-    ex1 = _compact_json(tpl_cube(60.0, "XOY"))
-    ex2 = _compact_json(tpl_cube_with_through_hole(60.0, 12.0, "XOY"))
-    ex3 = _compact_json(tpl_plate_with_holes(120.0, 80.0, 8.0, 10.0, 15.0, "XOY"))
-    ex4 = _compact_json(tpl_stepped_block(120, 80, 20, 60, 40, 20, 30, 20, 10, "XOY"))
+# output formats: "json" (the DSL itself) or "compact" (see compact.py)
+OUTPUT_FORMATS = ("json", "compact")
 
-    return f"""
+_EXAMPLES_HEADER = "Примеры корректного JSON (учись формату!):\n"
+_COMPACT_EXAMPLES_HEADER = "Примеры корректного скрипта (учись формату!):\n"
+REQUEST_HEADER = "Запрос пользователя: "
+
+_JSON_RULES = """
 Ты генерируешь ТОЛЬКО валидный JSON-объект для построения модели в КОМПАС-3D.
 Никакого текста, объяснений, markdown, комментариев — только JSON.
 
 Схема результата:
-{{
+{
   "name": "string",
   "steps": [ ... ]
-}}
+}
 
 Разрешённые action:
 - sketch (plane: XOY|XOZ|YOZ; entities: line/circle)
@@ -45,11 +74,291 @@ def make_llm_prompt(user_text: str) -> str:
 - Если не уверен — direction="both" для extrude и cut.
 - Если нужен “насквозь” — cut with through_all=true.
 
-Примеры корректного JSON (учись формату!):
-1) {ex1}
-2) {ex2}
-3) {ex3}
-4) {ex4}
+""".lstrip()
+
+
+_COMPACT_RULES = """
+Ты генерируешь ТОЛЬКО скрипт построения модели в КОМПАС-3D.
+Никакого текста, объяснений, markdown, комментариев — только скрипт.
+
+Одна команда на строку, числа через пробел:
+N имя — название детали (первой строкой)
+S XOY|XOZ|YOZ — эскиз на плоскости
+P XOY|XOZ|YOZ|<имя> — эскиз на плоскости или рабочей плоскости
+L x1 y1 x2 y2 — отрезок (только внутри эскиза)
+R x1 y1 x2 y2 — прямоугольник по двум углам (только внутри эскиза)
+C cx cy r — окружность (только внутри эскиза)
+E h [normal|reverse|both] — выдавливание на высоту h
+X T [normal|reverse|both] — вырез насквозь
+X d [normal|reverse|both] — вырез на глубину d
+W XOY|XOZ|YOZ offset имя — смещённая рабочая плоскость
+
+Жёсткие правила:
+- Не используй другие команды.
+- Если не уверен — both для E и X.
+- Если нужен “насквозь” — X T.
+
+""".lstrip()
+
+
+def _examples_block(examples, fmt: str = "json") -> str:
+    if fmt == "compact":
+        return "".join(
+            f"{i})\n{to_compact(ex)}\n" for i, ex in enumerate(examples, start=1)
+        )
+    return "".join(
+        f"{i}) {_compact_json(ex)}\n" for i, ex in enumerate(examples, start=1)
+    )
+
+
+def _default_examples() -> list[dict]:
+    # few-shot examples (stable “golden” outputs)
+    return [
+        tpl_cube(60.0, "XOY"),
+        tpl_cube_with_through_hole(60.0, 12.0, "XOY"),
+        tpl_plate_with_holes(120.0, 80.0, 8.0, 10.0, 15.0, "XOY"),
+        tpl_stepped_block(120, 80, 20, 60, 40, 20, 30, 20, 10, "XOY"),
+    ]
+
+
+class PromptBuilder:
+    """
+    One prompt version. rules / system map an output format to its text
+    (rules end with the examples header); examples are DSL dicts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        rules: dict | None = None,
+        examples: list[dict] | None = None,
+        system: dict | None = None,
+        request_header: str = REQUEST_HEADER,
+    ):
+        self.name = name
+        self.rules = {
+            "json": _JSON_RULES + _EXAMPLES_HEADER,
+            "compact": _COMPACT_RULES + _COMPACT_EXAMPLES_HEADER,
+            **(rules or {}),
+        }
+        self.system = {
+            "json": SYSTEM_PROMPT,
+            "compact": COMPACT_SYSTEM_PROMPT,
+            **(system or {}),
+        }
+        self.examples = _default_examples() if examples is None else list(examples)
+        self.request_header = request_header
+
+        self._prefix = {
+            fmt: self.rules[fmt]
+            + _examples_block(self.examples, fmt)
+            + "\n"
+            + request_header
+            for fmt in OUTPUT_FORMATS
+        }
+        self._hashes = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def rules_prefix(self, fmt: str = "json") -> str:
+        """Instruction block without examples (the prefix with retrieval)."""
+        return self.rules[fmt]
+
+    def prefix(self, fmt: str = "json") -> str:
+        """Fixed part of the prompt (rules + few-shot examples)."""
+        return self._prefix[fmt]
+
+    def fixed(self, fmt: str = "json", retrieval: bool = False) -> str:
+        return self.rules[fmt] if retrieval else self._prefix[fmt]
+
+    def system_prompt(self, fmt: str = "json") -> str:
+        return self.system[fmt]
+
+    def suffix(self, user_text: str, examples=None, fmt: str = "json") -> str:
+        """
+        Per-request part after the cacheable prefix. With `examples`
+        (retrieved for this request) the prefix is rules_prefix() instead.
+        """
+        if examples is None:
+            return user_text.strip()
+        block = _examples_block(examples, fmt)
+        return block + "\n" + self.request_header + user_text.strip()
+
+    def prompt(self, user_text: str, examples=None, fmt: str = "json") -> str:
+        fixed = self.fixed(fmt, retrieval=examples is not None)
+        return (fixed + self.suffix(user_text, examples, fmt)).strip()
+
+    def prefix_hash(self, fmt: str = "json", retrieval: bool = False) -> str:
+        """Stable id of the system prompt + fixed prefix, for cache keys."""
+        key = (fmt, retrieval)
+        h = self._hashes.get(key)
+        if h is None:
+            raw = self.system[fmt] + "\0" + self.fixed(fmt, retrieval)
+            h = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+            self._hashes[key] = h
+        return h
+
+    def tokens(
+        self, backend, fmt: str = "json", retrieval: bool = False
+    ) -> tuple[list[int], list[int]]:
+        """
+        (prefix, tail) token IDs of the rendered chat around the user text,
+        built once per model; works before load() for llama-cpp.
+        """
+        key = (backend.fingerprint(), fmt, retrieval)
+        with self._lock:
+            out = self._tokens.get(key)
+            if out is None:
+                head, tail = split_chat(
+                    backend, self.system[fmt], self.fixed(fmt, retrieval)
+                )
+                out = (
+                    backend.tokenize(head, add_bos=True, special=True),
+                    backend.tokenize(tail, special=True),
+                )
+                self._tokens[key] = out
+        return out
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "rules": dict(self.rules),
+            "examples": self.examples,
+            "system": dict(self.system),
+            "request_header": self.request_header,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict, base: "PromptBuilder | None" = None):
+        """Variant from a dict; fields left out come from base."""
+        base = base or get_prompt(d.get("base"))
+        return cls(
+            d["name"],
+            rules={**base.rules, **d.get("rules", {})},
+            examples=d.get("examples", base.examples),
+            system={**base.system, **d.get("system", {})},
+            request_header=d.get("request_header", base.request_header),
+        )
+
+
+_PROMPTS: dict[str, PromptBuilder] = {}
+
+
+def register_prompt(builder: PromptBuilder) -> PromptBuilder:
+    """Makes a variant selectable by name (replaces one of the same name)."""
+    _PROMPTS[builder.name] = builder
+    return builder
+
+
+def get_prompt(name: str | None = None, prompts_dir: str | None = None):
+    """
+    The registered variant (None = PROMPT_VERSION); else it is loaded from
+    prompts_dir/<name>.json and registered.
+    """
+    name = name or PROMPT_VERSION
+    builder = _PROMPTS.get(name)
+    if builder is not None:
+        return builder
+    path = Path(prompts_dir) / f"{name}.json" if prompts_dir else None
+    if path is None or not path.exists():
+        raise ValueError(f"Unknown prompt variant '{name}'.")
+    try:
+        d = json.loads(path.read_text(encoding="utf-8"))
+    except ValueError as e:
+        raise ValueError(f"Bad prompt variant file {path}: {e}") from e
+    if d.get("base") == name:
+        raise ValueError(f"Prompt variant '{name}' is its own base.")
+    base = get_prompt(d.get("base"), prompts_dir)
+    return register_prompt(PromptBuilder.from_dict({**d, "name": name}, base))
+
+
+def save_prompt(builder: PromptBuilder, prompts_dir: str) -> Path:
+    """Writes a variant as prompts_dir/<name>.json (see get_prompt)."""
+    path = Path(prompts_dir) / f"{builder.name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps(builder.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    return path
+
+
+def prompt_names(prompts_dir: str | None = None) -> list[str]:
+    """Registered variants and those saved in prompts_dir."""
+    names = set(_PROMPTS)
+    if prompts_dir and Path(prompts_dir).is_dir():
+        names.update(p.stem for p in Path(prompts_dir).glob("*.json"))
+    return sorted(names)
+
+
+register_prompt(PromptBuilder(PROMPT_VERSION))
+
+
+def make_llm_rules_prefix(fmt: str = "json") -> str:
+    """Instruction block without examples, shared by every prompt variant."""
+    return get_prompt().rules_prefix(fmt)
+
+
+def make_llm_prompt_prefix(fmt: str = "json") -> str:
+    """Fixed part of the prompt (rules + few-shot examples)."""
+    return get_prompt().prefix(fmt)
+
+
+def make_llm_prompt_suffix(user_text: str, examples=None, fmt: str = "json") -> str:
+    """Per-request part after the cacheable prefix, see PromptBuilder.suffix."""
+    return get_prompt().suffix(user_text, examples, fmt)
+
+
+def make_llm_prompt(user_text: str, examples=None, fmt: str = "json") -> str:
+    return get_prompt().prompt(user_text, examples, fmt)
+
+
+def make_edit_message(instruction: str) -> str:
+    """User reply asking for a JSON Patch to the model's last answer."""
+    return (
+        f"Правка: {instruction.strip()}\n"
+        "Выведи только JSON Patch (RFC 6902) к своему последнему JSON: массив "
+        'операций вида {"op":"replace","path":"/steps/1/height","value":12}, '
+        "op: replace|add|remove. Весь JSON заново не выводи."
+    )
+
+
+def make_plan_prompt(user_text: str) -> str:
+    """Planning call of plan.py: the features of the part, one per line."""
+    return f"""
+Разбей описание детали на конструктивные элементы, по одному на строку:
+<вид>: <описание элемента с размерами и положением>
+
+Виды:
+- base — основное тело (ровно одно, первой строкой)
+- pocket — карман, вырез на глубину
+- holes — отверстие или группа одинаковых отверстий
+- boss — бобышка, выступ
+- plane — элемент на смещённой рабочей плоскости
+- cut — прочий вырез
+- other — всё остальное
+
+Переписывай числа из запроса без изменений. Не выдумывай элементов.
+
+Пример:
+Запрос: пластина 120 на 80 толщиной 8, 4 отверстия 10 с отступом 15, по центру карман 40 на 20 глубиной 3
+base: пластина 120 на 80 толщиной 8
+holes: 4 отверстия диаметром 10 по углам, отступ от края 15
+pocket: карман 40 на 20 глубиной 3 по центру верхней грани
+
+Запрос: {user_text.strip()}
+""".lstrip()
+
+
+def make_feature_request(base: str, feature: str) -> str:
+    """Detail request for one non-base feature of a planned part."""
+    return (
+        f"{feature.strip()}. Это элемент детали «{base.strip()}»: тело детали "
+        f"уже построено, выдай только шаги этого элемента, без построения тела."
+    )
+
 
-Запрос пользователя: {user_text}
-""".strip()
+def make_repair_message(error: str, fmt: str = "json") -> str:
+    """Short user reply asking to fix a rejected answer (self-repair)."""
+    what = "скрипт" if fmt == "compact" else "JSON"
+    return f"Ошибка: {error}\nИсправь и выведи весь {what} заново."
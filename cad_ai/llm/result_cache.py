@@ -0,0 +1,97 @@
+# cad_ai/llm/result_cache.py
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+_WS = re.compile(r"\s+")
+_TRAILING_ZEROS = re.compile(r"(\d+)\.0+\b")
+
+
+def normalize_request(text: str) -> str:
+    """
+    Folds trivial differences: case, ё, spaces, 8.0 / 8, end punctuation.
+    Commas stay: "120,80" may be two numbers, folding it to 120.80 would
+    answer it with another request's result.
+    """
+    t = (text or "").lower().replace("ё", "е")
+    t = _TRAILING_ZEROS.sub(r"\1", t)
+    t = _WS.sub(" ", t).strip(" .;!")
+    return t
+
+
+class ResultCache:
+    """
+    Persistent SQLite cache of validated LLM results.
+
+    Keys are normalized user text + engine_key (model hash, prompt/schema
+    version, sampling params). Only JSON that passed validate_generated_json
+    should be put here. Size-bounded, least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, engine_key: str, *, max_entries: int = 2000):
+        self.path = Path(path)
+        self.engine_key = engine_key
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, text TEXT, data TEXT, last_used REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS results_lru ON results (last_used)"
+        )
+        self._db.commit()
+
+    def _key(self, text: str) -> str:
+        raw = self.engine_key + "\n" + normalize_request(text)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> dict | None:
+        key = self._key(text)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, text: str, data: dict):
+        key = self._key(text)
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, text, data, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                (key, normalize_request(text), payload, time.time()),
+            )
+            self._db.execute(
+                "DELETE FROM results WHERE key IN ("
+                " SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"hits={self.hits} misses={self.misses} ({rate:.0%})"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,161 @@
+# cad_ai/llm/retrieval.py
+"""
+Few-shot example library + offline TF-IDF index.
+
+The library (data/examples.jsonl) pairs text descriptions with validated
+JSON. The index is built offline, no network or embedding model needed:
+
+    python -m cad_ai.llm.retrieval build
+
+make_llm_prompt(user_text, examples=select_examples(...)) then inlines only
+the top-k most similar examples that fit a token budget.
+"""
+
+import hashlib
+import json
+import math
+import re
+import sys
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from .result_cache import normalize_request
+from .validate import validate_generated_json
+
+DATA_DIR = Path(__file__).parent / "data"
+LIBRARY_PATH = DATA_DIR / "examples.jsonl"
+INDEX_PATH = DATA_DIR / "examples.index.json"
+# bumped when _features changes: a saved index of older features is rebuilt
+FEATURES_VERSION = 2
+
+_DIMENSION_X = re.compile(r"(?<=\d)\s*[xх×*]\s*(?=\d)")
+_WORD = re.compile(r"[^\W\d_]+")
+
+
+def _features(text: str) -> Counter:
+    # char 3-grams inside words: robust to Russian endings (пластина/пластины).
+    # Numbers are left out: the shape words decide, not the dimensions
+    feats = Counter()
+    t = _DIMENSION_X.sub(" ", normalize_request(text))
+    for word in _WORD.findall(t):
+        w = f" {word} "
+        for i in range(len(w) - 2):
+            feats[w[i : i + 3]] += 1
+    return feats
+
+
+def _unit(vec: dict) -> dict:
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {k: v / norm for k, v in vec.items()}
+
+
+def _file_hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+
+
+def load_library(path: Path = LIBRARY_PATH) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ExampleIndex:
+    def __init__(self, examples: list[dict], idf: dict, vectors: list[dict]):
+        self.examples = examples
+        self.idf = idf
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, examples: list[dict]) -> "ExampleIndex":
+        feats = [_features(e["text"]) for e in examples]
+        df = Counter()
+        for f in feats:
+            df.update(f.keys())
+        n = len(examples)
+        idf = {t: math.log((1 + n) / (1 + c)) + 1.0 for t, c in df.items()}
+        vectors = [_unit({t: c * idf[t] for t, c in f.items()}) for f in feats]
+        return cls(examples, idf, vectors)
+
+    def save(self, path: Path, library_hash: str):
+        payload = {
+            "library": library_hash,
+            "features": FEATURES_VERSION,
+            "idf": self.idf,
+            "vectors": self.vectors,
+        }
+        path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, library: Path = LIBRARY_PATH, index: Path = INDEX_PATH):
+        """Loads the prebuilt index; rebuilds in memory if it is missing/stale."""
+        examples = load_library(library)
+        try:
+            payload = json.loads(index.read_text(encoding="utf-8"))
+            if (
+                payload["library"] == _file_hash(library)
+                and payload.get("features") == FEATURES_VERSION
+            ):
+                return cls(examples, payload["idf"], payload["vectors"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls.build(examples)
+
+    def search(self, text: str, k: int) -> list[tuple[float, dict]]:
+        q = _unit(
+            {t: c * self.idf[t] for t, c in _features(text).items() if t in self.idf}
+        )
+        scored = [
+            (sum(w * vec.get(t, 0.0) for t, w in q.items()), ex)
+            for vec, ex in zip(self.vectors, self.examples)
+        ]
+        scored.sort(key=lambda x: -x[0])
+        return scored[:k]
+
+
+@lru_cache(maxsize=1)
+def get_index() -> ExampleIndex:
+    return ExampleIndex.load()
+
+
+def _approx_tokens(text: str) -> int:
+    # ~3 chars per token for compact JSON with Qwen-style BPE
+    return len(text) // 3 + 1
+
+
+def select_examples(
+    user_text: str,
+    *,
+    k: int = 3,
+    token_budget: int = 700,
+    count_tokens=None,
+) -> list[dict]:
+    """Top-k most similar library JSONs whose compact form fits token_budget."""
+    count = count_tokens or _approx_tokens
+    out, used = [], 0
+    for _, ex in get_index().search(user_text, len(get_index().examples)):
+        if len(out) >= k:
+            break
+        cost = count(json.dumps(ex["json"], ensure_ascii=False, separators=(",", ":")))
+        if used + cost > token_budget:
+            continue
+        out.append(ex["json"])
+        used += cost
+    return out
+
+
+def build_index():
+    examples = load_library()
+    for i, ex in enumerate(examples):
+        try:
+            validate_generated_json(ex["json"])
+        except ValueError as e:
+            raise ValueError(f"{LIBRARY_PATH.name}:{i + 1}: {e}") from e
+    ExampleIndex.build(examples).save(INDEX_PATH, _file_hash(LIBRARY_PATH))
+    print(f"Indexed {len(examples)} examples -> {INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["build"]:
+        build_index()
+    else:
+        print("usage: python -m cad_ai.llm.retrieval build")
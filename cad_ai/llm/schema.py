@@ -0,0 +1,65 @@
+# cad_ai/llm/schema.py
+"""
+Single definition of the JSON DSL consumed by Kompas3DBuilder.process_json.
+validate.py compiles it into the validator (which also normalizes: enum
+casing, defaults), grammar.py turns it into a GBNF grammar.
+"""
+
+from dataclasses import dataclass
+from typing import Any
+
+# bump on any change below: compiled grammars are cached per version
+SCHEMA_VERSION = "2"
+
+PLANES = ("XOY", "XOZ", "YOZ")
+DIRECTIONS = ("normal", "reverse", "both")
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    # number | point | plane | plane_ref | direction | bool | string | entities
+    kind: str
+    required: bool = True
+    # filled in by normalization when neither the field nor an alias is set
+    default: Any = None
+    # other keys the builder also reads for this field
+    aliases: tuple = ()
+
+
+# field order here is the order the grammar emits (same as in the templates)
+ENTITIES = {
+    "line": (Field("start", "point"), Field("end", "point")),
+    "circle": (Field("center", "point"), Field("radius", "number")),
+}
+
+ACTIONS = {
+    "sketch": (
+        Field("plane", "plane", required=False),
+        Field("entities", "entities"),
+    ),
+    "extrude": (
+        Field("height", "number"),
+        Field("direction", "direction", required=False),
+    ),
+    "cut": (
+        Field("through_all", "bool", required=False),
+        Field("depth", "number", required=False),
+        Field("direction", "direction", required=False),
+    ),
+    "workplane_offset": (
+        Field("base_plane", "plane"),
+        Field("offset", "number"),
+        Field("name", "string"),
+    ),
+    "sketch_on_plane": (
+        Field(
+            "plane",
+            "plane_ref",
+            required=False,
+            default="XOY",
+            aliases=("plane_name", "on_plane"),
+        ),
+        Field("entities", "entities"),
+    ),
+}
@@ -0,0 +1,226 @@
+# cad_ai/llm/skeleton.py
+"""
+Numeric-slot skeleton cache.
+
+"пластина 100 на 60 толщиной 5, 4 отверстия 8, отступ 12" and the default
+request differ only in numbers. The numbers are cut out of the text into
+slots ("пластина # на # толщиной #, # отверстия #, отступ #"); every number
+of a validated JSON result is explained as an expression over the slots
+(slot, slot/2, 2*slot, slot+slot, slot-slot, or a constant); the simplest
+fitting form wins. A new request with the same skeleton is answered by
+substitution, without the LLM.
+
+Anything unclear (equally simple expressions that disagree, an unconfirmed
+non-zero constant, a changed slot no expression uses, like a hole count)
+returns None and the caller falls back to the model.
+"""
+
+import copy
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+from .result_cache import normalize_request
+
+_NUM = re.compile(r"\d+(?:\.\d+)?")
+_EPS = 1e-6
+
+
+def split_numbers(text: str) -> tuple[str, list[float]]:
+    t = normalize_request(text)
+    nums = [float(m) for m in _NUM.findall(t)]
+    return _NUM.sub("#", t), nums
+
+
+def _leaves(obj, path=()):
+    """(path, value) of every numeric leaf; bools are not numbers here."""
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            yield from _leaves(v, path + (k,))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            yield from _leaves(v, path + (i,))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        yield path, float(obj)
+
+
+def _shape(obj):
+    """JSON with numeric leaves blanked: two results must share it to be merged."""
+    if isinstance(obj, dict):
+        return {k: _shape(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_shape(v) for v in obj]
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        return None
+    return obj
+
+
+def _eval(expr, nums):
+    op = expr[0]
+    if op == "const":
+        return expr[1]
+    if op == "slot":
+        return nums[expr[1]]
+    if op == "half":
+        return nums[expr[1]] / 2.0
+    if op == "double":
+        return nums[expr[1]] * 2.0
+    if op == "sum":
+        return nums[expr[1]] + nums[expr[2]]
+    if op == "diff":
+        return nums[expr[1]] - nums[expr[2]]
+    raise ValueError(f"Unknown expression {expr!r}")
+
+
+# simpler forms explain a number first: 8 is "thickness", not "2 * holes"
+_RANK = {"slot": 0, "half": 1, "double": 1, "sum": 2, "diff": 2, "const": 3}
+
+
+def _slot_exprs(n):
+    for i in range(n):
+        yield ("slot", i)
+        yield ("half", i)
+        yield ("double", i)
+        for j in range(n):
+            if j != i:
+                yield ("diff", i, j)
+                if j > i:
+                    yield ("sum", i, j)
+
+
+def _explain(value, nums):
+    found = [e for e in _slot_exprs(len(nums)) if abs(_eval(e, nums) - value) < _EPS]
+    return found or [("const", value)]
+
+
+def _slots_of(expr):
+    return set(expr[1:]) if expr[0] != "const" else set()
+
+
+class SkeletonCache:
+    """Learns (numbers -> JSON) mappings per text skeleton; see module doc."""
+
+    def __init__(
+        self,
+        path: str | None = None,
+        *,
+        max_skeletons: int = 500,
+        max_examples: int = 5,
+        writable: bool = True,
+    ):
+        self.path = Path(path) if path else None
+        self.writable = writable
+        self.max_skeletons = max_skeletons
+        self.max_examples = max_examples
+        self.hits = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._entries: dict[str, list] = {}
+        self._load()
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            self._entries = {}
+
+    def _save(self):
+        if self.path is None or not self.writable:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # per process: concurrent writers never share a temp file
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._entries, ensure_ascii=False), "utf-8")
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def learn(self, text: str, data: dict):
+        """Remembers a validated (text, JSON) pair."""
+        skeleton, nums = split_numbers(text)
+        if not nums:
+            return
+        with self._lock:
+            examples = self._entries.pop(skeleton, [])
+            if examples and _shape(examples[0]["data"]) != _shape(data):
+                # same words, different structure: numbers are not the only
+                # difference, forget the skeleton
+                examples = []
+            else:
+                examples = [e for e in examples if e["nums"] != nums]
+                examples.append({"nums": nums, "data": data})
+                examples = examples[-self.max_examples :]
+            if examples:
+                # dict order doubles as LRU order
+                self._entries[skeleton] = examples
+            while len(self._entries) > self.max_skeletons:
+                self._entries.pop(next(iter(self._entries)))
+            self._save()
+
+    def synthesize(self, text: str) -> dict | None:
+        """JSON for `text` by substitution, or None when the mapping is ambiguous."""
+        skeleton, nums = split_numbers(text)
+        with self._lock:
+            examples = self._entries.get(skeleton)
+            result = self._synthesize(examples, nums) if examples else None
+            if examples:
+                if result is None:
+                    self.fallbacks += 1
+                else:
+                    self.hits += 1
+        return result
+
+    def _synthesize(self, examples, nums):
+        base = examples[0]
+        if any(len(e["nums"]) != len(nums) for e in examples):
+            return None
+        confirmed = any(e["nums"] != base["nums"] for e in examples)
+
+        values = [dict(_leaves(e["data"])) for e in examples]
+        out = copy.deepcopy(base["data"])
+        used = set()
+
+        for path in values[0]:
+            cands = set()
+            for e, vals in zip(examples, values):
+                cands.update(_explain(vals[path], e["nums"]))
+            cands = [
+                c
+                for c in cands
+                if all(
+                    abs(_eval(c, e["nums"]) - vals[path]) < _EPS
+                    for e, vals in zip(examples, values)
+                )
+            ]
+            if not cands:
+                return None
+            best = min(_RANK[c[0]] for c in cands)
+            cands = [c for c in cands if _RANK[c[0]] == best]
+            if any(c[0] == "const" and c[1] != 0 for c in cands) and not confirmed:
+                return None
+            results = {round(_eval(c, nums), 6) for c in cands}
+            if len(results) != 1:
+                return None
+            for c in cands:
+                used |= _slots_of(c)
+
+            target = out
+            for k in path[:-1]:
+                target = target[k]
+            v = results.pop()
+            target[path[-1]] = int(v) if v == int(v) else v
+
+        # a changed number nothing depends on (e.g. a hole count) could change
+        # the structure itself
+        for i, (old, new) in enumerate(zip(base["nums"], nums)):
+            if old != new and i not in used:
+                return None
+        return out
+
+    def stats(self) -> str:
+        return f"hits={self.hits} fallbacks={self.fallbacks}"
@@ -0,0 +1,72 @@
+# cad_ai/llm/speculative.py
+"""
+Draft models for llama-cpp speculative decoding.
+
+Most of the output copies spans of the prompt (key names, "action":"sketch",
+"plane":"XOY", the numbers the user typed), so drafts are cheap to guess.
+The main model checks all drafted tokens in one batched forward pass and
+keeps the longest agreeing run; with greedy sampling the output does not
+change, only the number of sequential decode steps.
+
+    "prompt"          n-gram lookup in the prompt (LlamaPromptLookupDecoding)
+    path/to/x.gguf    a tiny model of the same family, e.g. Qwen2.5-0.5B
+                      for Qwen2.5-1.5B (the vocabularies must match)
+"""
+
+from pathlib import Path
+
+PROMPT_LOOKUP = "prompt"
+
+
+def make_draft_model(spec: str, *, num_pred_tokens: int = 10, n_threads: int = 4):
+    """Draft model for Llama(draft_model=...) from an LLM_SPECULATIVE value."""
+    if spec == PROMPT_LOOKUP:
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+
+        return LlamaPromptLookupDecoding(num_pred_tokens=num_pred_tokens)
+
+    p = Path(spec)
+    if not p.exists():
+        raise RuntimeError(f"Draft GGUF model not found: {p}")
+    return _gguf_draft_model(p, num_pred_tokens, n_threads)
+
+
+def _gguf_draft_model(path: Path, num_pred_tokens: int, n_threads: int):
+    import numpy as np
+    from llama_cpp import Llama
+    from llama_cpp.llama_speculative import LlamaDraftModel
+
+    class GGUFDraftModel(LlamaDraftModel):
+        """Greedy continuation by a small model that keeps its own KV cache."""
+
+        def __init__(self):
+            self.llm = Llama(
+                model_path=str(path),
+                n_ctx=0,  # the model's training context
+                n_threads=n_threads,
+                verbose=False,
+            )
+
+        def __call__(self, input_ids, **kwargs):
+            llm = self.llm
+            ids = [int(t) for t in input_ids]
+            # drafts are only asked for the growing main sequence: reuse
+            # whatever prefix the draft context already holds
+            n = 0
+            for a, b in zip(llm.input_ids[: llm.n_tokens], ids[:-1]):
+                if a != b:
+                    break
+                n += 1
+            llm.n_tokens = n
+            llm.eval(ids[n:])
+
+            out = []
+            for _ in range(num_pred_tokens):
+                tok = int(np.argmax(llm.scores[llm.n_tokens - 1]))
+                if tok == llm.token_eos():
+                    break
+                out.append(tok)
+                llm.eval([tok])
+            return np.array(out, dtype=np.intc)
+
+    return GGUFDraftModel()
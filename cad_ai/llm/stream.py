@@ -0,0 +1,111 @@
+# cad_ai/llm/stream.py
+import json
+
+from .validate import validate_step
+
+
+class StreamAbort(ValueError):
+    """Raised by IncrementalStepParser at the first structurally invalid step."""
+
+
+class IncrementalStepParser:
+    """
+    Incremental parser for the streamed LLM output.
+
+    feed() text chunks as they arrive. Every completed object of the root
+    "steps" array is parsed, checked (validate_step: all its errors) and
+    passed to on_step(index, step). Returns True once the root {...} closes,
+    so the caller can stop generating.
+    """
+
+    def __init__(self, on_step=None):
+        self.on_step = on_step
+        self.text = ""
+        self.steps = []
+        self.done = False
+
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key = ""
+        self._array_key = ""
+        self._root_start = -1
+        self._root_end = -1
+        self._step_start = -1
+
+    @property
+    def root_text(self) -> str:
+        """Text of the root object ('' until it is closed)."""
+        if self._root_end == -1:
+            return ""
+        return self.text[self._root_start : self._root_end]
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        self.text += chunk
+
+        text = self.text
+        stack = self._stack
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(stack) == 1:
+                        # root-level string: a key, or a value (harmless)
+                        self._last_key = text[self._string_start + 1 : i]
+                continue
+
+            if not stack:
+                # skip anything before the root object
+                if ch == "{":
+                    stack.append("{")
+                    self._root_start = i
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "[" and len(stack) == 1:
+                    self._array_key = self._last_key
+                if ch == "{" and stack == ["{", "["] and self._array_key == "steps":
+                    self._step_start = i
+                stack.append(ch)
+            elif ch in "}]":
+                opener = stack.pop() if stack else ""
+                if (opener, ch) not in (("{", "}"), ("[", "]")):
+                    raise StreamAbort(f"Unbalanced '{ch}' at offset {i}.")
+                if ch == "}" and self._step_start != -1 and stack == ["{", "["]:
+                    self._complete_step(text[self._step_start : i + 1])
+                    self._step_start = -1
+                if not stack:
+                    self._root_end = i + 1
+                    self.done = True
+                    self._pos = i + 1
+                    return True
+
+        self._pos = len(text)
+        return False
+
+    def _complete_step(self, step_text: str):
+        i = len(self.steps)
+        try:
+            step = json.loads(step_text)
+        except Exception as e:
+            raise StreamAbort(f"Step #{i} is not valid JSON: {e}") from e
+        try:
+            validate_step(step, i)
+        except ValueError as e:
+            raise StreamAbort(str(e)) from e
+        self.steps.append(step)
+        if self.on_step is not None:
+            self.on_step(i, step)
@@ -1,3 +1,31 @@
+# cad_ai/llm/validate.py
+"""
+Validation of generated JSON against the DSL of schema.py.
+
+The schema is compiled once into a SchemaValidator: per action and entity
+type a tuple of (field, checker) pairs with the enum sets prebuilt, so a
+model is checked in one pass without re-reading the schema. Every problem
+is collected as (JSON pointer, message) instead of stopping at the first;
+numbers must be finite ints/floats (not strings or booleans).
+
+With normalize=True the same pass writes the canonical form back: action,
+entity type and direction in lower case, planes in upper case, schema
+defaults for missing fields. This is the only normalization of model
+output.
+"""
+
+import math
+from functools import lru_cache
+
+from .errors import SchemaError
+from .schema import ACTIONS, DIRECTIONS, ENTITIES, PLANES, SCHEMA_VERSION
+
+_isfinite = math.isfinite
+
+# returned by checkers for a value of the wrong type / outside the enum
+_BAD = object()
+
+
 def extract_json_object(text: str) -> str:
     first = text.find("{")
     last = text.rfind("}")
@@ -6,69 +34,240 @@ def extract_json_object(text: str) -> str:
     return text[first : last + 1]
 
 
-def validate_generated_json(data: dict):
-    if not isinstance(data, dict):
-        raise ValueError("JSON root must be an object.")
-    if "steps" not in data or not isinstance(data["steps"], list):
-        raise ValueError("JSON must contain 'steps' as a list.")
+def _number(v):
+    t = type(v)
+    if t is int or (t is float and _isfinite(v)):
+        return v
+    return _BAD
+
+
+def _point(v):
+    # _number inlined: two points per line, tens of thousands of entities
+    if type(v) is list and len(v) == 2:
+        x, y = v
+        tx, ty = type(x), type(y)
+        if (tx is int or (tx is float and _isfinite(x))) and (
+            ty is int or (ty is float and _isfinite(y))
+        ):
+            return v
+    return _BAD
+
+
+def _enum(values, canon):
+    allowed = frozenset(values)
+
+    def check(v):
+        if type(v) is str:
+            v = canon(v.strip())
+            if v in allowed:
+                return v
+        return _BAD
+
+    return check
+
+
+def _plane_ref(v):
+    if type(v) is str and v.strip():
+        v = v.strip()
+        return v.upper() if v.upper() in PLANES else v
+    return _BAD
+
+
+def _bool(v):
+    return v if type(v) is bool else _BAD
+
+
+def _string(v):
+    return v if type(v) is str else _BAD
+
+
+_CHECKERS = {
+    "number": _number,
+    "point": _point,
+    "plane": _enum(PLANES, str.upper),
+    "plane_ref": _plane_ref,
+    "direction": _enum(DIRECTIONS, str.lower),
+    "bool": _bool,
+    "string": _string,
+}
+
+_EXPECTED = {
+    "number": "a finite number",
+    "point": "[x, y] of numbers",
+    "plane": "one of " + "|".join(PLANES),
+    "plane_ref": "a plane or a workplane name",
+    "direction": "one of " + "|".join(DIRECTIONS),
+    "bool": "true or false",
+    "string": "a string",
+    "entities": "a non-empty list of entities",
+}
 
-    allowed_actions = {
-        "sketch",
-        "extrude",
-        "cut",
-        "workplane_offset",
-        "sketch_on_plane",
-    }
-    allowed_planes = {"XOY", "XOZ", "YOZ"}
-    allowed_dirs = {"normal", "reverse", "both"}
 
-    for i, step in enumerate(data["steps"]):
+def _show(v) -> str:
+    r = repr(v)
+    return r if len(r) <= 40 else r[:37] + "..."
+
+
+class SchemaValidator:
+    """The DSL schema compiled to checkers; see errors() and step_errors()."""
+
+    def __init__(self, actions=ACTIONS, entities=ENTITIES):
+        self.actions = {a: self._compile(fields) for a, fields in actions.items()}
+        self.entities = {t: self._compile(fields) for t, fields in entities.items()}
+        self._action_names = "|".join(actions)
+        self._entity_names = "|".join(entities)
+
+    @staticmethod
+    def _compile(fields) -> tuple:
+        return tuple(
+            (f.name, f.aliases, f.kind, _CHECKERS.get(f.kind), f.required, f.default)
+            for f in fields
+        )
+
+    def errors(self, data, *, normalize: bool = False) -> list[tuple[str, str]]:
+        """Every schema error of a whole model as (JSON pointer, message)."""
+        if not isinstance(data, dict):
+            return [("", "JSON root must be an object")]
+        out = []
+        if "name" in data and type(data["name"]) is not str:
+            out.append(("/name", f"must be a string, got {_show(data['name'])}"))
+        steps = data.get("steps")
+        if not isinstance(steps, list):
+            out.append(("/steps", "is required and must be a list"))
+            return out
+        for i, step in enumerate(steps):
+            self._step(step, i, normalize, out)
+        return out
+
+    def step_errors(self, step, i: int, *, normalize: bool = False) -> list:
+        """Errors of one step (index i in /steps), e.g. while streaming."""
+        out = []
+        self._step(step, i, normalize, out)
+        return out
+
+    def _step(self, step, i: int, normalize: bool, out: list):
         if not isinstance(step, dict):
-            raise ValueError(f"Step #{i} must be an object.")
-
-        act = (step.get("action") or "").lower().strip()
-        if act not in allowed_actions:
-            raise ValueError(f"Unknown action '{act}' in step #{i}.")
-
-        if act == "sketch":
-            plane = (step.get("plane") or "XOY").upper()
-            if plane not in allowed_planes:
-                raise ValueError(f"Bad plane '{plane}' in step #{i}.")
-            ents = step.get("entities", [])
-            if not isinstance(ents, list) or len(ents) == 0:
-                raise ValueError(f"Sketch must have entities in step #{i}.")
-            for e in ents:
-                et = (e.get("type") or "").lower()
-                if et not in ("line", "circle"):
-                    raise ValueError(f"Bad entity type '{et}' in step #{i}.")
-                if et == "line" and ("start" not in e or "end" not in e):
-                    raise ValueError(f"Line must have start/end in step #{i}.")
-                if et == "circle" and ("center" not in e or "radius" not in e):
-                    raise ValueError(f"Circle must have center/radius in step #{i}.")
-
-        if act == "extrude":
-            if "height" not in step:
-                raise ValueError(f"Extrude missing 'height' in step #{i}.")
-            d = (step.get("direction") or "both").lower()
-            if d not in allowed_dirs:
-                raise ValueError(f"Bad direction '{d}' in step #{i}.")
-
-        if act == "cut":
-            d = (step.get("direction") or "both").lower()
-            if d not in allowed_dirs:
-                raise ValueError(f"Bad direction '{d}' in step #{i}.")
-            # depth can be missing; builder will default to through_all
-
-        if act == "workplane_offset":
-            bp = (step.get("base_plane") or "").upper()
-            if bp not in allowed_planes:
-                raise ValueError(f"Bad base_plane '{bp}' in step #{i}.")
-            if "offset" not in step or "name" not in step:
-                raise ValueError(
-                    f"workplane_offset must have offset and name in step #{i}."
+            out.append((f"/steps/{i}", "must be an object"))
+            return
+        act = step.get("action")
+        fields = self.actions.get(act)
+        if fields is None and type(act) is str:
+            fields = self.actions.get(act.lower().strip())
+            if fields is not None and normalize:
+                step["action"] = act.lower().strip()
+        if fields is None:
+            out.append(
+                (
+                    f"/steps/{i}/action",
+                    f"unknown action {_show(act)} ({self._action_names})",
+                )
+            )
+            return
+        self._fields(step, fields, f"/steps/{i}", normalize, out)
+
+    def _fields(self, obj: dict, fields, path: str, normalize: bool, out: list):
+        for name, aliases, kind, check, required, default in fields:
+            key = name
+            v = obj.get(name)
+            if v is None:
+                for alias in aliases:
+                    if obj.get(alias) is not None:
+                        key, v = alias, obj[alias]
+                        break
+            if v is None:
+                if required:
+                    out.append((f"{path}/{name}", "is required"))
+                elif default is not None and normalize:
+                    obj[name] = default
+                continue
+            if check is None:  # entities
+                self._entities(v, f"{path}/{key}", normalize, out)
+                continue
+            value = check(v)
+            if value is _BAD:
+                out.append(
+                    (f"{path}/{key}", f"must be {_EXPECTED[kind]}, got {_show(v)}")
+                )
+            elif normalize and value is not v:
+                obj[key] = value
+
+    def _entities(self, ents, path: str, normalize: bool, out: list):
+        if type(ents) is not list or not ents:
+            out.append((path, f"must be {_EXPECTED['entities']}"))
+            return
+        entities = self.entities
+        for j, e in enumerate(ents):
+            if type(e) is not dict:
+                out.append((f"{path}/{j}", "must be an object"))
+                continue
+            t = e.get("type")
+            fields = entities.get(t)
+            if fields is None and type(t) is str:
+                fields = entities.get(t.lower().strip())
+                if fields is not None and normalize:
+                    e["type"] = t.lower().strip()
+            if fields is None:
+                out.append(
+                    (
+                        f"{path}/{j}/type",
+                        f"unknown entity type {_show(t)} ({self._entity_names})",
+                    )
                 )
+                continue
+            # _fields inlined (entity fields have no aliases or defaults):
+            # this loop runs once per entity
+            for name, _, kind, check, required, _ in fields:
+                v = e.get(name)
+                if v is None:
+                    if required:
+                        out.append((f"{path}/{j}/{name}", "is required"))
+                    continue
+                value = check(v)
+                if value is _BAD:
+                    out.append(
+                        (
+                            f"{path}/{j}/{name}",
+                            f"must be {_EXPECTED[kind]}, got {_show(v)}",
+                        )
+                    )
+                elif normalize and value is not v:
+                    e[name] = value
+
+
+def get_validator(schema_version: str = SCHEMA_VERSION) -> SchemaValidator:
+    """The compiled validator, built once per schema version."""
+    if schema_version != SCHEMA_VERSION:
+        raise ValueError(f"Unknown schema version '{schema_version}'.")
+    return _compiled(schema_version)
+
+
+@lru_cache(maxsize=None)
+def _compiled(schema_version: str) -> SchemaValidator:
+    # keyed by the version itself: get_validator() and get_validator("2")
+    # would be two entries of an lru_cache on get_validator
+    return SchemaValidator()
+
+
+def validate_generated_json(data: dict, *, normalize: bool = False):
+    """Raises SchemaError with all errors of data; see SchemaValidator."""
+    errors = get_validator().errors(data, normalize=normalize)
+    if errors:
+        raise SchemaError(errors)
+
+
+def normalize_generated_json(data: dict) -> dict:
+    """Normalizes data in place and validates it in the same pass."""
+    validate_generated_json(data, normalize=True)
+    return data
+
+
+def validate_step(step: dict, i: int, *, normalize: bool = False):
+    """Raises SchemaError with all errors of step #i."""
+    errors = get_validator().step_errors(step, i, normalize=normalize)
+    if errors:
+        raise SchemaError(errors)
+
 
-        if act == "sketch_on_plane":
-            ents = step.get("entities", [])
-            if not isinstance(ents, list) or len(ents) == 0:
-                raise ValueError(f"sketch_on_plane must have entities in step #{i}.")
+def normalize_step(step: dict):
+    """Canonical form of a step that already passed validation."""
+    get_validator().step_errors(step, 0, normalize=True)
@@ -0,0 +1,253 @@
+# cad_ai/templates/text_rules.py
+"""
+Deterministic intent + parameter extraction for common Russian part
+descriptions ("куб 60", "пластина 120 на 80 толщиной 8, 4 отверстия Ø10,
+отступ 15", "уголок 100x60x6 длиной 80", "ступенчатый блок 120x80x20 ...").
+
+A request is routed straight to a TEMPLATES entry only when every required
+parameter was found, every number in the text was consumed by a rule and
+every word is in the vocabulary of that template (_VOCAB): a count in
+words, a position (в центре) or a shape (квадратное) the template cannot
+build sends the request to the LLM instead of being silently ignored.
+"""
+
+import re
+import threading
+
+from .ai_templates import TEMPLATES
+
+_N = r"(\d+(?:[.,]\d+)?)"
+_X = r"\s*(?:x|х|×|\*|на)\s*"
+_D = r"(?:ø|⌀|диаметр\w*)?\s*"
+
+_NUMBER = re.compile(_N)
+_WORD = re.compile(r"[a-zа-я]+")
+_UNSUPPORTED = re.compile(r"фаск|скругл|паз|резьб|бобышк|шпон|зенк|конус|сфер|цилиндр")
+
+CUBE = "Куб (AI)"
+CUBE_HOLE = "Куб с отверстием насквозь (AI)"
+ANGLE = "Уголок перфорированный (AI)"
+PLATE = "Пластина 4 отверстия (AI)"
+STEPPED = "Ступенчатый блок + карман (AI)"
+
+
+def _rx(pattern: str):
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _vocab(*stems: str):
+    return re.compile(r"(?:" + "|".join(("с|со|и|на|x|х|мм",) + stems) + r")$")
+
+
+_HOLE_WORDS = (r"отверсти\w*", r"диаметр\w*", r"насквозь", r"сквозн\w*")
+_MARGIN_WORDS = (r"отступ\w*", r"от", r"кра\w*")
+
+# every non-number word a template's request may contain
+_VOCAB = {
+    CUBE: _vocab(r"куб\w*", r"размер\w*", r"сторон\w*", r"ребр\w*"),
+    CUBE_HOLE: _vocab(
+        r"куб\w*",
+        r"размер\w*",
+        r"сторон\w*",
+        r"ребр\w*",
+        r"по",
+        r"центр\w*",
+        *_HOLE_WORDS,
+    ),
+    PLATE: _vocab(
+        r"пластин\w*",
+        r"толщин\w*",
+        r"по",
+        r"углам",
+        *_HOLE_WORDS,
+        *_MARGIN_WORDS,
+    ),
+    ANGLE: _vocab(
+        r"уголок",
+        r"уголк\w*",
+        r"перфорирован\w*",
+        r"длин\w*",
+        r"больш\w*",
+        r"мал\w*",
+        r"по",
+        *_HOLE_WORDS,
+        *_MARGIN_WORDS,
+    ),
+    STEPPED: _vocab(
+        r"ступенчат\w*",
+        r"блок\w*",
+        r"основани\w*",
+        r"ступен\w*",
+        r"карман\w*",
+        r"глубин\w*",
+    ),
+}
+
+
+_INTENTS = [
+    (STEPPED, _rx(r"ступенчат")),
+    (ANGLE, _rx(r"уголок|уголк")),
+    (PLATE, _rx(r"пластин")),
+    (CUBE, _rx(r"куб")),
+]
+
+_CUBE_SIZE = _rx(r"куб\w*\s*(?:размер\w*\s*|со стороной\s*|с ребром\s*)?" + _N)
+_COUNT = _rx(_N + r"\s*отверсти\w*")
+_HOLE = _rx(r"(?:отверсти\w*|ø|⌀|диаметр\w*)\s*(?:насквозь\s*)?" + _D + _N)
+_DIMS2 = _rx(_N + _X + _N)
+_DIMS3 = _rx(_N + _X + _N + _X + _N)
+_THICK = _rx(r"толщин\w*\s*" + _N)
+_MARGIN = _rx(r"отступ\w*\s*(?:от кра\w*\s*)?" + _N)
+_EDGE_Z = _rx(r"отступ\w*\s*по длине\s*" + _N)
+_LENGTH = _rx(r"длин\w*\s*" + _N)
+_BIG = _rx(r"больш\w*\s*(?:отверсти\w*\s*)?" + _D + _N)
+_SMALL = _rx(r"мал\w*\s*(?:отверсти\w*\s*)?" + _D + _N)
+_BASE = _rx(r"(?:блок|основани\w*)\s*" + _N + _X + _N + _X + _N)
+_STEP = _rx(r"\bступен[ьи]\b\s*" + _N + _X + _N + _X + _N)
+_POCKET = _rx(r"карман\w*\s*" + _N + _X + _N)
+_DEPTH = _rx(r"глубин\w*\s*" + _N)
+
+
+class _Text:
+    """Request text plus the spans of numbers already consumed by a rule."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.used = []
+
+    def take(self, rx):
+        for m in rx.finditer(self.text):
+            spans = [m.span(g) for g in range(1, (m.lastindex or 0) + 1)]
+            if any(s[0] < e and s[1] > b for s in spans for b, e in self.used):
+                continue
+            self.used.extend(spans)
+            return [float(g.replace(",", ".")) for g in m.groups()]
+        return None
+
+    def unknown_words(self, vocab) -> bool:
+        return any(not vocab.match(w) for w in _WORD.findall(self.text))
+
+    def leftover_numbers(self) -> bool:
+        for m in _NUMBER.finditer(self.text):
+            if not any(b <= m.start() < e for b, e in self.used):
+                return True
+        return False
+
+
+def _cube(t: _Text):
+    size = t.take(_CUBE_SIZE)
+    if size is None:
+        return None
+    if re.search(r"отверст|насквозь", t.text):
+        hole = t.take(_HOLE)
+        if hole is None:
+            return None
+        return CUBE_HOLE, {"size": size[0], "hole_d": hole[0]}
+    return CUBE, {"size": size[0]}
+
+
+def _plate(t: _Text):
+    # the template always has 4 corner holes: the count must say so
+    count = t.take(_COUNT)
+    if count is None or count[0] != 4:
+        return None
+    dims = t.take(_DIMS2)
+    thick = t.take(_THICK)
+    hole = t.take(_HOLE)
+    if dims is None or thick is None or hole is None:
+        return None
+    margin = t.take(_MARGIN)
+    p = {"w": dims[0], "h": dims[1], "thickness": thick[0], "hole_d": hole[0]}
+    p["margin"] = margin[0] if margin else _default(PLATE, "margin")
+    return PLATE, p
+
+
+def _angle(t: _Text):
+    dims = t.take(_DIMS3)
+    length = t.take(_LENGTH)
+    if dims is None or length is None:
+        return None
+    p = {"a": dims[0], "b": dims[1], "t": dims[2], "length": length[0]}
+    big = t.take(_BIG) or t.take(_HOLE)
+    small = t.take(_SMALL)
+    edge_z = t.take(_EDGE_Z)
+    edge = t.take(_MARGIN)
+    p["big_d"] = big[0] if big else _default(ANGLE, "big_d")
+    p["small_d"] = small[0] if small else _default(ANGLE, "small_d")
+    p["edge_x"] = edge[0] if edge else _default(ANGLE, "edge_x")
+    p["edge_z"] = edge_z[0] if edge_z else p["edge_x"]
+    return ANGLE, p
+
+
+def _stepped(t: _Text):
+    base = t.take(_BASE)
+    if base is None:
+        return None
+    step = t.take(_STEP)
+    pocket = t.take(_POCKET)
+    depth = t.take(_DEPTH)
+    if step is None or pocket is None:
+        return None  # the step and pocket would be made up from defaults
+    p = {"w": base[0], "h": base[1], "base_z": base[2]}
+    names = [("step_w", step, 0), ("step_h", step, 1), ("step_z", step, 2)]
+    names += [("pocket_w", pocket, 0), ("pocket_h", pocket, 1)]
+    names += [("pocket_depth", depth, 0)]
+    for key, found, i in names:
+        p[key] = found[i] if found else _default(STEPPED, key)
+    return STEPPED, p
+
+
+_PARSERS = {CUBE: _cube, PLATE: _plate, ANGLE: _angle, STEPPED: _stepped}
+
+
+def _default(template: str, key: str) -> float:
+    for k, _, default in TEMPLATES[template]["params"]:
+        if k == key:
+            return default
+    raise KeyError(key)
+
+
+def match_template(text: str):
+    """(template name, params) when the text is fully recognized, else None."""
+    t = _Text((text or "").lower().replace("ё", "е"))
+    if _UNSUPPORTED.search(t.text):
+        return None
+    for name, rx in _INTENTS:
+        if rx.search(t.text):
+            found = _PARSERS[name](t)
+            if found is None or t.leftover_numbers():
+                return None
+            if t.unknown_words(_VOCAB[found[0]]):
+                return None
+            return found
+    return None
+
+
+class RuleRouter:
+    """match_template + TEMPLATES build, with match/fallback counters."""
+
+    def __init__(self):
+        self.matched = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def route(self, text: str) -> dict | None:
+        data = None
+        found = match_template(text)
+        if found is not None:
+            name, params = found
+            try:
+                data = TEMPLATES[name]["build"](params)
+            except ValueError:
+                data = None  # e.g. margin too large: let the model decide
+        with self._lock:
+            if data is None:
+                self.fallbacks += 1
+            else:
+                self.matched += 1
+        return data
+
+    def stats(self) -> str:
+        total = self.matched + self.fallbacks
+        rate = self.matched / total if total else 0.0
+        return f"matched={self.matched} fallbacks={self.fallbacks} ({rate:.0%})"
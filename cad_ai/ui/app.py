@@ -1,6 +1,8 @@
+import asyncio
 import json
 import traceback
 import threading
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox
 from pathlib import Path
@@ -11,14 +13,63 @@ from cad_ai.config import (
     APP_TITLE,
     APP_GEOMETRY,
     APP_MINSIZE,
+    LLM_AUTOTUNE,
+    LLM_BACKEND,
+    LLM_CACHE_DIR,
     LLM_ENABLED,
+    LLM_FAST_PATH,
+    LLM_GRAMMAR,
+    LLM_MAX_TOKENS,
+    LLM_METRICS_PATH,
+    LLM_MLOCK,
     LLM_MODEL_PATH,
+    LLM_N_CTX,
+    LLM_N_GPU_LAYERS,
+    LLM_N_THREADS,
+    LLM_OUTPUT_FORMAT,
+    LLM_PLAN,
+    LLM_PLAN_WORKERS,
+    LLM_PREFIX_CACHE,
+    LLM_PREGENERATE,
+    LLM_PREGENERATE_DELAY_MS,
+    LLM_PROMPTS_DIR,
+    LLM_PROMPT_VARIANT,
+    LLM_REPAIR_ATTEMPTS,
+    LLM_REPAIR_SECONDS,
+    LLM_RESULT_CACHE,
+    LLM_RESULT_CACHE_MAX,
+    LLM_RETRIEVAL_BUDGET,
+    LLM_RETRIEVAL_K,
+    LLM_SKELETON_CACHE,
+    LLM_SPECULATIVE,
+    LLM_STREAM,
+    LLM_WARMUP,
 )
 from cad_ai.kompas.connect import connect_kompas, new_document_part
 from cad_ai.kompas.builder import Kompas3DBuilder
 from cad_ai.templates import TEMPLATES
+from cad_ai.llm.autotune import autotune, load_profile
+from cad_ai.llm.backends import make_backend
 from cad_ai.llm.engine import LocalLLMEngine
-from cad_ai.llm.errors import LLMJSONError
+from cad_ai.llm.errors import LLMCancelled, LLMJSONError
+from cad_ai.llm.fingerprint import model_fingerprint
+from cad_ai.llm.plan import needs_plan
+from cad_ai.llm.pool import LLMWorkerPool, available_cores
+from cad_ai.ui.pregen import Pregeneration
+
+
+def describe_step(step: dict) -> str:
+    act = step.get("action", "?")
+    if "entities" in step:
+        plane = step.get("plane", "XOY")
+        return f"{act} ({plane}, {len(step['entities'])} entities)"
+    if act == "extrude":
+        return f"{act} (height={step.get('height')})"
+    if act == "cut":
+        if step.get("through_all"):
+            return f"{act} (through all)"
+        return f"{act} (depth={step.get('depth')})"
+    return act
 
 
 class App(tk.Tk):
@@ -42,11 +93,27 @@ class App(tk.Tk):
         self.llm_raw = None
         self.llm_extracted = None
         self.llm_prompt = None
+        self.llm_budget = {}
+        self.llm_timings = {}
+        self.llm_base = None
         self._llm_engine = None
+        self._llm_pool = None
+        self._llm_pool_lock = threading.Lock()
         self._llm_busy = False
+        self._llm_ready = threading.Event()
+        self._llm_loop = None
+        self._llm_future = None
+        self._llm_request_id = 0
+        self._pregen = Pregeneration(self._submit_pregeneration)
+        self._pregen_after = None
 
         self._build_ui()
 
+        if LLM_ENABLED and LLM_WARMUP:
+            self.start_llm_warmup()
+        else:
+            self._llm_ready.set()
+
     # -----------------
     # UI
     # -----------------
@@ -70,6 +137,8 @@ class App(tk.Tk):
             value="пластина 120 на 80 толщиной 8, 4 отверстия 10, отступ 15"
         )
         ttk.Entry(llm_box, textvariable=self.prompt_var).pack(fill="x")
+        if LLM_ENABLED and LLM_PREGENERATE:
+            self.prompt_var.trace_add("write", self.on_prompt_changed)
 
         row = ttk.Frame(llm_box)
         row.pack(fill="x", pady=(8, 0))
@@ -79,6 +148,16 @@ class App(tk.Tk):
         )
         self.btn_llm_generate.pack(side="left")
 
+        self.btn_llm_edit = ttk.Button(
+            row, text="Edit LLM JSON", command=self.on_edit_llm
+        )
+        self.btn_llm_edit.pack(side="left", padx=8)
+
+        self.btn_llm_cancel = ttk.Button(
+            row, text="Cancel", command=self.on_cancel_llm, state="disabled"
+        )
+        self.btn_llm_cancel.pack(side="left", padx=8)
+
         self.btn_llm_build = ttk.Button(
             row, text="Build LLM result", command=self.on_build_llm
         )
@@ -186,8 +265,9 @@ class App(tk.Tk):
         self._llm_busy = bool(busy)
         state = "disabled" if busy else "normal"
 
+        # Generate stays enabled: pressing it again supersedes the request
         for btn in (
-            "btn_llm_generate",
+            "btn_llm_edit",
             "btn_llm_build",
             "btn_llm_show_json",
             "btn_llm_show_raw",
@@ -198,6 +278,10 @@ class App(tk.Tk):
                     b.configure(state=state)
                 except Exception:
                     pass
+        try:
+            self.btn_llm_cancel.configure(state="normal" if busy else "disabled")
+        except Exception:
+            pass
 
         if status is not None:
             self.llm_status_var.set(status)
@@ -220,6 +304,16 @@ class App(tk.Tk):
             parts.append("=== PROMPT SENT TO LLM ===\n" + self.llm_prompt.strip())
         if self.llm_raw:
             parts.append("\n\n=== RAW LLM OUTPUT ===\n" + self.llm_raw.strip())
+        if self.llm_budget:
+            parts.append(
+                "\n\n=== TOKENS ===\n"
+                + "\n".join(f"{k}: {v}" for k, v in self.llm_budget.items())
+            )
+        if self.llm_timings:
+            parts.append(
+                "\n\n=== TIMINGS ===\n"
+                + "\n".join(f"{k}: {v}" for k, v in self.llm_timings.items())
+            )
         if self.llm_extracted:
             parts.append(
                 "\n\n=== EXTRACTED JSON (what we tried to parse) ===\n"
@@ -285,81 +379,350 @@ class App(tk.Tk):
     # -----------------
     # LLM
     # -----------------
+    def llm_engine_kwargs(self) -> dict:
+        """LocalLLMEngine settings shared by the app engine and pool workers."""
+        return dict(
+            n_ctx=LLM_N_CTX,
+            max_tokens=LLM_MAX_TOKENS,
+            speculative=LLM_SPECULATIVE,
+            repair_attempts=LLM_REPAIR_ATTEMPTS,
+            repair_seconds=LLM_REPAIR_SECONDS,
+            n_gpu_layers=LLM_N_GPU_LAYERS,
+            cache_dir=LLM_CACHE_DIR,
+            prefix_cache=LLM_PREFIX_CACHE,
+            grammar=LLM_GRAMMAR,
+            use_mlock=LLM_MLOCK,
+            result_cache=LLM_RESULT_CACHE,
+            result_cache_max=LLM_RESULT_CACHE_MAX,
+            skeleton_cache=LLM_SKELETON_CACHE,
+            fast_path=LLM_FAST_PATH,
+            retrieval_k=LLM_RETRIEVAL_K,
+            retrieval_budget=LLM_RETRIEVAL_BUDGET,
+            output_format=LLM_OUTPUT_FORMAT,
+            prompt_variant=LLM_PROMPT_VARIANT,
+            prompts_dir=LLM_PROMPTS_DIR,
+        )
+
     def get_llm_engine(self) -> LocalLLMEngine:
+        """The engine, created on first use; called off the Tk thread."""
         if not LLM_ENABLED:
             raise RuntimeError("LLM is disabled (LLM_ENABLED=False).")
         if self._llm_engine is None:
             model_path = Path(LLM_MODEL_PATH)
-            self.log_write(f"Loading local LLM: {model_path} ...")
+            self.after(0, self.log_write, f"Loading local LLM: {model_path} ...")
             self._llm_engine = LocalLLMEngine(
                 model_path=str(model_path),
-                n_ctx=2048,
-                n_threads=8,
-                n_gpu_layers=0,
+                n_threads=LLM_N_THREADS,
+                backend=make_backend(LLM_BACKEND) if LLM_BACKEND else None,
+                metrics_path=LLM_METRICS_PATH,
+                **self.llm_engine_kwargs(),
             )
-            self.log_write("LLM loaded ✅")
+            self.after(0, self.log_write, "LLM loaded ✅")
         return self._llm_engine
 
-    def generate_llm_json(self, user_text: str) -> dict:
-        eng = self.get_llm_engine()
-        data = eng.generate_json(user_text)
+    def get_llm_pool(self) -> LLMWorkerPool | None:
+        """
+        Worker processes for the feature calls of plan mode (LLM_PLAN), made
+        on first use off the Tk thread; None when plan mode is off, the
+        backend is not llama-cpp in process or there are not two workers.
+        """
+        if not LLM_PLAN or LLM_BACKEND:
+            return None
+        with self._llm_pool_lock:
+            if self._llm_pool is None:
+                cores = len(available_cores())
+                n = min(LLM_PLAN_WORKERS or cores // 8, cores)
+                if n < 2:
+                    self._llm_pool = False
+                    return None
+                self.after(0, self.log_write, f"Starting {n} LLM plan workers ...")
+                # every worker gets n_threads from its own share of the cores
+                self._llm_pool = LLMWorkerPool(
+                    str(Path(LLM_MODEL_PATH)), n_workers=n, **self.llm_engine_kwargs()
+                )
+            return self._llm_pool or None
+
+    def start_llm_warmup(self):
+        """Loads the model and warms the prefix cache on a background thread."""
+        stages = {
+            "autotune": "LLM: autotuning threads (once per machine)...",
+            "load": "LLM: warm-up (loading model)...",
+            "prefix": "LLM: warm-up (prompt prefix)...",
+            "generate": "LLM: warm-up (test generation)...",
+            "ready": "LLM: idle",
+        }
+
+        def progress(stage):
+            self.after(0, self.llm_status_var.set, stages.get(stage, stage))
 
-        self.llm_raw = eng.last_raw
-        self.llm_extracted = eng.last_extracted
-        self.llm_prompt = eng.last_prompt
+        def worker():
+            try:
+                t0 = time.perf_counter()
+                self.autotune_llm(progress)
+                eng = self.get_llm_engine()
+                eng.warm_up(progress=progress)
+                # plan workers load their models in the background
+                self.get_llm_pool()
+                dt = time.perf_counter() - t0
+                self.after(0, self.log_write, f"LLM warm-up done in {dt:.1f}s ✅")
+                if not LLM_BACKEND:
+                    source = "autotuned" if eng.tuned else "default"
+                    self.after(
+                        0,
+                        self.log_write,
+                        f"LLM threads={eng.n_threads} "
+                        f"threads_batch={eng.n_threads_batch} "
+                        f"n_batch={eng.n_batch} ({source})",
+                    )
+            except Exception:
+                msg = "LLM warm-up failed:\n" + traceback.format_exc()
 
-        return data
+                def err():
+                    self.log_write(msg)
+                    self.llm_status_var.set("LLM: idle (warm-up failed)")
 
-    def on_generate_llm(self):
-        text = self.prompt_var.get().strip()
-        if not text:
-            messagebox.showwarning("Empty", "Введите текстовый запрос")
+                self.after(0, err)
+            finally:
+                self._llm_ready.set()
+
+        self.llm_status_var.set(stages["load"])
+        threading.Thread(target=worker, daemon=True).start()
+
+    def autotune_llm(self, progress):
+        """Runs the thread/batch autotune once per machine + model (LLM_AUTOTUNE)."""
+        if not LLM_AUTOTUNE or LLM_BACKEND or LLM_N_THREADS is not None:
             return
-        if self._llm_busy:
+        path = Path(LLM_MODEL_PATH)
+        if not path.exists():
             return
+        if load_profile(LLM_CACHE_DIR, model_fingerprint(str(path))) is not None:
+            return
+        progress("autotune")
+        best = autotune(
+            str(path),
+            LLM_CACHE_DIR,
+            grammar=LLM_GRAMMAR,
+            output_format=LLM_OUTPUT_FORMAT,
+        )
+        self.after(
+            0,
+            self.log_write,
+            f"LLM autotune: {best['prefill_tps']:.0f} prefill tok/s, "
+            f"{best['decode_tps']:.1f} decode tok/s",
+        )
 
-        self.set_llm_busy(True, status="LLM: generating...")
-
-        def worker():
-            try:
-                self.log_write("LLM: generating JSON...")
-                data = self.generate_llm_json(text)
+    def get_llm_loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop on a background thread that runs LLM requests."""
+        if self._llm_loop is None:
+            self._llm_loop = asyncio.new_event_loop()
+            threading.Thread(target=self._llm_loop.run_forever, daemon=True).start()
+        return self._llm_loop
+
+    async def run_llm(
+        self, user_text: str, on_step=None, *, edit_base=None, quiet=False
+    ) -> tuple[dict, dict]:
+        """
+        Generates on the engine (an edit of edit_base when given); returns
+        the result and a report of the run. Runs on the LLM loop: the UI is
+        only touched through self.after.
+        """
+        loop = asyncio.get_running_loop()
+        # the model may still be loading: wait off the event loop
+        await loop.run_in_executor(None, self._llm_ready.wait)
+        if not quiet:
+            self.after(0, self.llm_status_var.set, "LLM: generating...")
+            self.after(0, self.log_write, "LLM: generating JSON...")
+        eng = await loop.run_in_executor(None, self.get_llm_engine)
+        pool = await loop.run_in_executor(None, self.get_llm_pool)
+        # without workers the feature calls would run one after another
+        auto = pool is not None and needs_plan(user_text)
+        plan = LLM_PLAN is True or (LLM_PLAN == "auto" and auto)
+        data, report = await eng.generate_json_async(
+            user_text,
+            on_step=on_step,
+            stream=LLM_STREAM,
+            plan=plan,
+            pool=pool,
+            edit=edit_base is not None,
+            edit_base=edit_base,
+        )
+        report.update(text=user_text, edit=edit_base is not None)
+        return data, report
+
+    def show_llm_report(self, report: dict):
+        self.llm_raw = report["raw"]
+        self.llm_extracted = report["extracted"]
+        self.llm_prompt = report["prompt"]
+        self.llm_budget = report["budget"]
+        self.llm_timings = report["timings"]
+
+        if report["edit"]:
+            n = self.llm_budget.get("output_tokens", 0)
+            self.log_write(f"LLM edit applied ({n} output tokens): {report['text']}")
+        plan = report["plan"]
+        if plan.get("features"):
+            kinds = ", ".join(f["kind"] for f in plan["features"])
+            self.log_write(
+                f"LLM plan: {kinds} (plan {plan['plan_ms']:.0f} ms, "
+                f"details {plan.get('detail_ms', 0):.0f} ms)"
+            )
+        for warning in self.llm_budget.get("warnings", ()):
+            self.log_write(f"LLM token budget: {warning}")
+        if report["repairs"]:
+            self.log_write(f"LLM answer repaired after {report['repairs']} attempt(s)")
+
+        if report["stats"]:
+            self.log_write(f"LLM result from {report['source']} ({report['stats']})")
+        t = self.llm_timings
+        self.log_write(
+            f"LLM timings: total {t.get('total_ms', 0):.0f} ms, "
+            f"ttft {t.get('ttft_ms', 0):.0f} ms, "
+            f"{t.get('tokens_per_s', 0):.1f} tok/s; {report['summary']}"
+        )
 
-                def ok():
-                    self.llm_json = data
-                    self.log_write("LLM JSON ready ✅")
-                    self.set_llm_busy(False, status="LLM: idle")
-                    self.show_json_window("LLM JSON output", data)
+    async def generate_llm_json(
+        self, user_text: str, on_step=None, *, edit_base=None, pregenerated=None
+    ) -> dict:
+        if pregenerated is not None:
+            self.after(0, self.log_write, "LLM: using the pre-generated result")
+            data, report = await asyncio.wrap_future(pregenerated)
+        else:
+            data, report = await self.run_llm(user_text, on_step, edit_base=edit_base)
+
+        def accept():
+            self.show_llm_report(report)
+            # the accepted result is what the next edit patches
+            base_text = edit_base[0] if edit_base else user_text
+            self.llm_base = (base_text, data)
+
+        # scheduled before the future's done callback, so it runs first
+        self.after(0, accept)
+        return data
 
-                self.after(0, ok)
+    # -----------------
+    # Pre-generation while typing (LLM_PREGENERATE)
+    # -----------------
+    def on_prompt_changed(self, *_):
+        self._pregen.text_changed(self.prompt_var.get().strip())
+        if self._pregen_after is not None:
+            self.after_cancel(self._pregen_after)
+        self._pregen_after = self.after(
+            LLM_PREGENERATE_DELAY_MS, self.start_pregeneration
+        )
 
-            except LLMJSONError as e:
+    def _submit_pregeneration(self, text: str, edit_base):
+        return asyncio.run_coroutine_threadsafe(
+            self.run_llm(text, edit_base=edit_base, quiet=True), self.get_llm_loop()
+        )
 
-                def err(e):
-                    self.log_write(
-                        "LLM ERROR (parse/validate):\n" + traceback.format_exc()
-                    )
-                    self.llm_raw = getattr(e, "raw", "") or self.llm_raw
-                    self.llm_extracted = (
-                        getattr(e, "extracted", "") or self.llm_extracted
-                    )
-                    self.llm_prompt = getattr(e, "prompt", "") or self.llm_prompt
-                    self.set_llm_busy(False, status="LLM: error (see raw)")
-                    self.on_show_llm_raw()
-                    messagebox.showerror("LLM error", str(e))
+    def start_pregeneration(self):
+        """Starts a background run once the text has been stable for a while."""
+        self._pregen_after = None
+        if self._llm_future is not None:
+            return
+        fut = self._pregen.start(self.prompt_var.get().strip(), self.llm_base)
+        if fut is None:
+            return
 
-                self.after(0, err, e)
+        def done(fut):
+            ok = not fut.cancelled() and fut.exception() is None
+            if ok and self._pregen.is_current(fut) and not self._llm_busy:
+                self.llm_status_var.set("LLM: result ready (pre-generated)")
 
-            except Exception as e:
+        fut.add_done_callback(lambda fut: self.after(0, done, fut))
 
-                def err2():
-                    self.log_write("LLM ERROR:\n" + traceback.format_exc())
-                    self.set_llm_busy(False, status="LLM: error")
-                    messagebox.showerror("LLM error", str(e))
+    def on_edit_llm(self):
+        if not self.llm_json:
+            messagebox.showinfo("No data", "Сначала сгенерируй JSON (LLM).")
+            return
+        self.on_generate_llm(edit=True)
 
-                self.after(0, err2)
+    def on_generate_llm(self, edit: bool = False):
+        """Generates from the request; edit=True patches the last LLM JSON."""
+        text = self.prompt_var.get().strip()
+        if not text:
+            messagebox.showwarning("Empty", "Введите текстовый запрос")
+            return
+        edit_base = self.llm_base if edit else None
+        pregenerated = self._pregen.take(text, edit_base)
+        self._pregen.clicked(edit)
+        if self._llm_future is not None:
+            # superseded: stop the old decode so its cores are free at once
+            self._llm_future.cancel()
+            self.log_write("LLM: previous request cancelled")
+
+        self._llm_request_id += 1
+        request_id = self._llm_request_id
+        if self._llm_ready.is_set():
+            self.set_llm_busy(True, status="LLM: generating...")
+        else:
+            # the request waits for warm-up instead of blocking the UI
+            self.set_llm_busy(True, status="LLM: queued until warm-up finishes...")
+
+        def on_step(i, step):
+            def show():
+                if request_id != self._llm_request_id:
+                    return
+                self.log_write(f"  step #{i}: {describe_step(step)}")
+                self.llm_status_var.set(f"LLM: generating... ({i + 1} steps)")
+
+            self.after(0, show)
+
+        def done(fut):
+            # runs in the main loop; results of superseded requests are dropped
+            if request_id != self._llm_request_id:
+                return
+            self._llm_future = None
+
+            if fut.cancelled():
+                self.set_llm_busy(False, status="LLM: cancelled")
+                return
+            e = fut.exception()
+            if e is None:
+                data = fut.result()
+                self.llm_json = data
+                self.log_write("LLM JSON ready ✅")
+                self.set_llm_busy(False, status="LLM: idle")
+                self.show_json_window("LLM JSON output", data)
+            elif isinstance(e, LLMCancelled):
+                self.set_llm_busy(False, status="LLM: cancelled")
+            elif isinstance(e, LLMJSONError):
+                self.log_write(
+                    "LLM ERROR (parse/validate):\n"
+                    + "".join(traceback.format_exception(e))
+                )
+                self.llm_raw = getattr(e, "raw", "") or self.llm_raw
+                self.llm_extracted = getattr(e, "extracted", "") or self.llm_extracted
+                self.llm_prompt = getattr(e, "prompt", "") or self.llm_prompt
+                if e.report:
+                    self.llm_budget = e.report["budget"]
+                    self.llm_timings = e.report["timings"]
+                self.set_llm_busy(False, status="LLM: error (see raw)")
+                self.on_show_llm_raw()
+                messagebox.showerror("LLM error", str(e))
+            else:
+                self.log_write(
+                    "LLM ERROR:\n" + "".join(traceback.format_exception(e))
+                )
+                self.set_llm_busy(False, status="LLM: error")
+                messagebox.showerror("LLM error", str(e))
+
+        self._llm_future = asyncio.run_coroutine_threadsafe(
+            self.generate_llm_json(
+                text,
+                on_step=on_step,
+                edit_base=edit_base,
+                pregenerated=pregenerated,
+            ),
+            self.get_llm_loop(),
+        )
+        self._llm_future.add_done_callback(lambda fut: self.after(0, done, fut))
 
-        threading.Thread(target=worker, daemon=True).start()
+    def on_cancel_llm(self):
+        if self._llm_future is None:
+            return
+        self._llm_future.cancel()
+        self.log_write("LLM: generation cancelled")
 
     def on_build_llm(self):
         try:
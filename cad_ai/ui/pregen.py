@@ -0,0 +1,59 @@
+# cad_ai/ui/pregen.py
+"""
+Speculative pre-generation while the request is being typed (LLM_PREGENERATE).
+
+At most one background run exists, for one text. It runs the path the next
+click will most likely take: the one of the last click. After Generate (and
+at start) the text is a new request; after Edit it is the next edit of the
+current result, and only a patch is decoded. A click takes the run only if
+it is for the same text and the same path, else the run is cancelled and
+the click starts its own.
+"""
+
+
+class Pregeneration:
+    """
+    start(text, edit_base) submits the run and returns a
+    concurrent.futures.Future; edit_base is None for a new request.
+    """
+
+    def __init__(self, start):
+        self._start = start
+        self._run = None  # (text, edit_base, future)
+        self.edit = False
+
+    def clicked(self, edit: bool):
+        """Remembers the path of the last click for the next background run."""
+        self.edit = edit
+
+    def text_changed(self, text: str):
+        """Cancels the run when the text it was started for is gone."""
+        if self._run is not None and self._run[0] != text:
+            self._run[2].cancel()
+            self._run = None
+
+    def start(self, text: str, result_base=None):
+        """
+        Starts a run for text (result_base: the result an edit would patch);
+        returns its future, or None if one is already there.
+        """
+        if not text or self._run is not None:
+            return None
+        edit_base = result_base if self.edit else None
+        fut = self._start(text, edit_base)
+        self._run = (text, edit_base, fut)
+        return fut
+
+    def is_current(self, fut) -> bool:
+        return self._run is not None and self._run[2] is fut
+
+    def take(self, text: str, edit_base=None):
+        """The run (finished or in flight) for exactly this text and path."""
+        run, self._run = self._run, None
+        if run is None:
+            return None
+        run_text, run_base, fut = run
+        if run_text != text or run_base is not edit_base or fut.cancelled():
+            fut.cancel()
+            return None
+        return fut
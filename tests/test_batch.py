@@ -0,0 +1,19 @@
+import pytest
+
+from cad_ai.llm.batch import read_descriptions
+
+
+def test_read_descriptions_by_column(tmp_path):
+    path = tmp_path / "parts.csv"
+    path.write_text("id,description\n1,куб 10\n2, \n3,куб 20\n", encoding="utf-8")
+    assert read_descriptions(str(path), "description") == ["куб 10", "куб 20"]
+
+
+def test_missing_column_names_it_and_the_file(tmp_path):
+    path = tmp_path / "parts.csv"
+    path.write_text("id,text\n1,куб 10\n", encoding="utf-8")
+    with pytest.raises(ValueError) as e:
+        read_descriptions(str(path), "description")
+    assert "'description'" in str(e.value)
+    assert str(path) in str(e.value)
+    assert "id, text" in str(e.value)
@@ -0,0 +1,41 @@
+import pytest
+
+from cad_ai.llm.compact import expand_compact, to_compact
+from cad_ai.llm.validate import validate_generated_json
+from cad_ai.templates import TEMPLATES
+
+
+@pytest.mark.parametrize("name", list(TEMPLATES))
+def test_templates_round_trip(name):
+    tpl = TEMPLATES[name]
+    data = tpl["build"]({key: default for key, _, default in tpl["params"]})
+    back = expand_compact(to_compact(data))
+    validate_generated_json(back)
+    assert to_compact(back) == to_compact(data)
+
+
+def test_docstring_example():
+    data = expand_compact("S XOY; R 0 0 120 80; C 15 15 5; E 8 both")
+    sketch, extrude = data["steps"]
+    assert [e["type"] for e in sketch["entities"]] == ["line"] * 4 + ["circle"]
+    right = {"type": "line", "start": [120, 0], "end": [120, 80]}
+    assert sketch["entities"][1] == right
+    assert extrude == {"action": "extrude", "height": 8, "direction": "both"}
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("C 1 2 3", "Line 1: 'C' outside of a sketch."),
+        ("S XOY\nR 0 0 1", "Line 2: 'R' needs 4 numbers."),
+        ("S QQQ", "Line 1: bad plane 'QQQ'."),
+        ("S; L 0 0 a 1", "Line 1: 'a' is not a number."),
+        ("E 5 sideways", "Line 1: bad direction 'sideways'."),
+        ("Z 1", "Line 1: unknown statement 'Z'."),
+        ("N only a name", "Compact script has no steps."),
+    ],
+)
+def test_errors_name_the_line(text, message):
+    with pytest.raises(ValueError) as e:
+        expand_compact(text)
+    assert str(e.value) == message
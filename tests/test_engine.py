@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from cad_ai.llm import backends
+from cad_ai.llm.backends import LlamaCppBackend, StubBackend
+from cad_ai.llm.engine import LocalLLMEngine
+from cad_ai.llm.errors import LLMJSONError
+
+TEXT = "пластина 100 на 60 толщиной 5"
+
+
+def test_budget_keeps_every_warning():
+    # small enough to drop the retrieved example and then cut the output
+    eng = LocalLLMEngine("stub", backend=StubBackend(n_ctx=1500), retrieval_k=2)
+    eng.generate_json(TEXT)
+    budget = eng.last_budget
+    assert budget["trimmed_examples"] > 0
+    assert budget["max_tokens"] < eng.max_tokens
+    assert len(budget["warnings"]) == 2
+    assert "example" in budget["warnings"][0]
+    assert "output budget" in budget["warnings"][1]
+
+
+def test_budget_without_pressure_has_no_warnings():
+    eng = LocalLLMEngine("stub", backend=StubBackend())
+    eng.generate_json(TEXT)
+    assert "warnings" not in eng.last_budget
+
+
+class _BrokenBackend(StubBackend):
+    def _answer(self, prompt) -> str:
+        return "{no json here}"
+
+
+def test_async_returns_the_report_of_its_own_run():
+    eng = LocalLLMEngine("stub", backend=StubBackend())
+    eng.last_plan = {"features": ["stale"]}
+    data, report = asyncio.run(eng.generate_json_async(TEXT, stream=False))
+    assert data["steps"]
+    assert report["source"] == "llm" and report["plan"] == {}
+    assert report["budget"] == eng.last_budget
+    assert report["budget"] is not eng.last_budget
+    assert report["extracted"] == eng.last_extracted
+
+
+def test_async_error_carries_the_report():
+    eng = LocalLLMEngine("stub", backend=_BrokenBackend())
+    with pytest.raises(LLMJSONError) as e:
+        asyncio.run(eng.generate_json_async(TEXT, stream=False))
+    assert e.value.report["raw"] == "{no json here}"
+    assert e.value.report["budget"]["prompt_tokens"] > 0
+
+
+def test_llama_fingerprint_hashes_the_file_once(tmp_path, monkeypatch):
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"GGUF")
+    calls = []
+    monkeypatch.setattr(
+        backends, "model_fingerprint", lambda path: calls.append(path) or "fp"
+    )
+    backend = LlamaCppBackend(str(model), n_threads=1)
+    assert backend.fingerprint() == backend.fingerprint() == "fp"
+    assert calls == [str(model)]
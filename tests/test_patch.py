@@ -0,0 +1,75 @@
+import pytest
+
+from cad_ai.llm.patch import apply_patch, parse_patch
+
+BASE = {
+    "name": "Plate",
+    "steps": [
+        {"action": "extrude", "height": 8},
+        {"action": "cut", "through_all": True},
+    ],
+}
+
+
+def test_parse_accepts_an_array_or_one_object():
+    op = {"op": "remove", "path": "/steps/1"}
+    assert parse_patch('Вот патч: [{"op": "remove", "path": "/steps/1"}]') == [op]
+    assert parse_patch('{"op": "remove", "path": "/steps/1"}') == [op]
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ('[{"op": "remove"}', "Unterminated JSON Patch array."),
+        ("[1, 2]", "JSON Patch must be an array of operation objects."),
+        ("no patch", "LLM did not return a JSON object."),
+    ],
+)
+def test_parse_errors(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_patch(text)
+
+
+def test_operations_leave_the_input_alone():
+    ops = [
+        {"op": "test", "path": "/steps/0/height", "value": 8},
+        {"op": "replace", "path": "/steps/0/height", "value": 12},
+        {"op": "add", "path": "/steps/-", "value": {"action": "extrude"}},
+        {"op": "copy", "from": "/name", "path": "/title"},
+        {"op": "move", "from": "/steps/1", "path": "/steps/0"},
+        {"op": "remove", "path": "/name"},
+    ]
+    out = apply_patch(BASE, ops)
+    assert out == {
+        "title": "Plate",
+        "steps": [
+            {"action": "cut", "through_all": True},
+            {"action": "extrude", "height": 12},
+            {"action": "extrude"},
+        ],
+    }
+    assert BASE["steps"][0]["height"] == 8 and BASE["name"] == "Plate"
+
+
+@pytest.mark.parametrize(
+    "op, message",
+    [
+        ({"op": "remove", "path": "/steps/9"}, "Array index 9 out of range."),
+        ({"op": "remove", "path": "/steps/x"}, "Bad array index 'x'."),
+        ({"op": "remove", "path": "steps/0"}, "Bad JSON pointer 'steps/0'."),
+        ({"op": "remove", "path": "/nope"}, "Path '/nope' not found."),
+        ({"op": "replace", "path": "/steps/0/x/y", "value": 1}, "'x' not found."),
+        ({"op": "add", "path": "/steps/0"}, "'value' is missing."),
+        ({"op": "move", "path": "/steps/0"}, "'from' is missing."),
+        ({"op": "test", "path": "/name", "value": "Cube"}, "test failed."),
+        ({"op": "replace", "path": "", "value": {}}, "whole document"),
+        ({"op": "rename", "path": "/name"}, "Unsupported operation"),
+        ({"op": "add", "path": "/name/x", "value": 1}, "Cannot add into '/name/x'."),
+    ],
+)
+def test_errors_name_the_failing_operation(op, message):
+    ops = [{"op": "test", "path": "/steps/0/height", "value": 8}, op]
+    with pytest.raises(ValueError) as e:
+        apply_patch(BASE, ops)
+    assert str(e.value).startswith(f"Patch operation 1 ({op['op']} {op['path']}): ")
+    assert message in str(e.value)
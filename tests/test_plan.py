@@ -0,0 +1,120 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from cad_ai.llm.backends import StubBackend
+from cad_ai.llm.engine import LocalLLMEngine
+from cad_ai.llm.errors import LLMCancelled
+from cad_ai.llm.plan import (
+    _run_details,
+    generate_planned,
+    merge_features,
+    needs_plan,
+    parse_plan,
+)
+
+BODY = [
+    {"action": "sketch", "plane": "XOY", "entities": []},
+    {"action": "extrude", "height": 8},
+]
+
+
+def _plane(name, offset):
+    return {
+        "action": "workplane_offset",
+        "base_plane": "XOY",
+        "offset": offset,
+        "name": name,
+    }
+
+
+def _sketch_on(name):
+    return {"action": "sketch_on_plane", "plane": name, "entities": []}
+
+
+def test_merge_drops_repeated_body_and_renames_planes():
+    base = {"name": "Plate", "steps": BODY + [_plane("P1", 8)]}
+    boss = {"steps": BODY + [_plane("P1", 20), _sketch_on("P1")]}
+    cut = {"steps": [_plane("P1", 30), _sketch_on("P1")]}
+
+    steps = merge_features([base, boss, cut])["steps"]
+    assert steps[:3] == base["steps"]
+    assert steps[3:] == [
+        _plane("P1_1", 20),
+        _sketch_on("P1_1"),
+        _plane("P1_2", 30),
+        _sketch_on("P1_2"),
+    ]
+    # the parts themselves are left alone
+    assert boss["steps"][2]["name"] == "P1"
+
+
+def test_merge_names_an_unnamed_part():
+    assert merge_features([{"steps": BODY}])["name"] == "Part"
+
+
+def test_parse_plan_puts_the_base_first():
+    text = "holes: 4 отверстия 10\nbase: пластина 120 на 80\nnote: ignored\n"
+    assert parse_plan(text) == [
+        ("base", "пластина 120 на 80"),
+        ("holes", "4 отверстия 10"),
+    ]
+
+
+def test_needs_plan_counts_distinct_features():
+    assert not needs_plan("пластина 120 на 80 с 4 отверстиями")
+    assert needs_plan("пластина с 4 отверстиями и карманом 40 на 20")
+
+
+def test_a_plan_without_features_falls_back_to_one_request():
+    eng = LocalLLMEngine("stub", backend=StubBackend())
+    text = "пластина 100 на 60 толщиной 5"
+    data = generate_planned(eng, text)
+    assert eng.last_plan["fallback"] is True
+    assert data == LocalLLMEngine("stub", backend=StubBackend()).generate_json(text)
+
+
+class _Pool:
+    """submit() futures that never finish; records cancel(job_id)."""
+
+    def __init__(self):
+        self.cancelled = []
+        self.futures = []
+
+    def submit(self, text):
+        fut = Future()
+        fut.job_id = len(self.futures)
+        self.futures.append(fut)
+        return fut.job_id, fut
+
+    def cancel(self, job_id):
+        self.cancelled.append(job_id)
+        self.futures[job_id].cancel()
+
+
+def test_cancel_frees_the_pool_jobs():
+    pool, cancel = _Pool(), threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    with pytest.raises(LLMCancelled):
+        _run_details(None, ["a", "b", "c"], pool, cancel)
+    assert pool.cancelled == [0, 1, 2]
+
+
+def test_a_failed_feature_cancels_the_others():
+    pool = _Pool()
+    threading.Timer(0.2, lambda: pool.futures[1].set_exception(KeyError("x"))).start()
+    with pytest.raises(KeyError):
+        _run_details(None, ["a", "b", "c"], pool, None)
+    assert pool.cancelled == [0, 2]
+
+
+def test_planned_request_has_one_metrics_row():
+    eng = LocalLLMEngine("stub", backend=StubBackend())
+    eng.generate_json_planned("пластина 100 на 60 толщиной 5")
+    rows = list(eng.metrics.rows)
+    assert [r.get("plan_part", False) for r in rows] == [True, False]
+    assert rows[-1]["ok"] and "plan_ms" in rows[-1]
+    assert rows[-1]["total_ms"] >= rows[0]["total_ms"]
+    assert eng.last_timings == rows[-1]
+    assert eng.metrics_summary().startswith("n=1 ")
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from cad_ai.llm.backends import StubBackend
+from cad_ai.llm.pool import LLMWorkerPool, WorkerDied, partition_cores
+from cad_ai.llm.skeleton import SkeletonCache
+
+
+def _wait_running(pool, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not pool._running:
+        assert time.monotonic() < deadline, "worker never started the job"
+        time.sleep(0.05)
+
+
+def test_n_threads_is_rejected():
+    with pytest.raises(TypeError):
+        LLMWorkerPool("stub", n_workers=1, n_threads=4)
+
+
+def test_partition_cores_per_worker():
+    cores = list(range(8))
+    assert partition_cores(2, cores) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert partition_cores(2, cores, per_worker=2) == [[0, 1], [2, 3]]
+    # more than fit: the slices shrink instead of overlapping
+    assert partition_cores(3, cores, per_worker=4) == [[0, 1], [2, 3], [4, 5]]
+
+
+def test_skeleton_writer_is_rejected():
+    with pytest.raises(TypeError):
+        LLMWorkerPool("stub", n_workers=1, skeleton_writer=True)
+
+
+def test_read_only_skeleton_cache_writes_nothing(tmp_path):
+    path = tmp_path / "skeletons.json"
+    SkeletonCache(str(path), writable=False).learn("куб 10", {"size": 10})
+    assert not path.exists()
+    SkeletonCache(str(path)).learn("куб 10", {"size": 10})
+    assert path.exists() and list(tmp_path.iterdir()) == [path]
+
+
+def test_dead_worker_fails_its_job():
+    # slow stub: the job is still running when the worker is killed
+    pool = LLMWorkerPool("stub", n_workers=1, backend=StubBackend(prefill_ms=20.0))
+    try:
+        _, fut = pool.submit("куб 10")
+        _wait_running(pool)
+        pool._procs[0].kill()
+        with pytest.raises(WorkerDied):
+            fut.result(timeout=10)
+        # no worker left: new jobs fail too instead of waiting forever
+        _, fut = pool.submit("куб 20")
+        with pytest.raises(WorkerDied):
+            fut.result(timeout=10)
+    finally:
+        pool.close()
+
+
+def test_jobs_complete():
+    with LLMWorkerPool("stub", n_workers=1, backend=StubBackend()) as pool:
+        assert pool.generate_json("куб 10")["steps"]
+
+
+def test_cancel_stops_the_running_job():
+    # ~7 s of decoding unless the job is stopped
+    pool = LLMWorkerPool("stub", n_workers=1, backend=StubBackend(decode_ms=20.0))
+    try:
+        job_id, fut = pool.submit("куб 10")
+        queued_id, queued = pool.submit("куб 20")
+        _wait_running(pool)
+        pool.cancel(job_id)
+        pool.cancel(queued_id)
+        assert fut.cancelled() and queued.cancelled()
+        # the worker is free again well before the first job would have ended
+        t0 = time.monotonic()
+        _, fut = pool.submit("куб 30")
+        while pool._running.get(0) != fut.job_id:
+            assert time.monotonic() - t0 < 5.0, "cancelled jobs kept the worker"
+            time.sleep(0.05)
+        pool.cancel(fut.job_id)
+    finally:
+        pool.close()
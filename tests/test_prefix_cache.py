@@ -0,0 +1,23 @@
+from cad_ai.llm.prefix_cache import MAGIC, PrefixCache, PrefixSnapshot
+
+
+def test_snapshot_round_trip():
+    snap = PrefixSnapshot([1, 2, 3], b"\x00\x01state")
+    back = PrefixSnapshot.from_bytes(snap.to_bytes("k"), "k")
+    assert back.tokens == [1, 2, 3] and back.state == b"\x00\x01state"
+
+
+def test_foreign_or_damaged_files_are_ignored():
+    data = PrefixSnapshot([1, 2, 3], b"state").to_bytes("k")
+    assert PrefixSnapshot.from_bytes(data, "other-model") is None
+    assert PrefixSnapshot.from_bytes(data[:-1], "k") is None
+    assert PrefixSnapshot.from_bytes(b"\x80\x04pickle", "k") is None
+    assert PrefixSnapshot.from_bytes(MAGIC + b"\xff\xff", "k") is None
+
+
+def test_disk_load_checks_tokens(tmp_path):
+    cache = PrefixCache("k", str(tmp_path))
+    path = cache._file([1, 2])
+    cache._save(path, PrefixSnapshot([1, 2], b"state"))
+    assert cache._load(path, [1, 2]).state == b"state"
+    assert cache._load(path, [1, 3]) is None
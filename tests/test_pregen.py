@@ -0,0 +1,70 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from cad_ai.llm.backends import StubBackend
+from cad_ai.llm.engine import LocalLLMEngine
+from cad_ai.ui.pregen import Pregeneration
+
+
+class _App:
+    """The app's click handling around a real engine, without Tk."""
+
+    def __init__(self):
+        self.engine = LocalLLMEngine("stub", backend=StubBackend())
+        self.executor = ThreadPoolExecutor(1)
+        self.runs = []
+        self.pregen = Pregeneration(self.submit)
+        self.base = None
+
+    def submit(self, text, edit_base):
+        self.runs.append((text, edit_base))
+        if edit_base is not None:
+            return self.executor.submit(self.engine.edit_json, text, base=edit_base)
+        return self.executor.submit(self.engine.generate_json, text)
+
+    def click(self, text, edit=False):
+        edit_base = self.base if edit else None
+        fut = self.pregen.take(text, edit_base)
+        self.pregen.clicked(edit)
+        if fut is None:
+            fut = self.submit(text, edit_base)
+        data = fut.result()
+        self.base = (text, data)
+        return data
+
+
+def test_typed_request_after_a_result_is_taken_by_generate():
+    app = _App()
+    app.click("куб 20")
+    assert app.base is not None
+
+    text = "пластина 100 на 60 толщиной 5"
+    fut = app.pregen.start(text, app.base)
+    assert app.runs[-1] == (text, None)
+    data = app.click(text)
+    assert data == fut.result()
+    # Generate ran nothing of its own
+    assert len(app.runs) == 2
+
+
+def test_after_edit_the_next_run_is_an_edit():
+    started = []
+    pregen = Pregeneration(lambda text, base: started.append(base) or Future())
+    base = ("куб 20", {"steps": []})
+    pregen.clicked(True)
+    fut = pregen.start("высота 30", base)
+    assert started == [base]
+    assert pregen.take("высота 30", None) is None and fut.cancelled()
+
+    fut = pregen.start("высота 30", base)
+    assert pregen.take("высота 30", base) is fut
+
+
+def test_stale_text_cancels_the_run():
+    pregen = Pregeneration(lambda text, base: Future())
+    fut = pregen.start("куб 20")
+    assert pregen.start("куб 20") is None
+    pregen.text_changed("куб 20")
+    assert pregen.is_current(fut)
+    pregen.text_changed("куб 2")
+    assert fut.cancelled() and not pregen.is_current(fut)
+    assert pregen.take("куб 2") is None
@@ -0,0 +1,49 @@
+import pytest
+
+from cad_ai.llm.backends import StubBackend
+from cad_ai.llm.engine import LocalLLMEngine
+from cad_ai.llm.result_cache import ResultCache, normalize_request
+from cad_ai.llm.skeleton import split_numbers
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("Куб 20 мм.", "куб  20 мм"),
+        ("пластина 8.0 на 4", "пластина 8 на 4"),
+        ("ёлка 10.00!", "елка 10"),
+    ],
+)
+def test_trivial_differences_fold(a, b):
+    assert normalize_request(a) == normalize_request(b)
+
+
+def test_commas_between_digits_are_kept():
+    assert normalize_request("точки 120,80") == "точки 120,80"
+    assert normalize_request("120,80") != normalize_request("120.80")
+    assert split_numbers("отступ 120,80")[1] == [120.0, 80.0]
+
+
+def test_cache_is_keyed_by_engine(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    ResultCache(path, "model-a").put("куб 20", {"steps": []})
+    assert ResultCache(path, "model-a").get("Куб 20.") == {"steps": []}
+    assert ResultCache(path, "model-b").get("куб 20") is None
+
+
+def test_skeleton_file_follows_result_key(tmp_path):
+    def skeleton_path(**kw):
+        eng = LocalLLMEngine(
+            "stub",
+            backend=StubBackend(),
+            cache_dir=str(tmp_path),
+            skeleton_cache=True,
+            **kw,
+        )
+        return eng._get_skeleton_cache().path
+
+    base = skeleton_path()
+    assert base.parent == tmp_path and base.name.startswith("skeletons-")
+    assert skeleton_path() == base
+    assert skeleton_path(output_format="compact") != base
+    assert skeleton_path(grammar=True) != base
@@ -0,0 +1,48 @@
+import pytest
+
+from cad_ai.llm.retrieval import (
+    FEATURES_VERSION,
+    LIBRARY_PATH,
+    ExampleIndex,
+    _features,
+    _file_hash,
+    get_index,
+    select_examples,
+)
+
+
+def test_numbers_are_not_features():
+    assert _features("уголок 50 на 50") == _features("уголок 100x60x6 на 7")
+    assert _features("блок 100х60х20") == _features("блок")
+
+
+@pytest.mark.parametrize(
+    "query, example",
+    [
+        ("уголок 50 на 50 толщиной 5", "уголок 100x60x6"),
+        ("шайба наружный 40 внутренний 20", "шайба:"),
+        ("цилиндр диаметром 12 высотой 7", "цилиндр"),
+    ],
+)
+def test_shape_word_wins_over_other_numbers(query, example):
+    (_, best), = get_index().search(query, 1)
+    assert best["text"].startswith(example)
+
+
+def test_selected_examples_follow_the_search():
+    (_, best), = get_index().search("уголок 50 на 50 толщиной 5", 1)
+    assert select_examples("уголок 50 на 50 толщиной 5", k=1) == [best["json"]]
+
+
+def test_index_of_older_features_is_rebuilt(tmp_path):
+    index = tmp_path / "index.json"
+    built = ExampleIndex.build([{"text": "куб 10", "json": {}}])
+    built.save(index, _file_hash(LIBRARY_PATH))
+    assert ExampleIndex.load(index=index).vectors == built.vectors
+    index.write_text(
+        index.read_text(encoding="utf-8").replace(
+            f'"features": {FEATURES_VERSION}', '"features": 1'
+        ),
+        encoding="utf-8",
+    )
+    assert ExampleIndex.load(index=index).vectors != built.vectors
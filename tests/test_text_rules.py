@@ -0,0 +1,69 @@
+import pytest
+
+from cad_ai.templates.text_rules import (
+    CUBE,
+    CUBE_HOLE,
+    PLATE,
+    STEPPED,
+    RuleRouter,
+    match_template,
+)
+
+
+@pytest.mark.parametrize(
+    "text, name",
+    [
+        ("куб 60", CUBE),
+        ("куб со стороной 80", CUBE),
+        ("куб 60 с отверстием 12 насквозь по центру", CUBE_HOLE),
+        ("пластина 120 на 80 толщиной 8, 4 отверстия Ø10, отступ 15", PLATE),
+        (
+            "пластина 120x80 толщиной 8 с 4 отверстиями диаметром 10 по углам, "
+            "отступ от края 15",
+            PLATE,
+        ),
+        (
+            "ступенчатый блок 120x80x20, ступень 60x40x20, карман 30x20 глубиной 10",
+            STEPPED,
+        ),
+    ],
+)
+def test_recognized(text, name):
+    found = match_template(text)
+    assert found is not None and found[0] == name
+
+
+def test_plate_params():
+    text = "пластина 120 на 80 толщиной 8, 4 отверстия Ø10, отступ 15"
+    name, p = match_template(text)
+    assert p == {"w": 120, "h": 80, "thickness": 8, "hole_d": 10, "margin": 15}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # one hole, not the template's 4 corner holes
+        "пластина 120 на 80 толщиной 8 с одним отверстием 10 в центре",
+        "пластина 120 на 80 толщиной 8, отверстие Ø10 по центру",
+        "пластина 120 на 80 толщиной 8, отверстия 10, отступ 15",
+        "пластина 120 на 80 толщиной 8, 6 отверстий 10",
+        # count in words / shape the template cannot build
+        "куб 60 с двумя отверстиями 12",
+        "куб 60 с квадратным отверстием 12",
+        # step and pocket would all come from defaults
+        "ступенчатый блок 120x80x20",
+        # numbers or features left over
+        "куб 60 с фаской 2",
+        "куб 60 высотой 30",
+        "цилиндр диаметром 40 высотой 60",
+    ],
+)
+def test_rejected(text):
+    assert match_template(text) is None
+
+
+def test_router_counts_fallbacks():
+    router = RuleRouter()
+    assert router.route("куб 60")["steps"]
+    assert router.route("куб 60 с двумя отверстиями 12") is None
+    assert (router.matched, router.fallbacks) == (1, 1)
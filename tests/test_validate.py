@@ -0,0 +1,125 @@
+import pytest
+
+from cad_ai.llm.errors import SchemaError
+from cad_ai.llm.schema import SCHEMA_VERSION
+from cad_ai.llm.validate import (
+    get_validator,
+    normalize_generated_json,
+    normalize_step,
+    validate_generated_json,
+    validate_step,
+)
+
+LINE = {"type": "line", "start": [0, 0], "end": [1, 1]}
+
+
+def _errors(data):
+    with pytest.raises(SchemaError) as e:
+        validate_generated_json(data)
+    return e.value.errors
+
+
+def test_every_error_is_collected_with_its_pointer():
+    data = {
+        "name": 3,
+        "steps": [
+            {"action": "extrude", "height": "5"},
+            {"action": "fly"},
+            7,
+            {"action": "sketch", "entities": []},
+            {
+                "action": "sketch",
+                "entities": [
+                    {"type": "arc"},
+                    {"type": "line", "start": [0, float("nan")]},
+                    "x",
+                ],
+            },
+            {"action": "extrude", "height": True, "direction": "up"},
+        ],
+    }
+    assert [p for p, _ in _errors(data)] == [
+        "/name",
+        "/steps/0/height",
+        "/steps/1/action",
+        "/steps/2",
+        "/steps/3/entities",
+        "/steps/4/entities/0/type",
+        "/steps/4/entities/1/start",
+        "/steps/4/entities/1/end",
+        "/steps/4/entities/2",
+        "/steps/5/height",
+        "/steps/5/direction",
+    ]
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        ([], ("", "JSON root must be an object")),
+        ({"steps": {}}, ("/steps", "is required and must be a list")),
+        (
+            {
+                "steps": [
+                    {"action": "workplane_offset", "base_plane": "XOY", "name": "P"}
+                ]
+            },
+            ("/steps/0/offset", "is required"),
+        ),
+        (
+            {"steps": [{"action": "extrude", "height": float("inf")}]},
+            ("/steps/0/height", "must be a finite number, got inf"),
+        ),
+    ],
+)
+def test_single_errors(data, error):
+    assert _errors(data) == [error]
+
+
+def test_error_message_is_shortened():
+    data = {"steps": [{"action": "extrude"}] * 12}
+    e = SchemaError(get_validator().errors(data))
+    assert len(e.errors) == 12
+    assert str(e).endswith("; ... 2 more")
+    assert str(e).startswith("/steps/0/height: is required; ")
+
+
+def test_normalize_writes_the_canonical_form():
+    data = {
+        "steps": [
+            {"action": " Extrude ", "height": 5, "direction": "Both"},
+            {"action": "SKETCH", "plane": "xoy", "entities": [dict(LINE, type="Line")]},
+            {"action": "sketch_on_plane", "entities": [LINE]},
+            {"action": "sketch_on_plane", "on_plane": "p1", "entities": [LINE]},
+        ]
+    }
+    assert normalize_generated_json(data) is data
+    assert data["steps"] == [
+        {"action": "extrude", "height": 5, "direction": "both"},
+        {"action": "sketch", "plane": "XOY", "entities": [LINE]},
+        {"action": "sketch_on_plane", "entities": [LINE], "plane": "XOY"},
+        {"action": "sketch_on_plane", "on_plane": "p1", "entities": [LINE]},
+    ]
+
+
+def test_validation_alone_changes_nothing():
+    step = {"action": "EXTRUDE", "height": 5, "direction": "Both"}
+    validate_step(dict(step), 0)
+    data = {"steps": [dict(step)]}
+    validate_generated_json(data)
+    assert data["steps"][0] == step
+
+
+def test_step_errors_use_the_step_index():
+    with pytest.raises(SchemaError) as e:
+        validate_step({"action": "cut", "depth": "3"}, 4)
+    assert e.value.errors == [("/steps/4/depth", "must be a finite number, got '3'")]
+    step = {"action": "Cut", "direction": "NORMAL"}
+    normalize_step(step)
+    assert step == {"action": "cut", "direction": "normal"}
+
+
+def test_validator_is_built_once_per_schema_version():
+    assert get_validator() is get_validator(SCHEMA_VERSION)
+    with pytest.raises(ValueError):
+        get_validator("0")